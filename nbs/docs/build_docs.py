@@ -1,7 +1,28 @@
 import os
+import sys
 import pandas as pd
-import plotly.plotly as py
-from IPython.core.display import HTML, display, Markdown, Latex
+
+# the cube is read and rolled up the way py/cube.py writes it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'py'))
+from cube import build_cube, cardinalities, read_cube, rollup
+from config import cube_dims
+
+# Each section is built as a list of blocks (Markdown strings and DataFrames)
+# that the notebook displays and `render_docs.py` writes to static files, so
+# IPython and plotly are only imported when something is displayed.
+
+# which year the spec sheet documents, set the same way as the build's
+# (LOCAL_NEWS_YEAR / LOCAL_NEWS_DATA_ROOT, see py/config.py). The published sheet is 2018's.
+year = int(os.environ.get('LOCAL_NEWS_YEAR', 2018))
+data_root = os.environ.get('LOCAL_NEWS_DATA_ROOT', '../')
+year_dir = 'data' if year == 2018 else f'data_{year}'
+dataset_name = f'local_news_dataset_{year}'
+
+def data_file(filename):
+    return os.path.join(data_root, year_dir, filename)
+
+def data_url(filename):
+    return f'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/{year_dir}/{filename}'
 
 # common column definitions
 website = 'The website of the media outlet exactly as we found it online.'
@@ -32,8 +53,8 @@ hearst_docs = {
         'source' : source, 
         'collection_date' : collection_date, 
     },
-    "file" : '../data/hearst.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/hearst.tsv',
+    "file" : data_file('hearst.tsv'),
+    "url" : data_url('hearst.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py',
     "description" : 'An intermediate file of news outlets owned by Hearst scraped from their website'
 }
@@ -52,8 +73,8 @@ meredith_docs = {
         'source' : source, 
         'collection_date' : collection_date,
     },
-    "file" : '../data/meredith.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/meredith.tsv',
+    "file" : data_file('meredith.tsv'),
+    "url" : data_url('meredith.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py',
     "description" : 'An intermediate file of news outlets owned by Meredith scraped from their website'
 }
@@ -68,8 +89,8 @@ nexstar_docs = {
         'source' : source,
         'collection_date' : collection_date
     },
-    "file" : '../data/nexstar.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/nexstar.tsv',
+    "file" : data_file('nexstar.tsv'),
+    "url" : data_url('nexstar.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py',
     "description" : 'An intermediate file of news outlets owned by Nexstar scraped from their website'
 }
@@ -86,8 +107,8 @@ sinclair_docs = {
         'source' : source, 
         'collection_date' : collection_date, 
     },
-    "file" : '../data/sinclair.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/sinclair.tsv',
+    "file" : data_file('sinclair.tsv'),
+    "url" : data_url('sinclair.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py',
     "description" : 'An intermediate file of news outlets owned by Sinclair scraped from their website'
 }
@@ -106,8 +127,8 @@ tribune_docs = {
         'state' : state, 
         'collection_date' : collection_date ,
     },
-    "file" : '../data/tribune.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/tribune.tsv',
+    "file" : data_file('tribune.tsv'),
+    "url" : data_url('tribune.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py#L21-L86',
     "description" : 'An intermediate file of news outlets owned by Tribune scraped from their website.'
 }
@@ -126,8 +147,8 @@ station_index_docs = {
         'source' : source, 
         'collection_date' : collection_date, 
     },
-    "file" : '../data/station_index.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/station_index.tsv',
+    "file" : data_file('station_index.tsv'),
+    "url" : data_url('station_index.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py',
     "description" : 'An intermediate file of TV stations compiled on stationindex.com. The website is scraped according to the market (reigon), and again according to the owner. The two scraped datasets are merged and duplicates are dropped. When dropping duplicates, precedence is given to the entry scraped owners.'
     
@@ -145,8 +166,8 @@ usnpl_docs = {
         'source' : source, 
         'collection_date' : collection_date
     },
-    "file" : '../data/usnpl.tsv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/usnpl.tsv',
+    "file" : data_file('usnpl.tsv'),
+    "url" : data_url('usnpl.tsv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/download_data.py',
     "description" : 'An intermediate file of News papers, magazines and college papers compiled by usnpl.com. The website is scraped by visiting state-specific pages using requests and BeautifulSoup, websites and social media are collected wherever possible.'
 }
@@ -165,15 +186,16 @@ output_docs = {
         'source' : source, 
         'collection_date' : collection_date,
     },
-    "file" : '../data/local_news_dataset_2018.csv',
-    "url" : 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/data/local_news_dataset_2018.csv',
+    "file" : data_file(f'{dataset_name}.csv'),
+    "url" : data_url(f'{dataset_name}.csv'),
     "script" : 'https://github.com/yinleon/LocalNewsDataset/blob/master/py/merge.py',
     "description" : 'The intermediate files above are preprocessed (renaming columns, removing duplicates) and merged resulting in the Local News Dataset! This is it! We made it!',
     "sep" : ','
 }
 
 # this is the order that the data spec section will be generated
-docs = [
+# (sources that weren't scraped in `year` are left out)
+docs = [doc_dict for doc_dict in [
     sinclair_docs,
     meredith_docs,
     nexstar_docs,
@@ -181,7 +203,7 @@ docs = [
     tribune_docs,
     station_index_docs,
     usnpl_docs,
-]
+] if os.path.exists(doc_dict['file'])]
 
 table_header = '''| Column Name | Description | N Unique Values |
 | --- | --- | --- |'''
@@ -189,70 +211,111 @@ table_header = '''| Column Name | Description | N Unique Values |
 intro_markdown = '''## Inventory
 '''
 
-end_of_table_of_contents = '''
+end_of_table_of_contents = f'''
     
 ### Outputs
-- [local_news_dataset_2018.csv](#local_news_dataset_2018)'''
+- [{dataset_name}.csv](#{dataset_name})'''
 
-def generate_docs_for_dataset(doc_dict, return_to_top=True):
+_cubes = {}
+
+def load_cube(doc_dict=output_docs):
+    '''
+    The aggregate cube merge.py writes next to the dataset: outlet counts by
+    state, medium, owner and source, and each column's number of unique values.
+    If it isn't there, or was built from another version of the dataset, it is
+    built from the dataset, once.
+    '''
+    filepath = doc_dict['file']
+    if filepath in _cubes:
+        return _cubes[filepath]
+    
+    cube_file = filepath.replace('.csv', '_cube.json')
+    try:
+        cube = read_cube(cube_file)
+    except (FileNotFoundError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(e)
+        df = pd.read_csv(filepath, sep=doc_dict.get('sep', '\t'))
+        dims = [c for c in cube_dims if c in df.columns]
+        cube = dict(rows=len(df), dims=dims, cardinality=cardinalities(df), counts=build_cube(df, dims))
+    _cubes[filepath] = cube
+    return cube
+
+
+def dataset_blocks(doc_dict, return_to_top=True):
     '''
     Given a dictionary, this properly formats the documentation!
     '''
     # Introduction
     filename = os.path.basename(doc_dict['file'])
-    display(Markdown(f"## <a name='{filename.split('.')[0]}'>{filename}</a>"))
-    display(Markdown(doc_dict['description']))
-    display(Markdown(f"Read the raw file from this [URL]({doc_dict['url']}): <br> `{doc_dict['url']}`\n"))
-    display(Markdown(f"See the [code]({doc_dict['script']}) used to make this dataset: <br> `{doc_dict['script']}`\n"))
-    display(Markdown(''))
+    blocks = [
+        f"## <a name='{filename.split('.')[0]}'>{filename}</a>",
+        doc_dict['description'],
+        f"Read the raw file from this [URL]({doc_dict['url']}): <br> `{doc_dict['url']}`\n",
+        f"See the [code]({doc_dict['script']}) used to make this dataset: <br> `{doc_dict['script']}`\n",
+        '',
+    ]
 
-    
     # sample of the data
-    display(Markdown("#### What Does the Data Look Like?"))
+    blocks.append("#### What Does the Data Look Like?")
     df = pd.read_csv(doc_dict['file'], sep=doc_dict.get('sep', '\t'))
-    display(Markdown(f"Sample of `{doc_dict['file']}` (N = {len(df)})"))
-    display(df.sample(3, random_state=303).reset_index(drop=True))
-    display(Markdown(''))
+    blocks.append(f"Sample of `{doc_dict['file']}` (N = {len(df)})")
+    blocks.append(df.sample(3, random_state=303).reset_index(drop=True))
+    blocks.append('')
 
-    
-    # columns
+    # columns, the output's unique counts come from its cube
+    n_unique = load_cube(doc_dict)['cardinality'] if doc_dict is output_docs else df.nunique(dropna=False)
     doc_string = ''
     doc_string = "#### What do the columns mean?" + '\n'
     doc_string += table_header + '\n'
     for k, v in doc_dict.get('columns').items():
-        doc_string += f"| <b>{k}</b> | {v} | {len(df[k].unique())} |" + '\n'
-    display(Markdown(doc_string))
-    display(Markdown(''))
+        doc_string += f"| <b>{k}</b> | {v} | {n_unique.get(k, '')} |" + '\n'
+    blocks.append(doc_string)
+    blocks.append('')
     
     # link to top of spec sheet
     if return_to_top:
-        display(Markdown('[Top of Spec Sheet](#specs)'))
-    display(Markdown(''))
+        blocks.append('[Top of Spec Sheet](#specs)')
+    blocks.append('')
+    return blocks
+
+
+def show(blocks):
+    '''Displays blocks in the notebook.'''
+    from IPython.display import display, Markdown
+    for block in blocks:
+        display(Markdown(block) if isinstance(block, str) else block)
+
+
+def generate_docs_for_dataset(doc_dict, return_to_top=True):
+    show(dataset_blocks(doc_dict, return_to_top))
   
 
-def generate_intro():
+def intro_blocks():
     '''
     Markdown for the Introduction of the Data Specs section
     '''
-    display(Markdown(intro_markdown))
     table_of_contents = '### Intermediates \n'
     for dataset in docs:
         filename = os.path.basename(dataset['file']).split('.')[0]
         table_of_contents += f" - [{filename}.tsv](#{filename})\n"
     table_of_contents += end_of_table_of_contents
-    display(Markdown(table_of_contents))    
-    display(Markdown('<hr>'))
+    return [intro_markdown, table_of_contents, '<hr>']
+
+
+def generate_intro():
+    show(intro_blocks())
         
 
-def chloropleth():
+chloropleth_markdown = 'Below is an interactive [Plot.ly](https://plot.ly) chloropleth map of state-level representation in this dataset. Scroll over each state to get a counts (num stations) of the top mediums and owners.'
+
+def chloropleth_figure():
     '''
-    Wrangles data and plots it in a plotly chloropleth map
+    Wrangles data into a plotly chloropleth map
     based off this code:
     https://plot.ly/pandas/choropleth-maps/
     '''
-    display(Markdown('Below is an interactive [Plot.ly](https://plot.ly) chloropleth map of state-level representation in this dataset. Scroll over each state to get a counts (num stations) of the top mediums and owners.'))
-    
-    df = pd.read_csv(output_docs['file'])
+    cube = load_cube()
     
     scl = [# Let first 10% (0.1) of the values have color rgb(0, 0, 0)
         [0, 'rgb(180, 180, 180)'],
@@ -285,19 +348,21 @@ def chloropleth():
         [1.0, 'rgb(0, 0, 0)']]
     
     # wrangle the dataset
-    vals = df.state.value_counts()
+    vals = rollup(cube, 'state')
     states =vals.index
     counts = vals.values
+    mediums = {state : calc.droplevel(0) for state, calc in rollup(cube, ['state', 'medium']).groupby(level=0, sort=False)}
+    owners = {state : calc.droplevel(0) for state, calc in rollup(cube, ['state', 'owner']).groupby(level=0, sort=False)}
     
     # set up annotations
     text = []
     for state in states:
-        calc = df[df['state'] == state]['medium'].value_counts()
+        calc = mediums.get(state, pd.Series(dtype=int))
         desc = '<b>Breakdown by Medium:</b><br>'
         for k,v in calc.items():
             desc += f'{k} = {v}<br>'
         
-        calc = df[df['state'] == state]['owner'].value_counts().head(5)
+        calc = owners.get(state, pd.Series(dtype=int)).head(5)
         desc += '<b>Top 5 Media Owners:</b><br>'
         for k,v in calc.items():
             desc += f'{k} = {v}<br>'
@@ -332,20 +397,31 @@ def chloropleth():
                 )
 
     fig = dict( data=data, layout=layout )
-    display(py.iplot(fig, filename='local-news-dataset' ))
+    return fig
+
+
+def chloropleth():
+    import plotly.plotly as py
+    from IPython.display import display
+    show([chloropleth_markdown])
+    display(py.iplot(chloropleth_figure(), filename='local-news-dataset' ))
  
 
+def summary_blocks():
+    cube = load_cube()
+    return [
+        '#### Breakdown of mediums in the Local News Dataset',
+        rollup(cube, 'medium').rename('count').to_frame(),
+        '',
+        '#### Breakdown of data sources in the Local News Dataset',
+        rollup(cube, 'source').rename('count').to_frame(),
+        'The `User Input` entires are custom additions added from the contents of [this JSON file](https://github.com/yinleon/LocalNewsDataset/blob/master/data/custom_additions.json) and added to the dataset in `merge.py`',
+        '',
+    ]
+
+
 def summary_stats():
-    df = pd.read_csv(output_docs['file'])
-        
-    display(Markdown('#### Breakdown of mediums in the Local News Dataset'))
-    display(df.medium.value_counts().to_frame())
-    display(Markdown(''))
-    
-    display(Markdown('#### Breakdown of data sources in the Local News Dataset'))
-    display(df.source.value_counts().to_frame())
-    display(Markdown('The `User Input` entires are custom additions added from the contents of [this JSON file](https://github.com/yinleon/LocalNewsDataset/blob/master/data/custom_additions.json) and added to the dataset in `merge.py`'))
-    display(Markdown(''))
+    show(summary_blocks())
 
 
 
@@ -0,0 +1,251 @@
+import os
+import re
+import sys
+import json
+import html
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+if __package__:
+    from . import build_docs
+else:
+    import build_docs
+
+'''
+Renders the data spec sheet to static Markdown and HTML, without a notebook.
+
+Run from the `nbs` directory (the doc paths are relative to it):
+
+    python -m docs.render_docs
+    python -m docs.render_docs --out docs/rendered/2018 --jobs 4 --force
+    LOCAL_NEWS_YEAR=2023 python -m docs.render_docs
+
+Every section (the intro, one per dataset, the output's summary stats and
+coverage map) is rendered in its own worker process to `<out>/<section>.md`
+and `<out>/<section>.html`, and the sections are stitched together into
+`index.md` and `index.html`. A section is only re-rendered when one of its
+source files, or the doc definitions themselves, has changed since the last
+build (hashes are kept in `<out>/manifest.json`). `<out>` defaults to
+`docs/rendered/<year>`, for the year build_docs documents.
+'''
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_digest(filepath):
+    '''sha256 of a file, or of its absence.'''
+    h = hashlib.sha256()
+    if not os.path.exists(filepath):
+        h.update(f'missing:{filepath}'.encode())
+        return h.hexdigest()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dataset_and_cube(doc_dict):
+    # the cube is only read while the dataset is the one it was built from
+    return [doc_dict['file'], doc_dict['file'].replace('.csv', '_cube.json')]
+
+
+def sections():
+    '''
+    (name, source files, listed files) for every section, in spec sheet order.
+    A section depends on the contents of its source files, and on which of the
+    listed files there are (the intro's table of contents lists the datasets).
+    '''
+    out = [('intro', [], [doc_dict['file'] for doc_dict in build_docs.docs])]
+    for doc_dict in build_docs.docs + [build_docs.output_docs]:
+        name = os.path.basename(doc_dict['file']).split('.')[0]
+        files = dataset_and_cube(doc_dict) if doc_dict is build_docs.output_docs else [doc_dict['file']]
+        out.append((name, files, []))
+    out.append(('summary', dataset_and_cube(build_docs.output_docs), []))
+    out.append(('coverage', dataset_and_cube(build_docs.output_docs), []))
+    return out
+
+
+def section_digest(files, listed=()):
+    '''Changes when a source file or the doc definitions change, or when the listed files do.'''
+    h = hashlib.sha256()
+    for filepath in [os.path.join(here, 'build_docs.py'), os.path.abspath(__file__)] + files:
+        h.update(file_digest(filepath).encode())
+    h.update('\n'.join(os.path.basename(f) for f in listed).encode())
+    return h.hexdigest()
+
+
+def section_blocks(name):
+    if name == 'intro':
+        return build_docs.intro_blocks()
+    if name == 'summary':
+        return build_docs.summary_blocks()
+    if name == 'coverage':
+        return coverage_blocks()
+    for doc_dict in build_docs.docs + [build_docs.output_docs]:
+        if os.path.basename(doc_dict['file']).split('.')[0] == name:
+            return build_docs.dataset_blocks(doc_dict, return_to_top=doc_dict is not build_docs.output_docs)
+    raise KeyError(name)
+
+
+def coverage_blocks():
+    '''The choropleth as a standalone plotly div if plotly is installed, a table of state counts if not.'''
+    figure = build_docs.chloropleth_figure()
+    try:
+        import plotly.offline
+    except ImportError:
+        trace = figure['data'][0]
+        counts = pd.Series(list(trace['z']), index=list(trace['locations']), name='outlets')
+        return ['#### Outlets per state', counts.rename_axis('state').to_frame()]
+    div = plotly.offline.plot(figure, include_plotlyjs='cdn', output_type='div')
+    return [build_docs.chloropleth_markdown, div]
+
+
+def frame_markdown(df):
+    '''A DataFrame as a Markdown pipe table.'''
+    df = df.reset_index() if df.index.name or not isinstance(df.index, pd.RangeIndex) else df
+    cell = lambda v: '' if pd.isna(v) else str(v).replace('|', '\\|').replace('\n', ' ')
+    lines = ['| ' + ' | '.join(map(str, df.columns)) + ' |',
+             '| ' + ' | '.join('---' for _ in df.columns) + ' |']
+    lines += ['| ' + ' | '.join(cell(v) for v in row) + ' |' for row in df.itertuples(index=False)]
+    return '\n'.join(lines)
+
+
+def inline_html(text):
+    '''Links and code spans. Raw HTML in the docs (<br>, <b>, anchors) is passed through.'''
+    parts = re.split(r'(`[^`]*`)', text)
+    for i, part in enumerate(parts):
+        if part.startswith('`') and part.endswith('`') and len(part) > 1:
+            parts[i] = f'<code>{html.escape(part[1:-1])}</code>'
+        else:
+            parts[i] = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', part)
+    return ''.join(parts)
+
+
+def markdown_html(text):
+    '''
+    Just enough Markdown for the spec sheet: headings, pipe tables, lists and
+    paragraphs.
+    '''
+    out, table, items = [], [], []
+
+    def flush():
+        if table:
+            rows = [[c.strip() for c in line.strip().strip('|').split('|')] for line in table
+                    if not re.match(r'^\|?\s*-{3}', line.strip())]
+            head, body = rows[0], rows[1:]
+            out.append('<table><thead><tr>' + ''.join(f'<th>{inline_html(c)}</th>' for c in head) + '</tr></thead><tbody>'
+                       + ''.join('<tr>' + ''.join(f'<td>{inline_html(c)}</td>' for c in r) + '</tr>' for r in body)
+                       + '</tbody></table>')
+            table.clear()
+        if items:
+            out.append('<ul>' + ''.join(f'<li>{inline_html(i)}</li>' for i in items) + '</ul>')
+            items.clear()
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('|'):
+            table.append(stripped)
+            continue
+        if stripped.startswith('- '):
+            items.append(stripped[2:])
+            continue
+        flush()
+        heading = re.match(r'^(#{1,6})\s+(.*)$', stripped)
+        if heading:
+            level = len(heading.group(1))
+            out.append(f'<h{level}>{inline_html(heading.group(2))}</h{level}>')
+        elif stripped.startswith('<'):
+            out.append(stripped)
+        elif stripped:
+            out.append(f'<p>{inline_html(stripped)}</p>')
+    flush()
+    return '\n'.join(out)
+
+
+def render_section(name, out_dir):
+    '''Renders one section to Markdown and HTML. Runs in a worker process.'''
+    blocks = section_blocks(name)
+    md, body = [], []
+    for block in blocks:
+        if isinstance(block, str):
+            md.append(block)
+            body.append(markdown_html(block))
+        else:
+            md.append(frame_markdown(block))
+            body.append(block.to_html(index=False, na_rep='', border=0, classes='sample'))
+
+    with open(os.path.join(out_dir, f'{name}.md'), 'w') as f:
+        f.write('\n\n'.join(md) + '\n')
+    with open(os.path.join(out_dir, f'{name}.html'), 'w') as f:
+        f.write('\n'.join(body) + '\n')
+    return name
+
+
+def assemble(out_dir, names):
+    '''Stitches the rendered sections into index.md and index.html.'''
+    def read(name, ext):
+        filepath = os.path.join(out_dir, f'{name}.{ext}')
+        if not os.path.exists(filepath):
+            return ''
+        with open(filepath) as f:
+            return f.read()
+
+    with open(os.path.join(out_dir, 'index.md'), 'w') as f:
+        f.write("<a name='specs'></a>\n\n" + '\n\n'.join(read(n, 'md') for n in names))
+    with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+        f.write("<!doctype html>\n<html><head><meta charset='utf-8'><title>Local News Dataset spec sheet</title></head>\n"
+                "<body><a name='specs'></a>\n" + '\n'.join(read(n, 'html') for n in names) + '</body></html>\n')
+
+
+def render(out_dir, jobs=None, force=False):
+    '''Renders the sections that changed. Returns {section: 'rendered' | 'unchanged' | error}.'''
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_file = os.path.join(out_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    todo, status = {}, {}
+    all_sections = sections()
+    for name, files, listed in all_sections:
+        digest = section_digest(files, listed)
+        up_to_date = (manifest.get(name) == digest
+                      and os.path.exists(os.path.join(out_dir, f'{name}.md')))
+        if up_to_date and not force:
+            status[name] = 'unchanged'
+        else:
+            todo[name] = digest
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {name : pool.submit(render_section, name, out_dir) for name in todo}
+        for name, future in futures.items():
+            try:
+                future.result()
+                manifest[name] = todo[name]
+                status[name] = 'rendered'
+            except Exception as e:
+                manifest.pop(name, None)
+                status[name] = f'failed: {type(e).__name__}: {e}'
+
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    assemble(out_dir, [name for name, _, _ in all_sections])
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render the data spec sheet to static Markdown and HTML.')
+    parser.add_argument('--out', default=os.path.join('docs', 'rendered', str(build_docs.year)))
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='re-render every section')
+    args = parser.parse_args()
+
+    status = render(args.out, args.jobs, args.force)
+    for name, s in status.items():
+        print(f'{name:>40}  {s}')
+    if any(s.startswith('failed') for s in status.values()):
+        sys.exit(1)
@@ -0,0 +1,75 @@
+import pandas as pd
+
+from config import *
+
+'''
+Vectorized explode/alignment for cells that hold several values.
+
+Corporate station lists often squeeze several stations (and sometimes several
+websites) into one table cell: `KARK KARZ` with `kark.com`, or `KRQE KBIM KREZ
+KWBQ KASY KRWB` with `krqe.com kwbq.com`. stationindex does the same with
+subchannels (`2.1 WCBS/CBS, 2.2 Start TV`). Everything here works on whole
+columns with split -> explode, without a Python object per row.
+'''
+
+
+def split_cells(s, sep=None):
+    '''Splits each cell into a list (on whitespace by default), NA becomes [].'''
+    lists = s.astype('string').str.split(sep)
+    return lists.where(lists.notna(), pd.Series([[]] * len(s), index=s.index))
+
+
+def align_stations(df, station_col='station', website_col='website', lookup=nexstar_alignment):
+    '''
+    Returns one row per station from a frame whose cells may hold many.
+
+    - one station: the row is kept as is
+    - many stations, at most one website: the website applies to every station
+    - as many stations as websites: they are zipped up positionally
+    - anything else: each website is looked up in `lookup` ({website: [stations]})
+
+    Rows keep their original order, with exploded rows in place of their parent.
+    '''
+    stations = split_cells(df[station_col])
+    websites = split_cells(df[website_col])
+    n_stations = stations.str.len()
+    n_websites = websites.str.len()
+
+    single = n_stations <= 1
+    shared = ~single & (n_websites <= 1)
+    zipped = ~single & (n_stations == n_websites)
+    mapped = ~(single | shared | zipped)
+
+    parts = [df[single]]
+
+    parts.append(df[shared].assign(**{station_col : stations[shared]})
+                           .explode(station_col))
+
+    parts.append(df[zipped].assign(**{station_col : stations[zipped], website_col : websites[zipped]})
+                           .explode([station_col, website_col]))
+
+    df_mapped = (df[mapped].assign(**{website_col : websites[mapped]})
+                           .explode(website_col))
+    found = df_mapped[website_col].map(lookup)
+    for website in df_mapped.loc[found.isna(), website_col].unique():
+        print(f"{website} is an edge case that needs to be updated on `nexstar_alignment`")
+    parts.append(df_mapped.assign(**{station_col : found})
+                          [found.notna()]
+                          .explode(station_col))
+
+    return pd.concat(parts).sort_index(kind='stable').reset_index(drop=True)
+
+
+def explode_subchannels(df, col='subchannels', station_col='station'):
+    '''
+    A tidy frame with one row per stationindex subchannel:
+    station, channel (`2.1`), name (`WCBS/CBS`) and network (`CBS`, when given).
+    '''
+    df_sub = (df[[station_col]].assign(subchannel=split_cells(df[col], ','))
+                               .explode('subchannel')
+                               .dropna(subset=['subchannel']))
+    parts = df_sub['subchannel'].str.strip().str.extract(r'^(?P<channel>\d+\.\d+)\s+(?P<name>.*)$')
+    df_sub = pd.concat([df_sub[[station_col]], parts], axis=1).dropna(subset=['channel'])
+    df_sub['network'] = df_sub['name'].str.extract(r'/\s*([^/]+)$', expand=False)
+
+    return df_sub.reset_index(drop=True)
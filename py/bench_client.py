@@ -0,0 +1,62 @@
+import os
+import time
+import argparse
+import tempfile
+
+import pandas as pd
+
+from config import *
+from client import load_local_news, storage_format
+
+'''
+Times client.py against reading the whole CSV, which is what every job did
+before (`pd.read_csv(url)`, minus the download).
+
+The dataset is repeated up to `--rows` rows in a scratch CSV, loaded once to
+fill a scratch cache, then every load is timed warm: everything, a few
+columns, and a few columns of a few states, with and without memory-mapping.
+
+    python bench_client.py --rows 1000000
+'''
+
+
+def bench(source, year, filters, columns, repeat):
+    cache_dir = tempfile.mkdtemp(prefix='localnews-client-')
+    start = time.perf_counter()
+    load_local_news(year, source=source, cache_dir=cache_dir)
+    results = [dict(load='first load (builds the cache)', rows=None, ms=(time.perf_counter() - start) * 1000)]
+
+    cases = [
+        ('read_csv, then filter', None),
+        ('everything', dict()),
+        ('columns', dict(columns=columns)),
+        ('columns + states', dict(columns=columns, filters=filters)),
+        ('columns + states, memory-mapped', dict(columns=columns, filters=filters, memory_map=True)),
+    ]
+    for name, kwargs in cases:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            if kwargs is None:
+                df = pd.read_csv(source)
+                df = df[df['state'].str.strip().isin(filters['state'])][columns]
+            else:
+                df = load_local_news(year, source=source, cache_dir=cache_dir, **kwargs)
+        results.append(dict(load=name, rows=len(df), ms=(time.perf_counter() - start) * 1000 / repeat))
+    return pd.DataFrame(results).round(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the cached dataset client.')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--states', nargs='+', default=['NY', 'NJ', 'CT'])
+    parser.add_argument('--columns', nargs='+', default=['name', 'website', 'owner'])
+    args = parser.parse_args()
+
+    df = pd.read_csv(local_news_dataset_file)
+    df = pd.concat([df] * (args.rows // len(df) + 1), ignore_index=True).head(args.rows)
+    source = os.path.join(tempfile.mkdtemp(prefix='localnews-source-'), os.path.basename(local_news_dataset_file))
+    df.to_csv(source, index=False)
+
+    print(f'{len(df)} rows, cached as {storage_format()}')
+    print(bench(source, year, {'state' : args.states}, args.columns, args.repeat).to_string(index=False))
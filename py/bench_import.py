@@ -0,0 +1,74 @@
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+'''
+Import-time benchmark for the entry points.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for
+each module and reports the total import time and the heaviest packages it
+imports directly, so a stray module-level `import selenium` shows up here
+before it shows up as a slow CLI.
+
+    python bench_import.py
+    python bench_import.py --budget-ms 400   # exits non-zero over budget
+'''
+
+entry_points = ['localnews', 'download_data', 'merge', 'serve', 'snapshots']
+
+# packages that no entry point should import at module load
+heavy = ['selenium', 'django', 'urlexpander', 'bs4', 'tqdm', 'requests']
+
+
+def import_time(module, repeat=3):
+    '''
+    Returns (best total microseconds, {direct import: cumulative microseconds},
+    every package imported) over `repeat` fresh interpreters.
+    '''
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              capture_output=True, text=True, check=True)
+        # children are printed before their parent, one indent level deeper
+        children, seen, total = {}, set(), None
+        for line in proc.stderr.splitlines():
+            m = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+            if not m:
+                continue
+            cumulative, depth, name = int(m.group(2)), len(m.group(3)), m.group(4)
+            seen.add(name.split('.')[0])
+            if depth == 1 and name == module:
+                total = cumulative
+                break
+            if depth == 1:
+                children = {}
+            elif depth == 3:
+                children[name] = cumulative
+        if best is None or total < best[0]:
+            best = (total, children, seen)
+
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure import time of the entry points.')
+    parser.add_argument('--modules', nargs='+', default=entry_points)
+    parser.add_argument('--budget-ms', type=float, help='fail if `localnews` takes longer than this to import')
+    parser.add_argument('--top', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        total, children, seen = import_time(module)
+        top = sorted(children.items(), key=lambda kv: -kv[1])
+        results[module] = dict(
+            ms = round(total / 1000, 1),
+            heaviest = {k : round(v / 1000, 1) for k, v in top[:args.top]},
+            heavy_imports = [k for k in heavy if k in seen],
+        )
+    print(json.dumps(results, indent=2))
+
+    if args.budget_ms and results.get('localnews', {}).get('ms', 0) > args.budget_ms:
+        sys.exit(f"localnews imports in {results['localnews']['ms']} ms, over the {args.budget_ms} ms budget")
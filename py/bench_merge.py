@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import pandas as pd
+
+from config import *
+from synthetic import write_dataset
+
+'''
+Scaling benchmark for merge.py on synthetic intermediates (see synthetic.py).
+
+For each size a full set of intermediates is generated in a scratch data root
+laid out like the repo (`<tmp>/data_2023`, `<tmp>/py`), and the merge runs in a
+fresh interpreter from `<tmp>/py` with `LOCAL_NEWS_DATA_ROOT` pointing at it,
+so every path in config, caches included, resolves to the scratch copy and
+nothing real is touched. Stage timings and peak memory come
+from the merge's own spans (`LOCAL_NEWS_TRACK_MEMORY=1`, see metrics.py), so
+the numbers match what a real build reports.
+
+Each run appends a line per stage to `bench_merge.jsonl` in `metrics_dir`,
+so the scaling curves can be followed from one commit to the next.
+
+    python bench_merge.py --rows 10000 100000 1000000
+    python bench_merge.py --rows 10000000 --max-memory-gb 16 --timeout 3600
+'''
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# runs the merge and writes the spans even if a stage blows up
+driver = '''
+import metrics, merge
+try:
+    merge.merge_tv_and_media()
+finally:
+    metrics.write_report('bench_merge')
+'''
+
+results_file = os.path.join(metrics_dir, 'bench_merge.jsonl')
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=here).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def limit_memory(gb):
+    def preexec():
+        import resource
+        limit = int(gb * 1024 ** 3)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    return preexec
+
+
+def bench_merge(rows, seed=303, max_memory_gb=None, timeout=None):
+    '''
+    Generates `rows` synthetic rows and merges them. Returns one dict per
+    merge stage, with its seconds, peak RSS and rows out.
+    '''
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch_data = year_data_dir(year, tmp)
+        scratch_py = os.path.join(tmp, 'py')
+        os.makedirs(scratch_py)
+
+        start = time.perf_counter()
+        sizes = write_dataset(scratch_data, rows, seed)
+        for filepath in [gazetteer_file, places_file]:
+            if os.path.exists(filepath):
+                dest = os.path.join(tmp, os.path.relpath(filepath, data_root))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                shutil.copy(filepath, dest)
+        generate_seconds = time.perf_counter() - start
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([here, os.environ.get('PYTHONPATH', '')]),
+                   LOCAL_NEWS_TRACK_MEMORY='1', LOCAL_NEWS_DATA_ROOT=tmp, LOCAL_NEWS_YEAR=str(year))
+        start = time.perf_counter()
+        error = None
+        try:
+            proc = subprocess.run([sys.executable, '-c', driver], cwd=scratch_py, env=env,
+                                  capture_output=True, text=True, timeout=timeout,
+                                  preexec_fn=limit_memory(max_memory_gb) if max_memory_gb else None)
+            if proc.returncode:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f'exit {proc.returncode}'
+        except subprocess.TimeoutExpired:
+            error = f'timed out after {timeout}s'
+        total_seconds = time.perf_counter() - start
+
+        reports = sorted(glob.glob(os.path.join(scratch_data, 'metrics', 'bench_merge_*.json')))
+        spans = json.load(open(reports[-1]))['spans'] if reports else []
+
+    stages = []
+    for s in spans:
+        if s['name'] != 'merge':
+            continue
+        stages.append(dict(
+            stage = s['labels'].get('stage'),
+            seconds = round(s['seconds'], 3),
+            peak_rss_mb = s['attrs'].get('peak_rss_mb'),
+            rows = s['attrs'].get('rows'),
+            error = s.get('error'),
+        ))
+    stages.append(dict(stage='total', seconds=round(total_seconds, 3), error=error,
+                       peak_rss_mb=max([s['peak_rss_mb'] or 0 for s in stages], default=None)))
+
+    for s in stages:
+        s.update(rows_in=sum(sizes.values()), generate_seconds=round(generate_seconds, 2))
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark merge.py on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--seed', type=int, default=303)
+    parser.add_argument('--max-memory-gb', type=float, help='address space limit for the merge process')
+    parser.add_argument('--timeout', type=float, help='give up on a size after this many seconds')
+    parser.add_argument('--no-record', action='store_true', help=f'do not append to {results_file}')
+    args = parser.parse_args()
+
+    run_info = dict(date=datetime.datetime.now().isoformat(timespec='seconds'), revision=git_revision())
+    results = []
+    for rows in args.rows:
+        stages = bench_merge(rows, args.seed, args.max_memory_gb, args.timeout)
+        results.extend(dict(run_info, **s) for s in stages)
+        if stages[-1]['error']:
+            print(f"{rows} rows failed: {stages[-1]['error']}")
+
+    if not args.no_record:
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(results_file, 'a') as f:
+            for r in results:
+                f.write(json.dumps(r) + '\n')
+
+    df = pd.DataFrame(results)
+    print(df.pivot_table(index='stage', columns='rows_in', values=['seconds', 'peak_rss_mb'], sort=False).to_string())
@@ -0,0 +1,145 @@
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import *
+from metrics import run
+from synthetic import pick, with_missing, places, paper_titles, slugs
+from neardup import (near_duplicates, shingles, minhash, features, candidate_pairs, score_pairs,
+                     match_threshold)
+
+'''
+Scaling and accuracy benchmark for neardup.py.
+
+Synthetic newspapers (see synthetic.py, with a made-up word in every name so
+that two originals are never the same paper) get `--dupes` of their rows
+listed again the way usnpl and the custom lists repeat papers: under another
+city, with `The`, dashes, case or a typo changed in the name, another spelling
+of the website, and the handles only sometimes. The benchmark times each
+stage and reports
+
+- recall: the share of repeated listings put in the same cluster as their original
+- precision: the share of merged rows merged into their own paper
+- LSH recall (`--exhaustive` rows): the share of the pairs an all-pairs
+  comparison matches that the LSH candidates find too
+
+    python bench_neardup.py --rows 10000 100000 1000000
+'''
+
+syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'ze', 'bo', 'da', 'fe', 'gu', 'ho', 'ji', 'pe']
+
+
+def made_up_words(n, rng):
+    '''A different pronounceable word for each of `n` rows.'''
+    digits = np.arange(n)
+    parts = []
+    while True:
+        parts.append(np.asarray(syllables, dtype=object)[digits % len(syllables)])
+        digits = digits // len(syllables)
+        if not digits.any():
+            break
+    return pd.Series([''.join(p).capitalize() for p in zip(*parts)])
+
+
+def originals(n, rng):
+    city, state = places(rng, n)
+    name = made_up_words(n, rng) + ' ' + city + ' ' + pick(rng, paper_titles, n)
+    handle = slugs(name)
+    return pd.DataFrame({
+        'name' : name,
+        'city' : city,
+        'state' : state,
+        'website' : pick(rng, ['http://www.', 'https://www.', 'http://'], n) + handle + '.com',
+        'twitter' : with_missing(rng, handle, .37),
+        'facebook' : with_missing(rng, 'https://www.facebook.com/' + handle, .11),
+        'paper' : np.arange(n),
+    })
+
+
+def typo(names, rng):
+    '''Replaces one letter of each name.'''
+    out = []
+    for name, at, letter in zip(names, rng.integers(0, 1 << 30, len(names)), pick(rng, list('aeiourst'), len(names))):
+        i = at % len(name)
+        out.append(name[:i] + letter + name[i + 1:])
+    return pd.Series(out, index=names.index)
+
+
+def repeat_listings(df, share, rng):
+    '''Lists `share` of the papers again, spelled differently.'''
+    dup = df.sample(frac=share, random_state=rng).reset_index(drop=True)
+    n = len(dup)
+    name = dup['name']
+    name = name.mask(rng.random(n) < .3, 'The ' + name)
+    name = name.mask(rng.random(n) < .3, name.str.replace(' ', '-', n=1))
+    name = name.mask(rng.random(n) < .2, name.str.upper())
+    name = name.mask(rng.random(n) < .3, typo(name, rng))
+    site = dup['website'].str.replace(r'^(?:https?://)?(?:www\.)?', '', regex=True)
+    website = pd.Series(pick(rng, ['https://', 'http://www.', 'www.', ''], n)) + site + pick(rng, ['', '/'], n)
+    city, _ = places(rng, n)
+    return dup.assign(name=name, website=website.mask(rng.random(n) < .2, None), city=city,
+                      twitter=dup['twitter'].mask(rng.random(n) < .5, None),
+                      facebook=dup['facebook'].mask(rng.random(n) < .5, None))
+
+
+def accuracy(marked):
+    copies = marked['copy'].to_numpy()
+    # the paper each cluster stands for is its canonical row's
+    cluster_paper = marked.loc[marked['canonical']].set_index('cluster')['paper']
+    merged_into = marked['cluster'].map(cluster_paper).to_numpy()
+    merged = ~marked['canonical'].to_numpy()
+    original_cluster = marked[~marked['copy']].set_index('paper')['cluster']
+    found = marked.loc[copies, 'cluster'].to_numpy() == original_cluster.reindex(marked.loc[copies, 'paper']).to_numpy()
+    return dict(
+        recall = round(found.mean(), 4) if copies.any() else None,
+        precision = round((merged_into[merged] == marked['paper'].to_numpy()[merged]).mean(), 4) if merged.any() else None,
+    )
+
+
+def lsh_recall(df, threshold=match_threshold):
+    '''Share of the pairs matched by comparing every row to every other that the LSH candidates include.'''
+    codes, row = shingles(df['name'])
+    signatures = minhash(codes, row, len(df))
+    has_name = np.zeros(len(df), dtype=bool)
+    has_name[row] = True
+    feats = features(df)
+    i, j = np.triu_indices(len(df), k=1)
+    every = np.stack([i, j], axis=1)
+    matched = every[score_pairs(every, signatures, has_name, feats) >= threshold]
+    candidates = candidate_pairs(signatures, has_name, feats)
+    found = pd.MultiIndex.from_arrays(matched.T).isin(pd.MultiIndex.from_arrays(candidates.T))
+    return round(found.mean(), 4) if len(matched) else None
+
+
+def make_rows(rows, share, rng):
+    df = originals(int(rows / (1 + share)), rng)
+    df = pd.concat([df.assign(copy=False), repeat_listings(df, share, rng).assign(copy=True)], ignore_index=True)
+    return df.sample(frac=1, random_state=rng).reset_index(drop=True)
+
+
+def bench(rows, share=.1, seed=303):
+    rng = np.random.default_rng(seed)
+    df = make_rows(rows, share, rng)
+    run['spans'].clear()
+    start = time.perf_counter()
+    marked = near_duplicates(df.drop(columns=['paper', 'copy'])).assign(paper=df['paper'], copy=df['copy'])
+    seconds = time.perf_counter() - start
+    stages = {f"{s['labels']['stage']}_s" : round(s['seconds'], 2) for s in run['spans'] if s['name'] == 'near_duplicates'}
+    pairs = next(s['attrs']['pairs'] for s in run['spans'] if s['labels'].get('stage') == 'candidates')
+    return dict(rows=len(df), seconds=round(seconds, 2), **stages, candidate_pairs=pairs, **accuracy(marked))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark near-duplicate detection on synthetic newspapers.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--dupes', type=float, default=.1, help='share of papers listed twice')
+    parser.add_argument('--exhaustive', type=int, default=3000, help='rows to compare all pairs of, 0 to skip')
+    args = parser.parse_args()
+
+    results = [bench(rows, args.dupes) for rows in args.rows]
+    print(pd.DataFrame(results).to_string(index=False))
+    if args.exhaustive:
+        df = make_rows(args.exhaustive, args.dupes, np.random.default_rng(304)).drop(columns=['paper', 'copy'])
+        print(f'LSH recall against all pairs of {len(df)} rows: {lsh_recall(df)}')
@@ -0,0 +1,77 @@
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from config import *
+from merge import load_stations
+from resolve import resolve_stations
+
+'''
+Benchmarks station entity resolution at multiples of the current row count.
+
+Each copy of the station records gets its own made-up call signs and domains
+(keeping suffixes like `-CD` and the original duplication pattern intact) so
+blocks stay the size they would be in a real, bigger dataset. There are only
+~35k four letter call signs, so at 100x copies start to share call signs and
+the run is a pessimistic one (bigger blocks, more candidate pairs).
+
+    python bench_resolve.py --scales 1 10 100
+'''
+
+
+def scale_stations(df, factor, seed=303):
+    '''Returns `factor` copies of `df` with distinct call signs and domains per copy.'''
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+
+    copies = [df]
+    for k in range(1, factor):
+        df_ = df.copy()
+        station = df_['station'].astype('string')
+        roots = station.str.extract(r'^([KW][A-Z]{2,3})', expand=False)
+        unique_roots = roots.dropna().unique()
+        fake = rng.choice(['K', 'W'], len(unique_roots)).astype(object)
+        for _ in range(3):
+            fake = fake + rng.choice(letters, len(unique_roots))
+        mapping = dict(zip(unique_roots, fake))
+
+        new_roots = roots.map(mapping)
+        suffix = station.str.replace(r'^[KW][A-Z]{2,3}', '', regex=True)
+        df_['station'] = (new_roots + suffix).where(roots.notna(), station + f' {k}')
+        df_['website'] = df_['website'].astype('string').str.replace(
+            r'^((?:[a-z]+://)?(?:www\.)?)', rf'\g<1>{k}x', regex=True)
+        copies.append(df_)
+
+    return pd.concat(copies, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark station entity resolution.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    df_super = load_stations()
+    results = []
+    for factor in args.scales:
+        df = scale_stations(df_super, factor)
+        tracemalloc.start()
+        start = time.perf_counter()
+        df_tv = resolve_stations(df)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results.append(dict(
+            scale = factor,
+            rows_in = len(df),
+            rows_out = len(df_tv),
+            seconds = round(elapsed, 3),
+            rows_per_sec = int(len(df) / elapsed),
+            peak_mb = round(peak / 1e6, 1),
+        ))
+
+    print(pd.DataFrame(results).to_string(index=False))
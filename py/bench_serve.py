@@ -0,0 +1,125 @@
+import sys
+import time
+import json
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+from urllib.parse import quote
+
+import pandas as pd
+
+from config import *
+from serve import outlet_domains
+
+'''
+Load test for serve.py.
+
+Starts the server in a subprocess (unless `--port` points at one that is
+already running), then hammers it from many keep-alive connections with a
+mix of domain, state and owner lookups and prints p50/p99 latency and
+requests per second.
+
+    python bench_serve.py --concurrency 50 --duration 10
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=30):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"server on {host}:{port} never came up")
+
+
+def sample_paths(filepath, n=1000, seed=303):
+    '''Request paths for keys that exist in the dataset.'''
+    df = pd.read_csv(filepath)
+    rng = random.Random(seed)
+    keys = {
+        'domain' : outlet_domains(df['website']).dropna().unique().tolist(),
+        'state' : df['state'].dropna().unique().tolist(),
+        'owner' : df['owner'].dropna().unique().tolist(),
+    }
+    paths = []
+    for _ in range(n):
+        kind = rng.choice(list(keys))
+        paths.append(f"/{kind}/{quote(str(rng.choice(keys[kind])), safe='')}")
+    return paths
+
+
+async def client(host, port, paths, deadline, latencies):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            if line.lower().startswith(b'content-length'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def run(host, port, paths, concurrency, duration):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(host, port, paths[i:] + paths[:i], deadline, latencies)
+        for i in range(concurrency)
+    ])
+    return latencies, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the outlet lookup server.')
+    parser.add_argument('--host', default=serve_host)
+    parser.add_argument('--port', type=int, help='use an already running server')
+    parser.add_argument('--file', default=local_news_dataset_file)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    proc = None
+    port = args.port
+    if port is None:
+        port = free_port()
+        proc = subprocess.Popen([sys.executable, 'serve.py', '--host', args.host,
+                                 '--port', str(port), '--file', args.file])
+    try:
+        wait_for_port(args.host, port)
+        paths = sample_paths(args.file)
+        latencies, elapsed = asyncio.run(run(args.host, port, paths, args.concurrency, args.duration))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    s = pd.Series(latencies) * 1000
+    print(json.dumps({
+        'requests' : len(s),
+        'concurrency' : args.concurrency,
+        'requests_per_sec' : round(len(s) / elapsed, 1),
+        'p50_ms' : round(s.quantile(.5), 3),
+        'p99_ms' : round(s.quantile(.99), 3),
+    }, indent=2))
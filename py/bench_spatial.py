@@ -0,0 +1,81 @@
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import *
+from spatial import SpatialIndex, haversine_km
+
+'''
+Times spatial.py's radius and nearest-outlet queries against a brute-force
+scan, and checks they return the same outlets.
+
+Outlets are scattered around the places in `places_file`, weighted by
+population, so they cluster in cities the way real outlets do. Queries are
+centered on random places.
+
+    python bench_spatial.py --rows 10000 1000000
+'''
+
+
+def synthetic_points(rows, places, rng, spread_km=15):
+    picked = places.sample(rows, replace=True, weights=places['population'], random_state=rng)
+    jitter = rng.normal(0, spread_km / 111, size=(rows, 2))
+    return picked['lat'].to_numpy() + jitter[:, 0], picked['lng'].to_numpy() + jitter[:, 1]
+
+
+def time_queries(query, centers):
+    start = time.perf_counter()
+    results = [query(lat, lng) for lat, lng in centers]
+    return (time.perf_counter() - start) * 1000 / len(centers), results
+
+
+def bench(rows, km=50, k=10, queries=200, seed=303):
+    rng = np.random.default_rng(seed)
+    places = pd.read_csv(places_file, sep='\t', keep_default_na=False)
+    lats, lngs = synthetic_points(rows, places, rng)
+    centers = places.sample(queries, random_state=rng)[['lat', 'lng']].to_numpy()
+
+    start = time.perf_counter()
+    index = SpatialIndex(lats, lngs)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    def brute_within(lat, lng):
+        d = haversine_km(lat, lng, lats, lngs)
+        return set(np.flatnonzero(d <= km))
+
+    def brute_nearest(lat, lng):
+        return np.sort(haversine_km(lat, lng, lats, lngs))[:k]
+
+    results = []
+    for name, fast, brute, same in [
+        (f'within {km} km', lambda a, b: index.within(a, b, km), brute_within,
+         lambda f, b: set(f[0]) == b),
+        (f'{k} nearest', lambda a, b: index.nearest(a, b, k), brute_nearest,
+         lambda f, b: np.allclose(f[1], b)),
+    ]:
+        fast_ms, fast_results = time_queries(fast, centers)
+        brute_ms, brute_results = time_queries(brute, centers[:20])
+        results.append(dict(
+            rows = rows,
+            query = name,
+            index_build_ms = round(build_ms, 1),
+            index_ms = round(fast_ms, 3),
+            brute_force_ms = round(brute_ms, 3),
+            avg_found = np.mean([len(r[0]) for r in fast_results]),
+            same = all(same(f, b) for f, b in zip(fast_results, brute_results)),
+        ))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the spatial index.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 1_000_000])
+    parser.add_argument('--km', type=float, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    df = pd.DataFrame([r for rows in args.rows for r in bench(rows, args.km, args.k, args.queries)])
+    print(df.to_string(index=False))
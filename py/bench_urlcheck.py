@@ -0,0 +1,121 @@
+import os
+import time
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pandas as pd
+
+from config import *
+from urlcheck import check_urls
+
+'''
+Runs urlcheck.py against a local stand-in HTTP server.
+
+The stand-in answers like the outlet websites we see in the wild: live pages,
+redirect chains, dead pages, servers that refuse HEAD and servers that hang.
+The script checks every URL resolves the way it should, then times a batch of
+`--n` URLs, then times it again to show the cache at work.
+
+    python bench_urlcheck.py --n 5000
+'''
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+    /ok            200
+    /moved/<n>     n redirects, then /ok
+    /dead          404
+    /nohead        405 for HEAD, 200 for GET
+    /loop          redirects to itself forever
+    /slow          waits longer than the client timeout
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self, status, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+    def route(self, method):
+        path = self.path.split('?')[0]
+        if path.startswith('/ok'):
+            return self.respond(200)
+        if path.startswith('/moved/'):
+            n = int(path.split('/')[2])
+            return self.respond(301, f'/moved/{n - 1}' if n > 1 else '/ok')
+        if path == '/nohead':
+            return self.respond(405 if method == 'HEAD' else 200)
+        if path == '/loop':
+            return self.respond(302, '/loop')
+        if path == '/slow':
+            time.sleep(3)
+            return self.respond(200)
+        return self.respond(404)
+
+    def do_HEAD(self):
+        self.route('HEAD')
+
+    def do_GET(self):
+        self.route('GET')
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def check_behaviour(base, cache_file):
+    '''Asserts each kind of URL comes back as expected.'''
+    expected = {
+        f'{base}/ok' : (True, f'{base}/ok', 200),
+        f'{base}/moved/3' : (True, f'{base}/ok', 200),
+        f'{base}/dead' : (False, f'{base}/dead', 404),
+        f'{base}/nohead' : (True, f'{base}/nohead', 200),
+        f'{base}/loop' : (False, f'{base}/loop', None),
+        f'{base}/slow' : (False, f'{base}/slow', None),
+        'not a url' : (False, None, None),
+        None : (False, None, None),
+    }
+    df = pd.DataFrame({'website' : list(expected)})
+    df = check_urls(df, 'website', cache_file=cache_file, timeout=1)
+
+    for row in df.itertuples():
+        alive, final, status = expected[row.website if pd.notna(row.website) else None]
+        assert row.website_alive == alive, (row.website, row.website_alive)
+        assert (row.website_final if pd.notna(row.website_final) else None) == final, (row.website, row.website_final)
+        assert (int(row.website_status) if pd.notna(row.website_status) else None) == status, (row.website, row.website_status)
+    assert list(df['website_valid']) == [True] * 6 + [False, False]
+    print("stand-in checks passed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check urlcheck.py against a local stand-in server.')
+    parser.add_argument('--n', type=int, default=2000, help='urls in the timed batch')
+    parser.add_argument('--concurrency', type=int, default=url_check_concurrency)
+    args = parser.parse_args()
+
+    server, base = start_stand_in()
+    with tempfile.TemporaryDirectory() as tmp:
+        check_behaviour(base, os.path.join(tmp, 'behaviour.sqlite'))
+
+        paths = ['/ok', '/moved/1', '/moved/2', '/dead', '/nohead']
+        urls = [f'{base}{paths[i % len(paths)]}?id={i}' for i in range(args.n)]
+        df = pd.DataFrame({'website' : urls})
+        cache_file = os.path.join(tmp, 'timed.sqlite')
+        for label in ['cold', 'cached']:
+            start = time.perf_counter()
+            df_checked = check_urls(df, 'website', cache_file=cache_file, concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"{label}: {args.n} urls in {elapsed:.2f}s ({args.n / elapsed:.0f} urls/sec), "
+                  f"{int(df_checked['website_alive'].sum())} alive")
+    server.shutdown()
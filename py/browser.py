@@ -0,0 +1,171 @@
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
+
+from config import *
+
+'''
+A pool of headless Chrome browsers for scraping JavaScript-rendered pages.
+
+Starting Chrome takes seconds, so browsers are started on first use and handed
+back to the pool afterwards, warm for the next page or the next scraper.
+Every browser is quit when the pool is closed or the process exits, even if a
+scraper raised.
+
+Images, fonts, media and known third-party hosts (`blocked_url_patterns`) are
+never requested. Instead of a fixed wait, a page counts as ready once its
+selector exists and neither the DOM nor the network has changed for
+`quiet_ms` (see `wait_until_ready`).
+
+    with browser_pool().page('http://sbgi.net/tv-stations/', ready_selector='.table-wrapper') as driver:
+        html = driver.page_source
+'''
+
+# resolves once `selector` exists and the page has gone quiet
+_readiness_script = '''
+const [selector, quietMs, timeoutMs, done] = arguments;
+const start = performance.now();
+let last = performance.now();
+let resources = performance.getEntriesByType('resource').length;
+const observer = new MutationObserver(() => { last = performance.now(); });
+observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+(function check() {
+    const now = performance.now();
+    const n = performance.getEntriesByType('resource').length;
+    if (n !== resources) { resources = n; last = now; }
+    const found = !selector || document.querySelector(selector) !== null;
+    if (found && document.readyState === 'complete' && now - last >= quietMs) {
+        observer.disconnect(); done(true); return;
+    }
+    if (now - start > timeoutMs) { observer.disconnect(); done(false); return; }
+    setTimeout(check, 50);
+})();
+'''
+
+
+class PageNotReady(Exception):
+    '''The page never settled before the timeout.'''
+
+
+def new_driver(headless=True):
+    '''Starts a Chrome that doesn't load images, fonts, media or blocked hosts.'''
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    if headless:
+        options.add_argument('--headless=new')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--no-first-run')
+    options.add_argument(f"--user-agent={generate_request_header()['User-Agent']}")
+    options.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images' : 2,
+    })
+    # hand back control at DOMContentLoaded, readiness is decided by wait_until_ready
+    options.page_load_strategy = 'eager'
+
+    driver = webdriver.Chrome(options=options)
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls' : blocked_url_patterns})
+    return driver
+
+
+def wait_until_ready(driver, selector=None, timeout=browser_ready_timeout, quiet_ms=500):
+    '''
+    Blocks until `selector` is on the page and there have been no DOM mutations
+    and no new network requests for `quiet_ms`. Raises PageNotReady on timeout.
+    '''
+    driver.set_script_timeout(timeout + 5)
+    ready = driver.execute_async_script(_readiness_script, selector, quiet_ms, timeout * 1000)
+    if not ready:
+        raise PageNotReady(f"{driver.current_url} wasn't ready after {timeout}s (waiting for {selector})")
+
+
+class BrowserPool:
+    '''
+    Up to `size` warm browsers shared by every scraper in the process.
+    Safe to use from several threads, each `acquire()` gets a browser of its own.
+    '''
+    def __init__(self, size=browser_pool_size, headless=True):
+        self.size = size
+        self.headless = headless
+        self.idle = queue.LifoQueue()
+        self.drivers = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.closed = False
+        atexit.register(self.close)
+
+    @contextmanager
+    def acquire(self):
+        '''Borrows a browser, starting one if none are idle.'''
+        if self.closed:
+            raise RuntimeError('the browser pool is closed')
+        self.slots.acquire()
+        driver = None
+        try:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                driver = new_driver(self.headless)
+                with self.lock:
+                    self.drivers.append(driver)
+            yield driver
+        except Exception:
+            # a browser that errored might be wedged, don't hand it out again
+            if driver is not None:
+                self.discard(driver)
+                driver = None
+            raise
+        finally:
+            if driver is not None:
+                self.idle.put(driver)
+            self.slots.release()
+
+    @contextmanager
+    def page(self, url, ready_selector=None, timeout=browser_ready_timeout):
+        '''Borrows a browser, loads `url` and waits for it to be ready.'''
+        with self.acquire() as driver:
+            driver.get(url)
+            wait_until_ready(driver, ready_selector, timeout)
+            yield driver
+
+    def discard(self, driver):
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        '''Quits every browser. Called automatically at exit.'''
+        self.closed = True
+        with self.lock:
+            drivers, self.drivers = self.drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def browser_pool():
+    '''The process-wide pool, created on first use.'''
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = BrowserPool()
+        return _pool
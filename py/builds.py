@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from config import year_data_dir, data_root
+
+'''
+Builds several years of the dataset side by side.
+
+Every year runs in its own processes, with `LOCAL_NEWS_YEAR` and
+`LOCAL_NEWS_DATA_ROOT` set so that config resolves that year's directory,
+and its steps run one after the other. The caches under `<data root>/.cache`
+(resolved URLs, website domains) are SQLite in WAL mode and shared by every
+year, so whichever build gets to a website first pays for it.
+
+    python builds.py 2018 2023                         # merge both years at once
+    python builds.py 2023 2024 --steps scrape merge docs
+    python -m localnews build 2018 2023 --data-root /data/localnews
+
+Each step's output goes to `build_<step>.log` in that year's metrics directory.
+'''
+
+here = os.path.dirname(os.path.abspath(__file__))
+nbs_dir = os.path.join(here, '..', 'nbs')
+
+# step -> (command, working directory)
+steps = {
+    'scrape' : ([sys.executable, '-m', 'localnews', 'scrape', 'all'], here),
+    'merge' : ([sys.executable, '-m', 'localnews', 'merge'], here),
+    'docs' : ([sys.executable, '-m', 'docs.render_docs'], nbs_dir),
+}
+
+
+def build_year(year, step_names, root=data_root):
+    '''Runs the steps for one year. Returns [(step, seconds, returncode)], stopping at the first failure.'''
+    root = os.path.abspath(root)
+    log_dir = os.path.join(year_data_dir(year, root), 'metrics')
+    os.makedirs(log_dir, exist_ok=True)
+    env = dict(os.environ, LOCAL_NEWS_YEAR=str(year), LOCAL_NEWS_DATA_ROOT=root)
+
+    results = []
+    for step in step_names:
+        command, cwd = steps[step]
+        start = time.perf_counter()
+        with open(os.path.join(log_dir, f'build_{step}.log'), 'w') as log:
+            returncode = subprocess.run(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+        results.append((step, time.perf_counter() - start, returncode))
+        print(f'{year} {step}: ' + ('ok' if returncode == 0 else f'failed ({returncode}), see {log.name}')
+              + f' in {results[-1][1]:.1f}s', flush=True)
+        if returncode:
+            break
+    return results
+
+
+def build_years(years, step_names=('merge',), root=data_root, jobs=None):
+    '''Builds every year, `jobs` years at a time (all at once by default). Returns {year: results}.'''
+    with ThreadPoolExecutor(max_workers=jobs or len(years)) as pool:
+        futures = {year : pool.submit(build_year, year, step_names, root) for year in years}
+        return {year : future.result() for year, future in futures.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build several years of the dataset in parallel.')
+    parser.add_argument('years', type=int, nargs='+')
+    parser.add_argument('--steps', nargs='+', default=['merge'], choices=list(steps))
+    parser.add_argument('--data-root', default=data_root)
+    parser.add_argument('--jobs', type=int, help='years built at once (default: all of them)')
+    args = parser.parse_args(argv)
+
+    results = build_years(args.years, args.steps, args.data_root, args.jobs)
+    if any(code for steps_run in results.values() for _, _, code in steps_run):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import io
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+from collections import defaultdict
+
+import pandas as pd
+
+from config import *
+from metrics import count
+
+'''
+Loads released builds of the Local News Dataset through a local cache.
+
+The first load of a year downloads the CSV once and rewrites it under
+`client_cache_dir` as one file per state, Parquet when pyarrow is installed
+and CSV otherwise. Every later load reads only the states its filters select,
+and with Parquet only the columns asked for and the row groups the filters
+can match:
+
+    from client import load_local_news
+
+    df = load_local_news(2018)
+    tv = load_local_news(2018, columns=['name', 'website'],
+                         filters={'state' : ['NY', 'NJ'], 'medium' : 'TV station'})
+    big = load_local_news(2018, filters=[('state', 'in', ['CA', 'TX']), ('owner', '!=', 'Gray TV')],
+                          memory_map=True)
+
+`filters` is either {column : value or list of values} or pyarrow-style
+(column, op, value) tuples with op one of ==, !=, <, <=, >, >=, in, not in.
+Filters on `state` ignore case and surrounding spaces.
+
+The cache is versioned by content: a release lives in a directory named after
+the hash of the CSV, so builds are never mixed, and the newest
+`client_keep_versions` are kept. A cached release is used without touching the
+network for `client_check_interval` seconds, then revalidated with its ETag
+(one empty 304 when nothing changed). Offline, the newest cached version is
+used. Only the years in `released_years` are downloaded from
+`dataset_base_url` (`LOCAL_NEWS_DATASET_URL` and `LOCAL_NEWS_RELEASED_YEARS`
+point them at another copy of the repo). For other years, `source` can point
+at any other copy, a local build included:
+
+    df = load_local_news(2023, source='../data_2023/local_news_dataset_2023.csv')
+
+    python client.py 2023 --columns name website --where state=NY,NJ --where "medium=TV station"
+'''
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+partition_col = 'state'
+# everything else is read as strings
+typed_cols = {'lat' : 'Float64', 'lng' : 'Float64', 'cluster' : 'Int64', 'canonical' : 'boolean'}
+# directory for the rows without a state
+missing_partition = '__none__'
+
+operators = {
+    '==' : lambda s, v: s == v,
+    '!=' : lambda s, v: s != v,
+    '<' : lambda s, v: s < v,
+    '<=' : lambda s, v: s <= v,
+    '>' : lambda s, v: s > v,
+    '>=' : lambda s, v: s >= v,
+    'in' : lambda s, v: s.isin(v),
+    'not in' : lambda s, v: ~s.isin(v),
+}
+
+
+def dataset_url(year):
+    if year not in released_years:
+        raise ValueError(f"{dataset_base_url} doesn't publish {year} (only {', '.join(map(str, released_years))}), "
+                         f"pass source= a local build or another URL, e.g. source='{year_data_dir(year)}local_news_dataset_{year}.csv'")
+    return f"{dataset_base_url}{year_dirs.get(year, f'data_{year}')}/local_news_dataset_{year}.csv"
+
+
+def clean_state(states):
+    return states.str.strip().str.upper()
+
+
+def normalize_filters(filters):
+    '''{column : value or values} or [(column, op, value)] -> [(column, op, value)]'''
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        filters = [(col, 'in', v) if isinstance(v, (list, tuple, set)) else (col, '==', v)
+                   for col, v in filters.items()]
+    normalized = []
+    for col, op, value in filters:
+        op = '==' if op == '=' else op
+        if op not in operators:
+            raise ValueError(f"unknown filter operator {op!r}, use one of {', '.join(operators)}")
+        if op in ('in', 'not in'):
+            value = list(value)
+        if col == partition_col:
+            value = [v.strip().upper() for v in value] if isinstance(value, list) else value.strip().upper()
+        normalized.append((col, op, value))
+    return normalized
+
+
+def prune(partitions, filters):
+    '''The partitions (states) that rows matching `filters` can be in.'''
+    keep = set(partitions)
+    for col, op, value in filters:
+        if col != partition_col:
+            continue
+        values = set(value) if isinstance(value, list) else {value}
+        if op in ('==', 'in'):
+            keep &= values
+        elif op in ('!=', 'not in'):
+            keep -= values
+    return sorted(keep)
+
+
+def apply_filters(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for col, op, value in filters:
+        mask &= operators[op](df[col], value).fillna(False).astype(bool)
+    return df[mask]
+
+
+# -- the cache -------------------------------------------------------------
+
+def read_json(filepath, default=None):
+    if not os.path.exists(filepath):
+        return default
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def write_json(obj, filepath):
+    '''Replaces `filepath` in one step, so concurrent loads never read half a file.'''
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(obj, f, indent=1)
+    os.replace(tmp, filepath)
+
+
+def storage_format():
+    return 'parquet' if pq is not None else 'csv'
+
+
+def build_version(content, version_dir, source):
+    '''Splits a release CSV into one file per state under `version_dir`.'''
+    fmt = storage_format()
+    df = pd.read_csv(io.BytesIO(content), dtype=defaultdict(lambda: 'string', typed_cols))
+    df[partition_col] = clean_state(df[partition_col])
+
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(version_dir), prefix='.building-')
+    partitions = {}
+    for state, part in df.groupby(df[partition_col].fillna(missing_partition), sort=True):
+        part_dir = os.path.join(tmp, f'{partition_col}={state}')
+        os.makedirs(part_dir)
+        if fmt == 'parquet':
+            pq.write_table(pa.Table.from_pandas(part, preserve_index=False), os.path.join(part_dir, 'part-0.parquet'))
+        else:
+            part.to_csv(os.path.join(part_dir, 'part-0.csv'), index=False)
+        partitions[state] = len(part)
+    write_json(dict(
+        source = source,
+        format = fmt,
+        file = f'part-0.{fmt}',
+        columns = list(df.columns),
+        rows = len(df),
+        partitions = partitions,
+        created = datetime.datetime.now().isoformat(),
+    ), os.path.join(tmp, 'meta.json'))
+    try:
+        os.rename(tmp, version_dir)
+    except OSError:
+        # another process built the same version first
+        shutil.rmtree(tmp, ignore_errors=True)
+    count('client_versions_built', 1, format=fmt)
+
+
+def fetch_release(url, etag=None):
+    '''(content, etag) of `url`, or (None, etag) when it hasn't changed since `etag`.'''
+    import requests
+    r = requests.get(url, headers={'If-None-Match' : etag} if etag else {}, timeout=60)
+    if r.status_code == 304:
+        return None, etag
+    if r.status_code == 404:
+        raise FileNotFoundError(f"{url} doesn't exist, pass source= a copy of this year's dataset")
+    r.raise_for_status()
+    return r.content, r.headers.get('ETag')
+
+
+def prune_versions(year_cache, manifest, keep=client_keep_versions):
+    in_use = {s['version'] for s in manifest['sources'].values()}
+    versions = manifest['versions']
+    stale = [v for v in versions[:-keep] if v not in in_use] if keep else [v for v in versions if v not in in_use]
+    for version in stale:
+        shutil.rmtree(os.path.join(year_cache, version), ignore_errors=True)
+    manifest['versions'] = [v for v in versions if v not in stale]
+
+
+def cached_release(year, source=None, refresh=False, cache_dir=client_cache_dir):
+    '''
+    The directory of the cached copy of `source` (by default the release of
+    `year` on GitHub), downloading and splitting it first if it changed.
+    '''
+    source = source or dataset_url(year)
+    remote = source.startswith(('http://', 'https://'))
+    if not remote:
+        source = os.path.abspath(source)
+    year_cache = os.path.join(cache_dir, str(year))
+    os.makedirs(year_cache, exist_ok=True)
+    manifest_file = os.path.join(year_cache, 'manifest.json')
+    manifest = read_json(manifest_file, dict(sources={}, versions=[]))
+    known = manifest['sources'].get(source, {})
+
+    def cached():
+        return os.path.join(year_cache, known['version'])
+
+    if known and not refresh and os.path.exists(cached()):
+        if remote and time.time() - known['checked'] < client_check_interval:
+            count('client_cache_hits', 1, check='fresh')
+            return cached()
+        if not remote:
+            st = os.stat(source)
+            if [st.st_size, st.st_mtime_ns] == known['stat']:
+                count('client_cache_hits', 1, check='stat')
+                return cached()
+
+    if remote:
+        try:
+            content, etag = fetch_release(source, known.get('etag') if known and os.path.exists(cached()) else None)
+        except Exception as e:
+            if known and os.path.exists(cached()):
+                print(f'Could not check {source} ({e}), loading the cached copy')
+                count('client_stale_loads', 1)
+                return cached()
+            raise
+        if content is None:
+            known['checked'] = time.time()
+            manifest['sources'][source] = known
+            write_json(manifest, manifest_file)
+            count('client_cache_hits', 1, check='etag')
+            return cached()
+        state = dict(etag=etag, checked=time.time())
+    else:
+        st = os.stat(source)
+        with open(source, 'rb') as f:
+            content = f.read()
+        state = dict(stat=[st.st_size, st.st_mtime_ns])
+
+    version = f'{hashlib.sha256(content).hexdigest()[:16]}.{storage_format()}'
+    version_dir = os.path.join(year_cache, version)
+    if not os.path.exists(version_dir):
+        build_version(content, version_dir, source)
+
+    # re-read: another process may have recorded its own release meanwhile
+    manifest = read_json(manifest_file, dict(sources={}, versions=[]))
+    manifest['sources'][source] = dict(version=version, **state)
+    manifest['versions'] = [v for v in manifest['versions'] if v != version] + [version]
+    prune_versions(year_cache, manifest)
+    write_json(manifest, manifest_file)
+    return version_dir
+
+
+def read_partitions(version_dir, columns=None, filters=(), memory_map=False):
+    meta = read_json(os.path.join(version_dir, 'meta.json'))
+    unknown = [c for c in list(columns or []) + [f[0] for f in filters] if c not in meta['columns']]
+    if unknown:
+        raise KeyError(f"not in the dataset: {', '.join(unknown)} (columns are {', '.join(meta['columns'])})")
+    columns = list(columns or meta['columns'])
+    # filtered columns are read too, then dropped
+    read_cols = columns + [c for c in dict.fromkeys(f[0] for f in filters) if c not in columns]
+    files = [os.path.join(version_dir, f'{partition_col}={state}', meta['file'])
+             for state in prune(meta['partitions'], filters)]
+    count('client_partitions_read', len(files))
+
+    if not files:
+        return pd.DataFrame({c : pd.Series(dtype='string') for c in columns})
+    if meta['format'] == 'parquet':
+        tables = [pq.read_table(f, columns=read_cols, filters=filters or None, memory_map=memory_map) for f in files]
+        df = pa.concat_tables(tables).to_pandas()
+    else:
+        df = pd.concat([pd.read_csv(f, usecols=read_cols, dtype=dict.fromkeys(read_cols, 'string') | typed_cols,
+                                    memory_map=memory_map)[read_cols]
+                        for f in files], ignore_index=True)
+        df = apply_filters(df, filters)
+    return df[columns].reset_index(drop=True)
+
+
+def load_local_news(year=year, columns=None, filters=None, memory_map=False, refresh=False, source=None,
+                    cache_dir=client_cache_dir):
+    '''
+    The Local News Dataset for `year`, restricted to `columns` and to the rows
+    matching `filters`, read through the local cache. `refresh` revalidates
+    the cached copy now instead of after `client_check_interval`.
+    '''
+    version_dir = cached_release(year, source, refresh, cache_dir)
+    return read_partitions(version_dir, columns, normalize_filters(filters), memory_map)
+
+
+def parse_where(clauses):
+    '''["state=NY,NJ", "medium=TV station"] -> {'state' : ['NY', 'NJ'], 'medium' : ['TV station']}'''
+    filters = {}
+    for clause in clauses:
+        col, _, values = clause.partition('=')
+        filters[col.strip()] = values.split(',')
+    return filters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load the Local News Dataset through the local cache.')
+    parser.add_argument('year', type=int, nargs='?', default=year)
+    parser.add_argument('--columns', nargs='+')
+    parser.add_argument('--where', action='append', default=[], metavar='COLUMN=V1,V2',
+                        help='keep rows whose column is one of the values, can be repeated')
+    parser.add_argument('--source', help='a local file or URL instead of the GitHub release')
+    parser.add_argument('--refresh', action='store_true', help='revalidate the cached copy now')
+    parser.add_argument('--out', help='write the rows here (CSV) instead of printing a summary')
+    args = parser.parse_args()
+
+    df = load_local_news(args.year, args.columns, parse_where(args.where), refresh=args.refresh, source=args.source)
+    if args.out:
+        df.to_csv(args.out, index=False)
+    else:
+        print(df.head(20).to_string(index=False))
+        print(f'{len(df)} rows')
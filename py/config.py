@@ -2,8 +2,20 @@ import os
 import random
 import datetime
 
-# where is data stored?
-data_dir = '../data_2023/'
+# where is data stored? which year is being built?
+# Both can be set per process (`python -m localnews --year 2018 --data-root ../ merge`,
+# or LOCAL_NEWS_YEAR / LOCAL_NEWS_DATA_ROOT), so several years can be built at once, see builds.py.
+year = int(os.environ.get('LOCAL_NEWS_YEAR', 2023))
+data_root = os.environ.get('LOCAL_NEWS_DATA_ROOT', '../')
+
+# 2018 predates the per-year directories
+year_dirs = {2018 : 'data'}
+
+def year_data_dir(year, data_root=data_root):
+    '''The directory holding one year's intermediates and output.'''
+    return os.path.join(data_root, year_dirs.get(year, f'data_{year}'), '')
+
+data_dir = year_data_dir(year)
 
 # intermediates
 tribune_file = os.path.join(data_dir, 'tribune.tsv')
@@ -14,12 +26,89 @@ gray_file = os.path.join(data_dir, 'gray.tsv')
 hearst_file = os.path.join(data_dir, 'hearst.tsv')
 stationindex_file = os.path.join(data_dir, 'station_index.tsv')
 usnpl_file = os.path.join(data_dir, 'usnpl.tsv')
+# one row per stationindex subchannel (station, channel, name, network), see align.py
+stationindex_subchannels_file = os.path.join(data_dir, 'station_index_subchannels.tsv')
 
 # this is where user entries go!
 custom_station_file = os.path.join(data_dir, 'custom_additions.json')
+# the Gray stations, as downloaded from gray.tv
+gray_additions_file = os.path.join(data_dir, 'gray_tv_additions.json')
 
 # this is the output!
-local_news_dataset_file  = os.path.join(data_dir, 'local_news_dataset_2023.csv') 
+local_news_dataset_file  = os.path.join(data_dir, f'local_news_dataset_{year}.csv')
+
+# social media handle -> row of `local_news_dataset_file`
+handle_index_file = local_news_dataset_file.replace('.csv', '_handles.tsv')
+
+# counts of `local_news_dataset_file` by these columns plus per-column cardinalities, see cube.py
+cube_file = local_news_dataset_file.replace('.csv', '_cube.json')
+cube_dims = ['state', 'medium', 'owner', 'source']
+
+# every build of the output is kept here, see snapshots.py
+snapshot_dir = os.path.join(data_dir, 'snapshots')
+
+# run reports from metrics.py and profiles from profiling.py
+metrics_dir = os.path.join(data_dir, 'metrics')
+profile_dir = os.path.join(data_dir, 'profiles')
+
+# lookup tables shared by every year, built by geo.py (see the README for how to rebuild them)
+geo_dir = os.path.join(data_root, 'data_geo')
+
+# city -> state, state names -> codes and TV market -> states, built by geo.py from every year
+gazetteer_file = os.path.join(geo_dir, 'gazetteer.json')
+
+# US places (state, place key, lat, lng), for geocoding outlets by city; built by `geo.py places`
+places_file = os.path.join(geo_dir, 'places.tsv')
+
+# grid cell size of the spatial index over outlet coordinates, in degrees, see spatial.py
+spatial_cell_deg = 0.1
+
+# caches that are shared by every year's build
+cache_dir = os.path.join(data_root, '.cache')
+url_cache_file = os.path.join(cache_dir, 'urls.sqlite')
+domain_cache_file = os.path.join(cache_dir, 'domains.sqlite')
+# how long a process waits on another process's write to a shared cache (seconds)
+cache_lock_timeout = 60
+
+# task queue and result segments for distributed crawls, see workqueue.py
+queue_dir = os.path.join(data_dir, 'queue')
+queue_file = os.path.join(queue_dir, 'tasks.sqlite')
+# a leased task goes back on the queue if its worker is silent this long (seconds)
+queue_visibility_timeout = 15 * 60
+queue_max_attempts = 3
+
+# when each source (and each usnpl state) was scraped and whether it changed, see refresh.py
+refresh_history_file = os.path.join(data_dir, 'refresh_history.sqlite')
+# source -> (shortest, first, longest) refresh interval in days
+refresh_intervals = {
+    'usnpl' : (1, 2, 30),
+    'stationindex' : (3, 14, 90),
+    'sinclair' : (7, 30, 120),
+    'nexstar' : (7, 30, 120),
+    'hearst' : (7, 30, 120),
+    'gray' : (30, 180, 365),
+}
+# refresh a unit once the chance it has changed since the last scrape reaches this
+refresh_change_probability = .5
+
+# every request made through fetch.py gets these (connect, read) timeouts in seconds
+fetch_timeout = (5, 30)
+# the default deadline for a scrape run in seconds, and how it is shared between sources
+scrape_budget = 6 * 60 * 60
+source_budget_shares = {
+    'usnpl' : .6,
+    'stationindex' : .2,
+    'hearst' : .08,
+    'sinclair' : .04,
+    'nexstar' : .04,
+    'gray' : .04,
+}
+# with hedging on, resend a request after this many seconds (until there's a latency sample)
+hedge_after = 5
+
+# stable outlet IDs across yearly builds, see linkage.py. A build output, read back to keep the IDs;
+# one for every year, so it doesn't depend on the year a build runs under
+crosswalk_file = os.path.join(data_root, 'data_links', 'outlet_crosswalk.csv')
 
 def generate_request_header():
   '''
@@ -57,6 +146,46 @@ def generate_request_header():
 today = datetime.datetime.now()
 version = 0
 
+# HTML parser for the scrapers, 'lxml' or 'bs4' (see parsers.py)
+html_backend = os.environ.get('LOCAL_NEWS_HTML_BACKEND', 'lxml')
+# pages saved by `bench_parsers.py --record`, to benchmark and compare the parsers on
+recorded_pages_dir = os.path.join(cache_dir, 'pages')
+
+# for client.py: where released datasets are downloaded from, the years published there
+# (set both for another copy of the repo), and where they are cached
+dataset_base_url = os.environ.get('LOCAL_NEWS_DATASET_URL', 'https://raw.githubusercontent.com/yinleon/LocalNewsDataset/master/')
+released_years = [int(y) for y in os.environ.get('LOCAL_NEWS_RELEASED_YEARS', '2018').split(',')]
+client_cache_dir = os.environ.get('LOCAL_NEWS_CLIENT_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'localnews'))
+# seconds a cached release is trusted before asking the server whether it changed
+client_check_interval = 3600
+# older versions of a year's release kept in the cache
+client_keep_versions = 2
+
+# for browser.py
+browser_pool_size = 2
+browser_ready_timeout = 20
+
+# never requested by the headless browser
+blocked_url_patterns = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+    '*googlesyndication.com*', '*facebook.net*', '*facebook.com/tr*',
+    '*twitter.com/i/*', '*hotjar.com*', '*scorecardresearch.com*',
+    '*quantserve.com*', '*chartbeat.com*', '*newrelic.com*', '*fonts.googleapis.com*',
+    '*fonts.gstatic.com*', '*youtube.com/embed*',
+]
+
+# for urlcheck.py
+url_check_concurrency = 100
+url_cache_ttl = 7 * 24 * 60 * 60
+
+# for serve.py
+serve_host = '127.0.0.1'
+serve_port = 8765
+serve_cache_size = 4096
+
 
 
 # for normalizing station info.
@@ -64,7 +193,61 @@ owner_mapping = {
     'Meredith Corporation' : 'Meredith',
     'Sinclair Broadcast Group' : 'Sinclair',
     'Nexstar Media Group' : 'Nexstar',
-    'Hearst Television' : 'Hearst'
+    'Hearst Television' : 'Hearst',
+}
+
+# newspaper chains by domain, for owners.py (on top of what hearst.tsv and custom_additions.json say)
+known_owner_domains = {
+    **dict.fromkeys(['cleveland.com', 'nola.com', 'mlive.com', 'masslive.com', 'pennlive.com',
+                     'syracuse.com', 'nj.com', 'al.com', 'oregonlive.com', 'silive.com',
+                     'lehighvalleylive.com', 'newyorkupstate.com', 'gulflive.com'], 'Advance Local'),
+    **dict.fromkeys(['chicagotribune.com', 'baltimoresun.com', 'courant.com', 'orlandosentinel.com',
+                     'sun-sentinel.com', 'mcall.com', 'dailypress.com', 'pilotonline.com',
+                     'nydailynews.com'], 'Tribune Publishing'),
+    **dict.fromkeys(['mercurynews.com', 'eastbaytimes.com', 'denverpost.com', 'twincities.com',
+                     'ocregister.com', 'presstelegram.com', 'dailynews.com', 'sbsun.com',
+                     'dailybulletin.com', 'pe.com', 'redlandsdailyfacts.com', 'whittierdailynews.com',
+                     'sgvtribune.com', 'pasadenastarnews.com', 'dailybreeze.com', 'bostonherald.com',
+                     'dailycamera.com', 'timescall.com', 'reporterherald.com', 'macombdaily.com',
+                     'theoaklandpress.com', 'delcotimes.com', 'pottsmerc.com', 'timesherald.com',
+                     'dailylocal.com', 'troyrecord.com', 'saratogian.com', 'oneidadispatch.com',
+                     'dailyfreeman.com'], 'MediaNews Group'),
+    **dict.fromkeys(['usatoday.com', 'statesman.com', 'northjersey.com', 'app.com', 'courier-journal.com',
+                     'freep.com', 'indystar.com', 'jsonline.com', 'azcentral.com', 'tennessean.com',
+                     'desmoinesregister.com', 'democratandchronicle.com', 'lohud.com', 'cincinnati.com',
+                     'dispatch.com', 'commercialappeal.com', 'palmbeachpost.com'], 'Gannett'),
+    **dict.fromkeys(['stltoday.com', 'buffalonews.com', 'omaha.com', 'richmond.com', 'tulsaworld.com',
+                     'journalstar.com', 'madison.com', 'qctimes.com', 'wcfcourier.com',
+                     'siouxcityjournal.com'], 'Lee Enterprises'),
+    **dict.fromkeys(['kansascity.com', 'miamiherald.com', 'charlotteobserver.com', 'newsobserver.com',
+                     'sacbee.com', 'star-telegram.com', 'kentucky.com', 'thestate.com', 'fresnobee.com',
+                     'idahostatesman.com', 'bnd.com'], 'McClatchy'),
+    **dict.fromkeys(['mysuburbanlife.com', 'shawlocal.com', 'nwherald.com'], 'Shaw Media'),
+    **dict.fromkeys(['nwaonline.com', 'arkansasonline.com'], 'WEHCO Media'),
+    'latimes.com' : 'Los Angeles Times Communications',
+    'liherald.com' : 'Richner Communications',
+    'kpcnews.com' : 'KPC Media Group',
+    'swnewsmedia.com' : 'Southwest News Media',
+    'southernminn.com' : 'Adams Publishing Group',
+    'patch.com' : 'Patch Media',
+}
+
+# hosting platforms: sharing one of these domains says nothing about who owns a site
+shared_hosts = [
+    'wordpress.com', 'blogspot.com', 'wixsite.com', 'squarespace.com', 'weebly.com', 'tumblr.com',
+    'substack.com', 'google.com', 'facebook.com', 'townnews.com', 'godaddysites.com', 'github.io',
+]
+
+# the owner index owners.py builds, kept for inspection
+owner_index_file = os.path.join(data_dir, 'owner_index.tsv')
+
+# when the same station is found in several places, trust the owner's own website first
+source_priority = {
+    'sbgi.net' : 5,
+    'hearst.com' : 4,
+    'nexstar.tv' : 3,
+    'https://gray.tv/' : 2,
+    'stationindex' : 1,
 }
 
 station_index_mapping = {
@@ -80,9 +263,6 @@ national = [
     'daystar.com',
 ]
 
-look_up = {' Honolulu' : 'HI',
- ' Kalamazoo. MI' : 'MI',
-' San Antonio' : 'TX'}
 
 col_standard = {
     'station' : 'name',
@@ -99,8 +279,31 @@ cols_standard_nexstar = {
 
 cols_nexstar = ['station', 'website', 'city', 'state', 'broadcaster', 'source']
 
-cols = ['state', 'medium', 'city', 'name', 'website', 'twitter', 'facebook', 'instagram', 'youtube', 'address', 'editor', 'phone', 'source', 'collection_date', 'owner']
-cols_final = cols_final = ['name', 'state', 'city', 'medium', 'website', 'twitter', 'facebook', 'instagram', 'youtube', 'owner', 'phone', 'source', 'collection_date']
+# for reading JSON and JSONL (see ingest.py): keys are lower-cased, then renamed with these
+json_field_aliases = {
+    'twitter_name' : 'twitter',
+    'station' : 'name',
+    'geography' : 'state',
+    'broadcaster' : 'owner',
+    'latitude' : 'lat',
+    'longitude' : 'lng',
+    'lon' : 'lng',
+}
+ingest_chunk_size = 1 << 16
+ingest_chunk_rows = 100_000
+
+# what's kept of each custom addition and each Gray station
+custom_fields = dict({field : 'string' for field in ['name', 'website', 'state', 'medium', 'owner',
+                                                     'twitter', 'facebook', 'youtube']},
+                     lat='Float64', lng='Float64')
+gray_fields = dict({field : 'string' for field in ['title', 'city', 'state', 'website', 'zip']},
+                   lat='Float64', lng='Float64', dmasize='Int64')
+
+cols = ['state', 'medium', 'city', 'name', 'website', 'twitter', 'facebook', 'instagram', 'youtube', 'address', 'editor', 'phone', 'source', 'collection_date', 'owner', 'lat', 'lng']
+cols_final = cols_final = ['name', 'state', 'city', 'medium', 'website', 'twitter', 'facebook', 'instagram', 'youtube', 'owner', 'phone', 'source', 'collection_date', 'lat', 'lng', 'cluster', 'canonical']
+
+# added to the output when websites are checked with urlcheck.py
+cols_link_check = ['website_valid', 'website_final', 'website_alive', 'website_status']
 
 # to align nexstar websites to station names
 nexstar_alignment = {
@@ -154,43 +357,30 @@ nexstar_alignment = {
 states = '''ak	  al	  ar	  az	  ca	  co	  ct	  dc	  de	  fl	  ga	  hi	  ia	  id	  il	  in	  ks   ky	  la	  ma	  md	  me	  mi	  mn	  mo	  ms	  mt	  nc	  nd	  ne	  nh	  nj	  nm	  nv	  ny	  oh	  ok	  or	  pa	  ri	  sc	  sd	  tn	  tx	  ut	  va	  vt	  wa	  wi	  wv	  wy	'''
 states = [s.strip() for s in states.split('  ')]
 
-# for stationindex
-city_state = {
-    'New York' : 'NY',
-    'Los Angeles' : 'CA',
-    'Chicago' : 'IL',
-    'Philadelphia' : 'PA',
-    'Dallas' : 'TX',
-    'Washington, D.C.' : 'DC',
-    'Houston' : "TX",
-    'Seattle' : 'WA',
-    'South Florida' : 'FL',
-    'Denver' : 'CO',
-    'Cleveland': 'OH',
-    'Sacramento' : 'CA',
-    'San Diego' : 'CA',
-    'St. Louis' : 'MO',
+# for geo.py, see `gazetteer_file`.
+# TV markets (DMAs) and the states they cover, for markets the intermediates don't place themselves
+market_states = {
+    'Abilene-Sweetwater' : ['TX'],
+    'Butte-Bozeman' : ['MT'],
+    'Chico-Redding' : ['CA'],
+    'Eureka' : ['CA'],
+    'Greenville-N.Bern-Washngtn' : ['NC'],
+    'Missoula' : ['MT'],
+    'Providence-New Bedford' : ['RI', 'MA'],
+    'San Angelo' : ['TX'],
+    'Savannah' : ['GA'],
+    'South Florida' : ['FL'],
+    'Greensboro/High Point/Winston-Salem' : ['NC'],
+    'Wilkes-Barre/Scranton' : ['PA'],
+    'Tri-Cities' : ['TN', 'VA'],
+    'Quad Cities' : ['IL', 'IA'],
+}
+# cities found in several states that, in this dataset, mean one of them
+city_states = {
     'Portland' : 'OR',
-    'Indianapolis' : 'IN',
-    'Hartford' :'CT',
-    'Kansas City' :'MO',
-    'Salt Lake City' : 'UT',
-    'Milwaukee' : 'WI',
-    'Waterbury' : 'CT',
-    'Grand Rapids' : 'MI',
-    'Oklahoma City': 'OK',
-    'Harrisburg' : 'VA',
-    'Norfolk' : 'VA',
-    'Greensboro/High Point/Winston-Salem' : 'NC',
-    'Memphis' : 'TN',
-    'New Orleans' : 'LA',
-    'Wilkes-Barre/Scranton' : 'PA',
-    'Richmond' : 'VA',
-    'Des Moines' : 'IL',
-    'Huntsville' : 'AL',
-    'Moline, IL / Davenport, IA' : "IL/IA",
-    'Fort Smith' : "AK",
-    'America' : 'National'
+    'Kansas City' : 'MO',
+    'Washington' : 'DC',
+    'Washington, D.C.' : 'DC',
 }
 
 not_actually_local = [
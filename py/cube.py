@@ -0,0 +1,92 @@
+import json
+import argparse
+
+import pandas as pd
+
+from config import *
+from snapshots import file_sha256
+
+'''
+A materialized aggregate cube of the dataset.
+
+Summary tables, the choropleth in the docs and dashboards all want the same
+few numbers: how many outlets per state, medium, owner and source, and how
+many distinct values each column has. `merge.py` computes them once, with one
+groupby, and writes them next to the dataset as `cube_file`:
+
+    {
+      "dataset": "local_news_dataset_2023.csv",
+      "sha256": "...",                           # of the dataset the cube was built from
+      "rows": 6810,
+      "dims": ["state", "medium", "owner", "source"],
+      "cardinality": {"name": 6522, "state": 51, ...},
+      "counts": {"state": [...], "medium": [...], "owner": [...], "source": [...], "n": [...]}
+    }
+
+`counts` holds one row per combination that occurs (missing values are kept
+as null). Any coarser breakdown is a sum over it, see `rollup`. `read_cube`
+checks `sha256` against the dataset next to the cube, so a cube left over
+from an older build is never read as the current one:
+
+    cube = read_cube()
+    rollup(cube, ['state', 'medium'])
+'''
+
+
+def build_cube(df, dims=cube_dims):
+    '''Outlet counts for every combination of `dims` found in `df`.'''
+    return (df.groupby(dims, dropna=False, sort=False)
+              .size()
+              .rename('n')
+              .reset_index())
+
+
+def cardinalities(df):
+    '''Distinct values per column, missing values counted as one.'''
+    return {k : int(v) for k, v in df.nunique(dropna=False).items()}
+
+
+def write_cube(df, filepath=cube_file, dataset_file=local_news_dataset_file, dims=cube_dims):
+    '''Writes the cube of `df` (already written to `dataset_file`) to `filepath`.'''
+    counts = build_cube(df, dims)
+    cube = dict(
+        dataset = os.path.basename(dataset_file),
+        sha256 = file_sha256(dataset_file) if os.path.exists(dataset_file) else None,
+        rows = len(df),
+        dims = dims,
+        cardinality = cardinalities(df),
+        counts = counts.astype(object).where(counts.notna(), None).to_dict('list'),
+    )
+    with open(filepath + '.tmp', 'w') as f:
+        json.dump(cube, f)
+    os.replace(filepath + '.tmp', filepath)
+    return cube
+
+
+def read_cube(filepath=cube_file):
+    '''The cube with `counts` as a DataFrame. Raises ValueError when the dataset next to it has changed since.'''
+    with open(filepath) as f:
+        cube = json.load(f)
+    dataset_file = os.path.join(os.path.dirname(filepath), cube['dataset'])
+    if cube['sha256'] and os.path.exists(dataset_file) and file_sha256(dataset_file) != cube['sha256']:
+        raise ValueError(f"{filepath} was built from another version of {dataset_file}, rebuild it with `python cube.py --build`")
+    cube['counts'] = pd.DataFrame(cube['counts'])
+    return cube
+
+
+def rollup(cube, by):
+    '''Counts by a subset of the cube's dims, largest first.'''
+    return (cube['counts'].groupby(by, dropna=False)['n']
+                          .sum()
+                          .sort_values(ascending=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build or inspect the aggregate cube of the dataset.')
+    parser.add_argument('--build', action='store_true', help=f'rebuild {cube_file} from {local_news_dataset_file}')
+    parser.add_argument('--by', nargs='+', default=['medium'], choices=cube_dims)
+    args = parser.parse_args()
+
+    if args.build:
+        write_cube(pd.read_csv(local_news_dataset_file))
+    print(rollup(read_cube(), args.by).to_string())
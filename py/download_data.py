@@ -1,20 +1,18 @@
 import re
-import requests
-import time
-from django.core.validators import URLValidator
-from django.core.exceptions import ValidationError
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import sys
+
 import pandas as pd
-import json
-import time
-from tqdm import tqdm as tqdm
-from bs4 import BeautifulSoup
 
 from config import *
+from contextlib import nullcontext
+
+from fetch import fetch, pause, BudgetExhausted, active_budget
+from ingest import read_records
+from align import align_stations, explode_subchannels
+from geo import split_place
+from parsers import extract
+from metrics import span, count, write_report
+import profiling
 
 '''
 This is a forked version of the original script.
@@ -34,9 +32,33 @@ Note that these scrapers are super similar codebases!
 Written By Leon Yin
 On 2018-05-31
 Updated 2018-08-02
+
+Selenium, BeautifulSoup and tqdm are slow to import, so each scraper imports
+what it needs itself and extracting Gray (or importing this module) doesn't
+pay for the others. Pages are parsed by the extractors in parsers.py (lxml,
+with BeautifulSoup as the fallback).
 '''
 
 
+def save_with_existing(df, filepath, key, source):
+    '''
+    Appends the rows of `df` that aren't in `filepath` yet (matched on `key`)
+    and writes the result back to `filepath`.
+    '''
+    count('rows_produced', len(df), source=source)
+    if os.path.exists(filepath):
+        # appending to old
+        df_ = pd.read_csv(filepath, sep='\t')
+        n = len(df)
+        df = df[~df[key].isin(df_[key])]
+        count('rows_deduped', n - len(df), source=source)
+        df = pd.concat([df_, df])
+    
+    with span('write', source=source) as s:
+        df.to_csv(filepath, index=False, sep='\t')
+        s['rows'] = len(df)
+
+
 # def download_tribune():
 #     '''Scrapes ther Tribune homepage.'''
 #     def parse_channel_html(channel_html, website=None):
@@ -107,12 +129,12 @@ def download_sinclair():
     Downloads metadata about Sinclair broadcasting channels.
 
     The function scrapes the Sinclair homepage to collect information about the broadcasting channels. 
-    It uses Selenium with a headless Chrome browser to load the webpage and BeautifulSoup to parse the HTML. 
-    The data is then extracted and stored in a DataFrame.
+    It borrows a headless Chrome from the shared browser pool (see browser.py) to load the webpage 
+    and lxml or BeautifulSoup (see parsers.py) to parse the HTML. The data is then extracted and stored in a DataFrame.
 
     The final DataFrame includes details such as location, station, affiliation, and website.
 
-    Note: The function requires the Selenium, BeautifulSoup, pandas, and lxml libraries.
+    Note: The function requires the Selenium, pandas, and lxml (or BeautifulSoup) libraries.
 
     Parameters:
     None
@@ -120,105 +142,44 @@ def download_sinclair():
     Returns:
     None
     '''
+    from browser import browser_pool
+
     print("Downloading Sinclair")
-    
-    # Configure Selenium with a headless Chrome browser
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    driver = webdriver.Chrome(options=chrome_options)
 
     url = 'http://sbgi.net/tv-stations/'
-    driver.get(url)
-
-    # Wait for the page to load
-    wait = WebDriverWait(driver, 10)
-    table_wrapper = wait.until(EC.presence_of_element_located((By.CLASS_NAME, 'table-wrapper')))
-
-    soup = BeautifulSoup(driver.page_source, 'lxml')
-    main = soup.find('main')
-    table = main.find('div', class_='table-wrapper')
-    df = pd.read_html(str(table))[0]
+    with span('page', source='sinclair') as s:
+        # the table is rendered by javascript, wait for it to show up and settle
+        with browser_pool().page(url, ready_selector='.table-wrapper') as driver:
+            page_source = driver.page_source
+        s['bytes'] = len(page_source)
+
+    with span('parse', source='sinclair') as s:
+        df = extract('sinclair_stations', page_source)
+        s['rows'] = len(df)
     df.drop(["Status", "DMA Rank"], axis=1, inplace=True)
     df.rename(columns={"Stations": "station", 
                        "Market": "location",
                        "Links":"website", 
                        "location":"geo"}, inplace=True)
     
-    df['location'] = df['location'].fillna('')
-    split_values = df['location'].str.split(', ', n=1, expand=True)
-    df['city'] = split_values[0]
-    df['state'] = split_values[1].fillna('')
+    df['city'], df['state'] = split_place(df['location'])
     df['broadcaster'] = 'Sinclair'
     df['source'] = 'sbgi.net'
     df['collection_date'] = today
     
-    if os.path.exists(sinclair_file):
-        # appending to old
-        df_ = pd.read_csv(sinclair_file, sep='\t')
-        df = df[~df['station'].isin(df_['station'])]
-        df = df_.append(df) 
-        
-    df.to_csv(sinclair_file, index=False, sep='\t')
+    save_with_existing(df, sinclair_file, 'station', 'sinclair')
+    return df
 
 
 def download_nexstar():
     '''Scrapes ther Nexstar homepage.'''
-    def get_geo(row):
-        row = row.replace('  (3)', '')
-        state = row.split(',')[-1]
-        city = row.replace(',' + state, '')
-
-        state = state.strip()
-        return city, state
-    
-    def fix_up_mismatched_stations(row):
-        '''
-        The table that the Nexstar dataset is scraped from is no aligned.
-        This is a way to automate alignment
-        '''
-        stations = row['station'].split()
-        websites = row['website'].split()
-
-        if len(stations) > 1:
-            if len(websites) == 1:
-                # if there is one website it applies to all the stations
-                for station in stations:
-                    row_ = row.copy()
-                    row_['station'] = station
-                    yield row_
-
-            elif len(stations) == len(websites):
-                # if the number of websites is equal to that of the stations,
-                # we can just align them like this
-                for s, w in zip(stations, websites):
-                    row_ = row.copy()
-                    row_['station'] = s
-                    row_['website'] = w
-                    yield row_
-
-            else:
-                # These are the hardest to align, we make a make a manual mapping
-                # and map the correct station to the website
-                for w in websites:
-                    custom_mapping = nexstar_alignment.get(w)
-                    if custom_mapping:
-                        for s in custom_mapping:
-                            row_ = row.copy()
-                            row_['station'] = s
-                            row_['website'] = w
-                            yield row_
-                    else:
-                        print(f"{w} is an edge case that needs to be updated on `nexstar_mapping`")
-        else:
-            yield row
-    
     print("Downloading Nexstar")
     url = 'https://www.nexstar.tv/stations/'
-    r = requests.get(url, headers=generate_request_header())
-    soup = BeautifulSoup(r.content, 'lxml')
-    table = soup.find('table', class_='tablepress tablepress-id-1 dataTable no-footer tablepress--responsive')
-    df = pd.read_html(str(table))[0]
-    df['city'], df['state'] = zip(*df['Market'].apply(get_geo))
+    r = fetch(url, 'nexstar')
+    with span('parse', source='nexstar') as s:
+        df = extract('nexstar_stations', r.content)
+        s['rows'] = len(df)
+    df['city'], df['state'] = split_place(df['Market'])
     df.columns = [cols_standard_nexstar.get(c, c) for c in df.columns]
     df['broadcaster'] = 'Nexstar'
     df['source'] = 'nexstar.tv'
@@ -226,57 +187,36 @@ def download_nexstar():
     df['collection_date'] = today
     
     # align stations and websites! many to one relationship per row...
-    data = []
-    for i, row in df.iterrows():
-        for _ in fix_up_mismatched_stations(row):
-            data.append(_)
-    df = pd.DataFrame(data)
+    # the table isn't aligned, see align.py for how it's untangled
+    with span('normalize', source='nexstar') as s:
+        df = align_stations(df)
+        s['rows'] = len(df)
     
-    if os.path.exists(nexstar_file):
-        # appending to old
-        df_ = pd.read_csv(nexstar_file, sep='\t')
-        df = df[~df['station'].isin(df_['station'])]
-        df = df_.append(df) 
-        
-    df.to_csv(nexstar_file, sep='\t', index=False)
+    save_with_existing(df, nexstar_file, 'station', 'nexstar')
+    return df
     
 
 def extract_gray():
     '''
     Extracts metadata about Gray TV stations from a local JSON file and saves it to a CSV file (Downloades 05/17/2023).
 
-    This function loads JSON data from a specified local file and extracts relevant fields such as title, city, state, and website. 
-
-    Note: The function requires the json, pandas, and os libraries.
+    This function streams JSON data from a specified local file and extracts relevant fields such as title, city, state, and website. 
 
     Parameters:
     None
 
     Returns:
-    None
+    The extracted stations (the file also keeps earlier ones)
     '''
-    # Load the JSON data from a local file
-    with open('../data/gray_tv_additions.json') as file:
-        data = json.load(file)
-    
-    # Extract relevant fields from the JSON data
-    columns = ['title', 'city', 'state', 'website']
-    extracted_data = [{col: item[col] for col in columns} for item in data]
-
-    # Create a DataFrame from the extracted data
-    df = pd.DataFrame(extracted_data)
+    # Stream the relevant fields out of the local JSON file (see ingest.py)
+    df = read_records(gray_additions_file, gray_fields)
 
     df['broadcaster'] = 'Gray TV'
     df['source'] = 'https://gray.tv/'
     df['collection_date'] = datetime.datetime(2023, 5, 17, 10, 56, 6, 89876)
     
-    if os.path.exists(gray_file):
-        # appending to old
-        df_ = pd.read_csv(gray_file, sep='\t')
-        df = df[~df['title'].isin(df_['title'])]
-        df = df_.append(df) 
-
-    df.to_csv(gray_file, index=False, sep='\t')
+    save_with_existing(df, gray_file, 'title', 'gray')
+    return df
 
 # def download_meredith():
 #     '''Scrapes ther Meredith homepage.'''
@@ -343,7 +283,7 @@ def download_hearst():
     Instagram, station name (for broadcasting channels), broadcaster (set as "Hearst"), source (set as 
     "https://www.hearst.com/"), and collection date.
 
-    Note: The function requires the requests, BeautifulSoup, and pandas libraries.
+    Note: The function requires the requests and pandas libraries, and lxml or BeautifulSoup (see parsers.py).
 
     Parameters:
     None
@@ -351,26 +291,15 @@ def download_hearst():
     Returns:
     None
     '''
-    
     # Parse the broadcasting channels
-    def parse_channel_html(channel_html):
-        '''Parses bs4 html to create a dictionary (row in the dataset)'''
-        website_tag = channel_html.find('a')
-
+    def parse_channel(website, station):
+        '''Creates a dictionary (row in the dataset) from a brand card's link and logo alt-text'''
         # Sometime there are brand-cards that don't have any metadata attached
-        if website_tag is not None:
-            website = website_tag.get('href')
-        else:
+        if website is None:
             return None
-        
-        # Extract station name from alt-text
-        img_container = channel_html.find('div', class_='brand-logo-caption-with-text')
-        image_element = img_container.find('img')
-        station = image_element['alt']
 
         context = dict(
-            city = "",
-            state = "",
+            place = "",
             network = "",
             medium = "broadcasting",
             website = website,
@@ -388,44 +317,25 @@ def download_hearst():
     
     
     # Parse the newspaper pages
-    def parse_newspaper_html(newspaper_html):        
-        '''Parses bs4 html to create a dictionary (row in the dataset)'''
-        
-        href = newspaper_html.find('a').get('href')
-        sub_r = requests.get(f'https://www.hearst.com{href}', headers=generate_request_header())
-        sub_soup = BeautifulSoup(sub_r.content, 'lxml')
+    def parse_newspaper(href):
+        '''Fetches a newspaper's page to create a dictionary (row in the dataset)'''
+        sub_r = fetch(f'https://www.hearst.com{href}', 'hearst')
         
         # Extract newspaper information
-        data_section = sub_soup.find('section', id='content')
-        name = data_section.find("h1").text.strip()
-        
-        main_column = data_section.find('div', id='layout-column_column-1')
-        column_divs = main_column.find_all('div', recursive=False)
-
-        contact_info = column_divs[2].find('div', class_="brand-contact-info")
-        website = contact_info.find('p', class_="brand-address").find('a').get('href')
-        
-        address_info = column_divs[2].find('div', class_='address-container')
-        address_list = [p.text.strip() for p in address_info.find_all('p')]
-        city = ""
-        state = ""
-        city_state = address_list[1].split(', ')
-        if len(city_state) >= 2:
-            city = city_state[0]  # Extract the city
-            state_zip = city_state[1].split(' ')
-            if len(city_state) >= 2:
-                state = state_zip[0]  # Extract the state
+        page = extract('hearst_newspaper', sub_r.content)
+        name = page['name']
+        website = page['website']
+        address_list = page['address_list']
+        # `Houston, TX 77002`, split into city and state for every row at once below
+        place = address_list[1] if len(address_list) > 1 else ""
         phone = address_list[-1]
         address = ' '.join(address_list[:-1])
             
-        social_info = column_divs[2].find('ul', class_="brand-icons")
         twitter = ''
         facebook = ''
         linkedin = ''
         instagram = ''
-        for link in social_info.find_all('a'):
-            img_alt = link.find('img')['alt']
-            href = link['href']
+        for img_alt, href in page['social']:
             if 'twitter' in img_alt.lower():
                 twitter = href
             elif 'facebook' in img_alt.lower():
@@ -434,12 +344,9 @@ def download_hearst():
                 linkedin = href
             elif 'instagram' in img_alt.lower():
                 instagram = href
-        
-        column_divs[2]
 
         context = dict(
-            city = city,
-            state = state,
+            place = place,
             network = "",
             website = website,
             name = name,
@@ -462,71 +369,39 @@ def download_hearst():
     newspaper_url = "https://www.hearst.com/newspapers"
     
     # Get broadcasting data
-    r = requests.get(broadcasting_url, headers=generate_request_header())
-    soup = BeautifulSoup(r.content, 'lxml')
-    parent_div = soup.find('div', class_='brand-card')
-    channels = parent_div.find_all('div', recursive=False)
-    channel_metadata = []
-    for channel in channels:
-        channel_meta = parse_channel_html(channel)
-        if channel_meta is not None:
-            channel_metadata.append(channel_meta)
+    r = fetch(broadcasting_url, 'hearst')
+    with span('parse', source='hearst') as s:
+        channel_metadata = []
+        for website, station in extract('hearst_cards', r.content):
+            channel_meta = parse_channel(website, station)
+            if channel_meta is not None:
+                channel_metadata.append(channel_meta)
+        s['rows'] = len(channel_metadata)
     
     # get newspaper data
-    r = requests.get(newspaper_url, headers=generate_request_header())
-    soup = BeautifulSoup(r.content, 'lxml')
-    parent_div = soup.find('div', class_='brand-card')
-    newspapers = parent_div.find_all('div', recursive=False)
+    r = fetch(newspaper_url, 'hearst')
     newspaper_metadata = []
-    for newspaper in newspapers:
-        newspaper_meta = parse_newspaper_html(newspaper)
+    for href, _ in extract('hearst_cards', r.content):
+        with span('page', source='hearst'):
+            newspaper_meta = parse_newspaper(href)
         newspaper_metadata.append(newspaper_meta)  
     
     broadcast_df = pd.DataFrame(channel_metadata)
     newspaper_df = pd.DataFrame(newspaper_metadata)
     
     df = pd.concat([broadcast_df, newspaper_df])
+    df['city'], df['state'] = split_place(df.pop('place'))
     
     df['broadcaster'] = 'Hearst'
     df['source'] = 'hearst.com'
     df['collection_date'] = today
     
-    if os.path.exists(hearst_file):
-        # appending to old
-        df_ = pd.read_csv(hearst_file, sep='\t')
-        df = df[~df['station'].isin(df_['station'])]
-        df = df_.append(df) 
-    
-    df.to_csv(hearst_file, index=False, sep='\t')
+    save_with_existing(df, hearst_file, 'station', 'hearst')
+    return df
 
     
-def download_stationindex():
-    '''
-    stationindex has metadata about many tv stations in different states.
-    '''
-    def parse_station(row):
-        '''Parses bs4 html to create a dictionary (row in the dataset)'''
-                
-        station_name = row.find_all('td')[1].find('a').text
-        spans = row.find('td', attrs={'width':'100%'}).find_all('span', attrs={"class":'text-bold'}) 
-        row = {'station' : station_name}
-        for span in spans:
-            # each span becomes a different column:
-            col_name = span.text.rstrip(':').strip(' ').replace(' ', '_').lower().replace('web_site', 'website')
-            val = span.next_sibling
-            if col_name == 'website':
-                # this needs to be validateed, 
-                # there are some incorrect strings being passed as URLs
-                val = val.next_sibling.text
-            if col_name == 'city':
-                state = val.split(', ')[-1]
-                val = val.split(', ')[0]
-                row['state'] = state
-            row[col_name] = val
-
-        return row
-    
-    print("Downloading StationIndex")
+def stationindex_market_urls():
+    '''The URL of every market page on stationindex.'''
     tv_markets = [
         'http://www.stationindex.com/tv/tv-markets',
         'http://www.stationindex.com/tv/tv-markets-100'
@@ -534,32 +409,145 @@ def download_stationindex():
 
     market_urls = []
     for url in tv_markets:
-        r = requests.get(url, headers=generate_request_header())
-        soup = BeautifulSoup(r.content, 'lxml')
-        table = soup.find('table', attrs={'class' : 'table table-striped table-condensed'})
-        urls = ['http://www.stationindex.com' + _.get('href') for _ in table.find_all('a')]
+        r = fetch(url, 'stationindex')
+        urls = ['http://www.stationindex.com' + href for href in extract('stationindex_market_links', r.content)]
         market_urls.extend(urls)
 
-    data = []
-    for url in tqdm(market_urls):
-        r = requests.get(url, headers=generate_request_header())
-        soup = BeautifulSoup(r.content, 'lxml')
-        rows = soup.find_all('tr')
-        data.extend([parse_station(row) for row in rows])     
+    return market_urls
+
+
+def scrape_stationindex_market(url):
+    '''The stations on one stationindex market page.'''
+    with span('page', source='stationindex') as s:
+        r = fetch(url, 'stationindex')
+        s['url'] = url
+    with span('parse', source='stationindex') as s:
+        # one row per station, each labelled value becomes a column
+        rows = extract('stationindex_stations', r.content)
+        s['rows'] = len(rows)
+        return rows
+
 
+def save_stationindex(data):
+    '''Writes the stations from every market page to `stationindex_file`.'''
     df = pd.DataFrame(data)
+    # ` Anchorage, AK` -> `Anchorage`, `AK`
+    df['city'], df['state'] = split_place(df['city'])
     df['source'] = 'stationindex'
     df['collection_date'] = today
 
-    if os.path.exists(stationindex_file):
-        # appending to old
-        df_ = pd.read_csv(stationindex_file, sep='\t')
-        df = df[~df['station'].isin(df_['station'])]
-        df = df_.append(df) 
-        
-    df.to_csv(stationindex_file, index=False, sep='\t')
+    save_with_existing(df, stationindex_file, 'station', 'stationindex')
+
+    # `2.1 WCBS/CBS, 2.2 Start TV` -> one row per subchannel, for every station in the file
+    with span('normalize', source='stationindex') as s:
+        df_sub = explode_subchannels(pd.read_csv(stationindex_file, sep='\t'))
+        df_sub.to_csv(stationindex_subchannels_file, index=False, sep='\t')
+        s['rows'] = len(df_sub)
+    return df
+
+
+def download_stationindex():
+    '''
+    stationindex has metadata about many tv stations in different states.
+    '''
+    from tqdm import tqdm
+    
+    print("Downloading StationIndex")
+
+    data = []
+    for url in tqdm(stationindex_market_urls()):
+        try:
+            data.extend(scrape_stationindex_market(url))
+        except BudgetExhausted as e:
+            active_budget().skip('stationindex', url, e)
+
+    return save_stationindex(data)
+
+
+def scrape_usnpl_state(state):
+    '''
+    The newspapers usnpl lists for one state, following each newspaper's own
+    usnpl page for its address, editor and phone number.
+    '''
+    print(state)
+    sites = []
+    url = f'https://www.usnpl.com/search/state?state={state}'
+    with span('page', source='usnpl') as page:
+        r = fetch(url, 'usnpl')
+        page['state'] = state
+    # Avoid Rate Limit Issues
+    pause(10, 'usnpl')
+
+    # one row per newspaper, under the city heading it's listed in (see parsers.py)
+    papers = extract('usnpl_state', r.content)
+    for i, paper in enumerate(papers):
+        current_city = paper['city']
+        phone = ""
+        editor = ""
+        address = ""
+
+        try:
+            for attempt in range(3):
+                if attempt:
+                    count('http_retries', 1, source='usnpl')
+                try:
+                    # Extract Data From the Newspaper Page
+                    sub_url = f"https://www.usnpl.com/search/{paper['usnpl_page']}"
+                    r = fetch(sub_url, 'usnpl')
+                    if r.status_code != 200:
+                        raise ValueError(f"Unexpected status code {r.status_code}")
+                    # Avoid Rate Limit Issues
+                    pause(1, 'usnpl')
+                    details = extract('usnpl_paper', r.content)
+                    if 'title' in details:
+                        print(details['title'] + f" -- {current_city}")
+                        continue
+                    address, editor, phone = details['address'], details['editor'], details['phone']
+                    break
+                except BudgetExhausted:
+                    raise
+                except Exception as e:
+                    print(f"An error occurred in processing a value in city '{current_city}': {e}")
+        except BudgetExhausted as e:
+            # keep the papers done so far, the rest of the state waits for the next run
+            active_budget().skip('usnpl', f"{state} ({len(papers) - i} of {len(papers)} papers, from {paper['name']})", e)
+            return sites
+
+        # Parsed Object
+        parsed_object = {
+            "Geography": state,
+            "Medium": "Newspaper",
+            "City": current_city,
+            "Name": paper['name'],
+            "Website": paper['website'],
+            "Twitter_Name": paper['twitter'],
+            "Facebook": paper['facebook'],
+            "Instagram": paper['instagram'],
+            "Youtube": paper['youtube'],
+            "Address": address,
+            "Editor": editor,
+            "Phone": phone
+        }
+        # Add to the list
+        sites.append(parsed_object)
+
+    return sites
+
+
+def save_usnpl(sites):
+    '''Writes the newspapers from every state to `usnpl_file`.'''
+    df = pd.DataFrame(sites)
 
+    print(df)
+
+    df['Website'] = df['Website'].str.rstrip('/')
+    df['source'] = 'usnpl.com'
+    df['collection_date'] = today
     
+    save_with_existing(df, usnpl_file, 'Name', 'usnpl')
+    return df
+
+
 def download_usnpl():
     '''
     Retrieves metadata about newspapers in different states from the usnpl.com website
@@ -568,13 +556,15 @@ def download_usnpl():
     Parses the HTML response to extract newspaper information when available (state, city, name,
     website, Twitter, Facebook, Instagram, YouTube, address, editor, and phone number.
 
-    Note: The function requires the `requests`, `BeautifulSoup`, and `pandas` libraries.
+    Note: The function requires the `requests`, `pandas`, and `lxml` (or `BeautifulSoup`) libraries.
+
+    For crawling from several processes or machines, see workqueue.py.
 
     Parameters:
         None
 
     Returns:
-        None
+        The newspapers scraped (empty when no state could be)
     '''
     print("Downloading Usnpl")
 
@@ -582,108 +572,36 @@ def download_usnpl():
     
 #    for state in states:
     for state in states:
-        print(state)
         try:
-            url = f'https://www.usnpl.com/search/state?state={state}'
-            r = requests.get(url, headers=generate_request_header())
-            # Avoid Rate Limit Issues
-            time.sleep(10)
-            soup = BeautifulSoup(r.content, 'lxml')
-
-            main_table = soup.find('table', class_='table table-sm')
-
-            if main_table:
-                rows = main_table.find_all('tr')
-                # Remove non-data rowss
-                rows = [row for row in rows if 'table-dark' not in row.get('class', [])]
-                current_city = ""
-                for row in rows:
-                    city_element = row.find('h4', class_='result_city')
-                    if city_element:
-                        current_city = city_element.text.strip()
-                        continue
-                    # Extract data From the row
-                    data_points = row.find_all('td')
-                    if len(data_points) >= 6:
-                        newspaper_name = data_points[0].find('a').text.strip() if data_points[0].find('a') else ''
-                        usnpl_page = data_points[0].find('a')['href'] if data_points[0].find('a') else ''
-                        website = data_points[1].find('a')['href'] if data_points[1].find('a') else ''
-                        twitter = data_points[2].find('a')['href'] if data_points[2].find('a') else ''
-                        facebook = data_points[3].find('a')['href'] if data_points[3].find('a') else ''
-                        instagram = data_points[4].find('a')['href'] if data_points[4].find('a') else ''
-                        youtube = data_points[5].find('a')['href'] if data_points[5].find('a') else ''
-                    else:
-                        continue
-                    
-                    phone = ""
-                    editor = ""
-                    address = ""
-
-                    for attempt in range(3):
-                        try:
-                            # Extract Data From the Newspaper Page
-                            sub_url = f"https://www.usnpl.com/search/{usnpl_page}"
-                            r = requests.get(sub_url, headers=generate_request_header())
-                            if r.status_code != 200:
-                                raise ValueError(f"Unexpected status code {r.status_code}")
-                            # Avoid Rate Limit Issues
-                            time.sleep(1)
-                            sub_soup = BeautifulSoup(r.content, 'lxml')
-
-                            sub_table = sub_soup.find_all('tr')
-                            if len(sub_table) >= 2:
-                                address_element = sub_table[1]
-                                address_parts = [part.strip() for part in address_element.stripped_strings]
-                                address = ' '.join(address_parts)
-                            else: 
-                                print(sub_soup.find('title').text.strip() + f" -- {current_city}")
-                                continue
-                            editor_element = sub_soup.find('strong', string='Editor:')
-                            editor = editor_element.find_next_sibling(string=True).strip() if editor_element else ''
-                            phone_element = sub_soup.find('strong', string='Phone:')
-                            phone = phone_element.find_next_sibling(string=True).strip() if phone_element else ''
-                            break
-                        except Exception as e:
-                            print(f"An error occurred in processing a value in city '{current_city}': {e}")
-
-                    # Parsed Object
-                    parsed_object = {
-                        "Geography": state,
-                        "Medium": "Newspaper",
-                        "City": current_city,
-                        "Name": newspaper_name,
-                        "Website": website,
-                        "Twitter_Name": twitter,
-                        "Facebook": facebook,
-                        "Instagram": instagram,
-                        "Youtube": youtube,
-                        "Address": address,
-                        "Editor": editor,
-                        "Phone": phone
-                    }
-                    # Add to the list
-                    sites.append(parsed_object)
+            sites.extend(scrape_usnpl_state(state))
+        except BudgetExhausted as e:
+            active_budget().skip('usnpl', state, e)
         except Exception as e:
             print(f"An error occurred in processing (usnpl) the state '{state}': {e}")
 
-    df = pd.DataFrame(sites)
-
-    print(df)
-
-    df['Website'] = df['Website'].str.rstrip('/')
-    df['source'] = 'usnpl.com'
-    df['collection_date'] = today
-    
-    if os.path.exists(usnpl_file):
-        # appending to old
-        df_ = pd.read_csv(usnpl_file, sep='\t')
-        df = df[~df['Name'].isin(df_['Name'])]
-        df = df_.append(df) 
-    
-    df.to_csv(usnpl_file, index=False, sep='\t')
+    if sites:
+        return save_usnpl(sites)
+    return pd.DataFrame()
     
     
-def download_all_datasets():
+def scrape_sources(scrapers, budget=None):
+    '''
+    Runs each scraper in {source: function} in turn. With a RunBudget each
+    source only gets its share of the run, and a source that runs out of time
+    is skipped (keeping whatever it saved) rather than stopping the run.
+    '''
+    with budget or nullcontext():
+        for source, scraper in scrapers.items():
+            with span('scrape', source=source), (budget.source(source) if budget else nullcontext()):
+                try:
+                    scraper()
+                except BudgetExhausted as e:
+                    budget.skip(source, '*', e)
+    if budget:
+        budget.write_report()
+
+
+def download_all_datasets(budget=None):
     '''
     Downloads datasets from the 7 sources.
     '''
@@ -694,8 +612,17 @@ def download_all_datasets():
     # extract_gray()
     # # download_tribune()
     # download_stationindex()
-    download_usnpl()
+    scrape_sources({'usnpl' : download_usnpl}, budget)
+    
+    write_report('scrape')
+    profiling.dump_profiles()
     
 if __name__ == "__main__":
-    download_all_datasets()
+    from fetch import RunBudget
+    if '--profile' in sys.argv:
+        profiling.enable()
+    budget = None
+    if '--budget' in sys.argv:
+        budget = RunBudget(float(sys.argv[sys.argv.index('--budget') + 1]), hedge='--hedge' in sys.argv)
+    download_all_datasets(budget)
     
\ No newline at end of file
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import *
+from metrics import record_response, count
+
+'''
+The one place scrapers make HTTP requests from, so every request is counted
+and every request has a timeout.
+
+A scrape run can also be given a deadline. Each source gets a share of the
+run's budget when it starts (time left over by earlier sources is shared out
+again), and every request's connect/read timeouts are cut to what is left.
+Once a source is out of time `fetch` raises `BudgetExhausted`, the scraper
+skips the unit it was on and moves on, and the run ends with partial results
+and a list of what was skipped instead of hanging on one dead socket:
+
+    budget = RunBudget(2 * 60 * 60, hedge=True)
+    with budget:
+        with budget.source('usnpl'):
+            download_usnpl()
+    budget.write_report()
+
+With `hedge=True`, a request that hasn't answered after the source's usual
+slow-page latency is sent a second time and whichever copy answers first wins.
+'''
+
+
+class BudgetExhausted(Exception):
+    '''The run, or the source, has no time left for another request.'''
+
+
+_active = None
+
+
+def active_budget():
+    return _active
+
+
+class RunBudget:
+    '''
+    A deadline for a scrape run, shared out between sources by `shares`
+    (default `source_budget_shares`, unlisted sources get an equal part of what's left).
+    '''
+    def __init__(self, seconds=scrape_budget, shares=None, hedge=False):
+        self.seconds = seconds
+        self.shares = dict(source_budget_shares if shares is None else shares)
+        self.hedge = hedge
+        self.deadline = None
+        self.source_deadlines = {}
+        self.allowances = {}
+        self.finished = set()
+        self.latencies = {}
+        self.skipped = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        global _active
+        self.deadline = time.monotonic() + self.seconds
+        self.previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self.previous
+
+    def remaining(self, source=None):
+        '''Seconds left for `source` (or for the run).'''
+        left = self.deadline - time.monotonic()
+        if source in self.source_deadlines:
+            left = min(left, self.source_deadlines[source] - time.monotonic())
+        return max(left, 0)
+
+    @contextmanager
+    def source(self, source):
+        '''Gives `source` its share of what's left of the run while the block runs.'''
+        waiting = [s for s in self.shares if s not in self.finished] or [source]
+        share = self.shares.get(source, 1 / max(len(waiting), 1))
+        of = sum(self.shares.get(s, 0) for s in waiting) or share
+        allowance = self.remaining() * min(share / of, 1)
+        self.source_deadlines[source] = time.monotonic() + allowance
+        self.allowances[source] = allowance
+        count('budget_seconds', allowance, source=source)
+        try:
+            yield allowance
+        finally:
+            self.finished.add(source)
+
+    def timeouts(self, source):
+        '''(connect, read) timeouts for the next request, or BudgetExhausted.'''
+        left = self.remaining(source)
+        if left <= 0:
+            raise BudgetExhausted(f"{source} has used its share of the run budget")
+        connect, read = fetch_timeout
+        return (min(connect, left), min(read, left))
+
+    def observe(self, source, seconds):
+        with self.lock:
+            self.latencies.setdefault(source, []).append(seconds)
+
+    def hedge_delay(self, source):
+        '''The source's 90th percentile latency once there's enough of a sample.'''
+        observed = sorted(self.latencies.get(source, []))
+        if len(observed) < 20:
+            return hedge_after
+        return observed[int(len(observed) * .9)]
+
+    def skip(self, source, unit, reason):
+        '''Records a unit the run didn't get to.'''
+        print(f"Skipped {source} {unit}: {reason}")
+        self.skipped.append(dict(source=source, unit=unit, reason=str(reason)))
+        count('units_skipped', 1, source=source)
+
+    def report(self):
+        return dict(
+            budget_seconds = self.seconds,
+            used_seconds = round(self.seconds - self.remaining(), 1),
+            allowance_seconds = {s : round(a, 1) for s, a in self.allowances.items()},
+            skipped = self.skipped,
+        )
+
+    def write_report(self, report_dir=metrics_dir):
+        '''Writes the skipped units to `skipped_<timestamp>.json` and returns its path.'''
+        os.makedirs(report_dir, exist_ok=True)
+        filepath = os.path.join(report_dir, f"skipped_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(filepath, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        print(f"{len(self.skipped)} units skipped, see {filepath}")
+        return filepath
+
+
+_hedge_pool = None
+
+
+def _hedged_get(get, url, source, budget, kwargs):
+    '''Sends `url` again if the first copy is slow, returns whichever answers first.'''
+    global _hedge_pool
+    if _hedge_pool is None:
+        _hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+    first = _hedge_pool.submit(get, url, **kwargs)
+    done, _ = wait([first], timeout=budget.hedge_delay(source))
+    if done:
+        return first.result()
+
+    count('http_hedged', 1, source=source)
+    second = _hedge_pool.submit(get, url, **kwargs)
+    done, _ = wait([first, second], return_when=FIRST_COMPLETED)
+    winner = done.pop()
+    if winner.exception() is not None:
+        # the other copy might still make it
+        other = second if winner is first else first
+        return other.result()
+    return winner.result()
+
+
+def fetch(url, source, **kwargs):
+    '''
+    GETs `url` with a browser-like header and records the response under `source`.
+    Within a RunBudget, raises BudgetExhausted once `source` is out of time.
+    '''
+    import requests
+
+    kwargs.setdefault('headers', generate_request_header())
+    budget = _active
+    if budget is not None:
+        kwargs['timeout'] = budget.timeouts(source)
+    else:
+        kwargs.setdefault('timeout', fetch_timeout)
+
+    start = time.perf_counter()
+    try:
+        if budget is not None and budget.hedge:
+            r = _hedged_get(requests.get, url, source, budget, kwargs)
+        else:
+            r = requests.get(url, **kwargs)
+    except requests.RequestException as e:
+        count('http_errors', 1, source=source, error=type(e).__name__)
+        raise
+    seconds = time.perf_counter() - start
+    record_response(source, r, seconds)
+    if budget is not None:
+        budget.observe(source, seconds)
+
+    return r
+
+
+def pause(seconds, source):
+    '''`time.sleep` for rate limits, cut short rather than sleeping past the budget.'''
+    budget = _active
+    if budget is not None:
+        seconds = min(seconds, budget.remaining(source))
+    time.sleep(seconds)
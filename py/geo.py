@@ -0,0 +1,364 @@
+import os
+import glob
+import json
+import argparse
+from functools import lru_cache
+
+import pandas as pd
+
+from config import *
+from metrics import count
+
+'''
+Geography normalization for every source.
+
+Each source writes places its own way: `Anchorage, AK` (usnpl),
+`Albuquerque-Santa Fe, NM  (3)` (Nexstar), `Mobile, AL / Pensacola, FL`
+(Sinclair), `Houston, TX 77002` (Hearst), `California`, `Co` or ` Honolulu`
+where a state code should be. `split_place` and `normalize_states` turn all
+of them into a city and a two letter state code, backed by a gazetteer:
+
+- `states`: state (and territory) names -> codes
+- `cities`: city -> state, for the cities found in only one state
+- `markets`: TV market -> the states it covers
+
+The gazetteer is built once from every year's intermediates, plus
+`market_states` and `city_states` in config, and kept at `gazetteer_file`:
+
+    python geo.py build
+    python geo.py report      # what the current intermediates fail to resolve
+
+`geocode` fills in coordinates for rows whose source has none, from the
+city's in `places_file`, a table of US places built from GeoNames
+(https://www.geonames.org, CC BY 4.0) with at least 500 inhabitants:
+
+    python geo.py places --geonames cities500.txt
+
+Everything works on the distinct values of a column and maps the results back,
+so a million rows with a few thousand places cost a few thousand lookups.
+'''
+
+state_codes = {
+    'alabama' : 'AL', 'alaska' : 'AK', 'arizona' : 'AZ', 'arkansas' : 'AR', 'california' : 'CA',
+    'colorado' : 'CO', 'connecticut' : 'CT', 'delaware' : 'DE', 'district of columbia' : 'DC',
+    'florida' : 'FL', 'georgia' : 'GA', 'hawaii' : 'HI', 'idaho' : 'ID', 'illinois' : 'IL',
+    'indiana' : 'IN', 'iowa' : 'IA', 'kansas' : 'KS', 'kentucky' : 'KY', 'louisiana' : 'LA',
+    'maine' : 'ME', 'maryland' : 'MD', 'massachusetts' : 'MA', 'michigan' : 'MI', 'minnesota' : 'MN',
+    'mississippi' : 'MS', 'missouri' : 'MO', 'montana' : 'MT', 'nebraska' : 'NE', 'nevada' : 'NV',
+    'new hampshire' : 'NH', 'new jersey' : 'NJ', 'new mexico' : 'NM', 'new york' : 'NY',
+    'north carolina' : 'NC', 'north dakota' : 'ND', 'ohio' : 'OH', 'oklahoma' : 'OK', 'oregon' : 'OR',
+    'pennsylvania' : 'PA', 'rhode island' : 'RI', 'south carolina' : 'SC', 'south dakota' : 'SD',
+    'tennessee' : 'TN', 'texas' : 'TX', 'utah' : 'UT', 'vermont' : 'VT', 'virginia' : 'VA',
+    'washington' : 'WA', 'west virginia' : 'WV', 'wisconsin' : 'WI', 'wyoming' : 'WY',
+    'puerto rico' : 'PR', 'guam' : 'GU', 'virgin islands' : 'VI', 'american samoa' : 'AS',
+    'northern mariana islands' : 'MP', 'd.c.' : 'DC',
+}
+codes = set(state_codes.values())
+code_pattern = r'\b(' + '|'.join(sorted(codes)) + r')\b'
+
+
+def place_key(s):
+    '''` St. Louis ` -> `st louis`, for looking places up.'''
+    return (s.astype('string')
+             .str.lower()
+             .str.replace(r'[^a-z0-9 ]', ' ', regex=True)
+             .str.replace(r'\s+', ' ', regex=True)
+             .str.strip())
+
+
+def expand(values, labels, index):
+    '''`values` per distinct value back onto every row; missing values (label -1) stay missing.'''
+    values = pd.concat([values.reset_index(drop=True), pd.Series([pd.NA])], ignore_index=True)
+    return pd.Series(values.take(labels).values, index=index, dtype='string')
+
+
+def on_distinct(s, func):
+    '''Applies `func` (Series -> Series) to the distinct values of `s` only.'''
+    labels, uniques = pd.factorize(s.astype('string'))
+    return expand(func(pd.Series(uniques, dtype='string')), labels, s.index)
+
+
+def split_place(places):
+    '''
+    `Houston, TX 77002` -> (`Houston`, `TX`); `Mobile, AL / Pensacola, FL` -> (`Mobile`, `AL`).
+    The state is the first state code or name after the city, NA when there's none.
+    '''
+    def split(s):
+        s = (s.str.replace(r'\s*\(\d+\)\s*$', '', regex=True)
+              .str.replace(r'\s+\d{5}(?:-\d{4})?\s*$', '', regex=True)
+              .str.strip())
+        has_comma = s.str.contains(',', regex=False)
+        city = s.str.replace(r',.*$', '', regex=True).str.strip()
+        rest = s.str.replace(r'^[^,]*,', '', regex=True).where(has_comma)
+        # `Washington DC / Hagerstown MD`, `Kalamazoo. MI`: the code ends the first part
+        trailing = city.str.extract(r'^(.*?)[\s.]+([A-Z]{2})(?:\s*/.*)?$')
+        code_at_end = trailing[1].isin(codes) & ~has_comma
+        city = city.mask(code_at_end, trailing[0].str.strip())
+        rest = rest.mask(code_at_end, trailing[1])
+        return pd.concat([city.replace('', pd.NA), rest], axis=1, keys=['city', 'state'])
+
+    labels, uniques = pd.factorize(places.astype('string'))
+    parts = split(pd.Series(uniques, dtype='string'))
+    city, state = expand(parts['city'], labels, places.index), expand(parts['state'], labels, places.index)
+    return city, on_distinct(state, state_code)
+
+
+def state_code(s, gazetteer=None):
+    '''
+    A state code for each value of `s`, from (in order) the value itself
+    (`co`), the first code in it (`FL - Thomasville, GA`), a state name
+    (`California`), or, with a gazetteer, a city or market name (` Honolulu`).
+    '''
+    stripped = s.str.strip().str.replace('.', '', regex=False)
+    upper = stripped.str.upper()
+    out = upper.where(upper.isin(codes))
+    out = out.fillna(s.str.extract(code_pattern, expand=False))
+    key = place_key(s)
+    out = out.fillna(key.map(state_codes))
+    if gazetteer is not None:
+        out = out.fillna(key.map(gazetteer['cities']))
+        out = out.fillna(key.map({k : v[0] for k, v in gazetteer['markets'].items()}))
+    return out.astype('string')
+
+
+def normalize_states(states, cities=None, markets=None, gazetteer=None):
+    '''
+    Two letter state codes for a column of messy states. Where the state
+    can't be resolved, the city (then the market) is looked up instead.
+    '''
+    if gazetteer is None and os.path.exists(gazetteer_file):
+        gazetteer = load_gazetteer()
+    out = on_distinct(states, lambda s: state_code(s, gazetteer))
+    if gazetteer is not None:
+        for places, table in [(cities, 'cities'), (markets, 'markets')]:
+            if places is None or not out.isna().any():
+                continue
+            lookup = gazetteer[table]
+            if table == 'markets':
+                lookup = {k : v[0] for k, v in lookup.items()}
+            out = out.fillna(on_distinct(places, lambda s: place_key(s).map(lookup).astype('string')))
+    return out
+
+
+def normalize_geography(df, state='state', city='city', market=None, source=None):
+    '''
+    Returns a copy of `df` with a clean `city` (`Anchorage, AK` -> `Anchorage`)
+    and two letter `state`, counting rows whose state couldn't be resolved.
+    States that can't be resolved are looked up by city, then by market
+    (`market`, or the city when there's no market column).
+    '''
+    df = df.copy()
+    if city in df:
+        df[city], state_from_city = split_place(df[city])
+    else:
+        state_from_city = None
+    raw = df[state] if state in df else pd.Series(pd.NA, index=df.index, dtype='string')
+    places = df[city] if city in df else None
+    # TV sources put the market where the city goes
+    codes_ = normalize_states(raw, places, df[market] if market else places)
+    if state_from_city is not None:
+        codes_ = codes_.fillna(state_from_city)
+    df[state] = codes_.astype(object).where(codes_.notna(), None)
+    unresolved = int(codes_.isna().sum())
+    if source:
+        count('geo_unresolved', unresolved, source=source)
+    else:
+        count('geo_unresolved', unresolved)
+    return df
+
+
+def unresolved(df, state='state', city='city'):
+    '''The raw (state, city) values of `df` that `normalize_geography` can't place.'''
+    out = normalize_geography(df[[c for c in [state, city] if c in df]], state, city)
+    return df.loc[out[state].isna(), [c for c in [state, city] if c in df]].value_counts(dropna=False)
+
+
+@lru_cache(maxsize=None)
+def load_gazetteer(filepath=gazetteer_file):
+    with open(filepath) as f:
+        return json.load(f)
+
+
+# (file, state column, place column, kind of place) in any year's directory
+gazetteer_sources = [
+    ('usnpl.tsv', 'Geography', 'City', 'cities'),
+    ('station_index.tsv', 'state', 'city', 'cities'),
+    ('gray.tsv', 'state', 'city', 'cities'),
+    ('hearst.tsv', 'state', 'city', 'cities'),
+    ('nexstar.tsv', 'state', 'city', 'markets'),
+    ('sinclair.tsv', 'state', 'location', 'markets'),
+]
+
+
+def build_gazetteer(root=data_root):
+    '''
+    Cities and markets with the states they are found in, from the
+    intermediates of every year under `root`.
+    '''
+    pairs = {'cities' : [], 'markets' : []}
+    year_dirs = sorted(glob.glob(os.path.join(root, 'data*', '')))
+    for directory in year_dirs:
+        for filename, state_col, place_col, kind in gazetteer_sources:
+            filepath = os.path.join(directory, filename)
+            if not os.path.exists(filepath):
+                continue
+            df = pd.read_csv(filepath, sep='\t', dtype=str, usecols=lambda c: c in [state_col, place_col])
+            if state_col not in df or place_col not in df:
+                continue
+            place, state_in_place = split_place(df[place_col])
+            found = pd.DataFrame({'key' : place_key(place),
+                                  'state' : on_distinct(df[state_col], state_code).fillna(state_in_place)})
+            found['primary'] = True
+            if kind == 'markets':
+                # every state a market covers: `Mobile, AL / Pensacola, FL`
+                every = df[place_col].astype('string').str.extractall(code_pattern)[0]
+                found = pd.concat([found, pd.DataFrame({'key' : found['key'].reindex(every.index.get_level_values(0)).values,
+                                                        'state' : every.values, 'primary' : False})])
+            pairs[kind].append(found.dropna())
+
+    empty = pd.DataFrame(columns=['key', 'state', 'primary'])
+    cities = pd.concat(pairs['cities'] or [empty])[['key', 'state']].drop_duplicates()
+    # a city in several states (Portland, Springfield) can't tell us the state
+    per_city = cities.groupby('key')['state'].nunique()
+    cities = cities[cities['key'].isin(per_city.index[per_city == 1])].drop_duplicates('key')
+    city_lookup = dict(zip(cities['key'], cities['state']))
+    city_lookup.update({place_key(pd.Series([k])).iloc[0] : v for k, v in city_states.items()})
+
+    markets = pd.concat(pairs['markets'] or [empty]).drop_duplicates()
+    # two markets by one name (Albany, GA and Albany, NY) are left out too
+    per_market = markets[markets['primary']].groupby('key')['state'].nunique()
+    markets = markets[markets['key'].isin(per_market.index[per_market == 1])]
+    markets = markets.sort_values('primary', ascending=False, kind='stable')
+    market_lookup = {k : list(dict.fromkeys(g['state'])) for k, g in markets.groupby('key', sort=True)}
+    market_lookup.update({place_key(pd.Series([k])).iloc[0] : v for k, v in market_states.items()})
+
+    return dict(states=state_codes,
+                cities=dict(sorted(city_lookup.items())),
+                markets=dict(sorted(market_lookup.items())))
+
+
+def write_gazetteer(gazetteer, filepath=gazetteer_file):
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with open(filepath, 'w') as f:
+        json.dump(gazetteer, f, indent=0, sort_keys=False)
+    load_gazetteer.cache_clear()
+
+
+# -- coordinates ------------------------------------------------------------
+
+# columns of a GeoNames dump (cities500.txt and the like) that are kept
+geonames_columns = {1 : 'name', 2 : 'asciiname', 4 : 'lat', 5 : 'lng', 8 : 'country', 10 : 'state', 14 : 'population'}
+
+
+def read_geonames(filepath):
+    '''The US places in a GeoNames cities file, the tab separated dump or the JSON geonamescache ships.'''
+    if filepath.endswith('.json'):
+        with open(filepath) as f:
+            df = pd.DataFrame.from_records(list(json.load(f).values()))
+        df = df.rename(columns={'latitude' : 'lat', 'longitude' : 'lng', 'countrycode' : 'country', 'admin1code' : 'state'})
+        df['asciiname'] = df['name']
+    else:
+        df = pd.read_csv(filepath, sep='\t', header=None, usecols=list(geonames_columns), dtype=str,
+                         quoting=3, keep_default_na=False).rename(columns=geonames_columns)
+    return df.loc[df['country'] == 'US', ['name', 'asciiname', 'state', 'lat', 'lng', 'population']]
+
+
+def build_places(geonames_file):
+    '''
+    Coordinates for every (state, place key), from the most populous place of
+    that name in the state. Places are keyed by name and ASCII name, and
+    `saint`/`st` both ways.
+    '''
+    df = read_geonames(geonames_file)
+    keys = pd.concat([place_key(df['name']), place_key(df['asciiname'])])
+    places = df.loc[keys.index, ['state', 'lat', 'lng', 'population']].assign(place=keys.values)
+    places = pd.concat([places,
+                        places.assign(place=places['place'].str.replace(r'^saint ', 'st ', regex=True)),
+                        places.assign(place=places['place'].str.replace(r'^st ', 'saint ', regex=True))])
+    places['population'] = pd.to_numeric(places['population'])
+    places[['lat', 'lng']] = places[['lat', 'lng']].astype(float).round(5)
+    places = (places[places['place'].fillna('') != '']
+                .sort_values('population', ascending=False, kind='stable')
+                .drop_duplicates(['state', 'place'])
+                .sort_values(['state', 'place']))
+    return places[['state', 'place', 'lat', 'lng', 'population']].reset_index(drop=True)
+
+
+@lru_cache(maxsize=None)
+def load_places(filepath=places_file):
+    '''`places_file` as lat and lng columns indexed by `STATE|place key`.'''
+    df = pd.read_csv(filepath, sep='\t', dtype={'state' : str, 'place' : str}, keep_default_na=False)
+    return df.set_index(df['state'] + '|' + df['place'])[['lat', 'lng']]
+
+
+def geocode(df, state='state', city='city', lat='lat', lng='lng', source=None):
+    '''
+    Returns a copy of `df` with numeric `lat` and `lng`, where rows without
+    coordinates get their city's from `places_file`. A TV market
+    (`Albuquerque-Santa Fe`) gets its first city's. Run it after
+    `normalize_geography`, it expects clean cities and state codes.
+    '''
+    df = df.copy()
+    for c in [lat, lng]:
+        df[c] = pd.to_numeric(df[c], errors='coerce') if c in df else float('nan')
+    missing = df[lat].isna() | df[lng].isna()
+    if missing.any() and city in df and os.path.exists(places_file):
+        places = load_places()
+        states = df.loc[missing, state].astype('string')
+        cities = df.loc[missing, city].astype('string')
+        def lookup(places_):
+            return places.reindex(states.str.cat(place_key(places_), sep='|').fillna('').values).reset_index(drop=True)
+        found = lookup(cities).fillna(lookup(cities.str.split(r'\s*[-/]\s*', regex=True).str[0]))
+        df.loc[missing, lat] = found['lat'].values
+        df.loc[missing, lng] = found['lng'].values
+    labels = dict(source=source) if source else {}
+    count('geocoded', int((missing & df[lat].notna()).sum()), **labels)
+    count('geo_no_coordinates', int(df[lat].isna().sum()), **labels)
+    return df
+
+
+# (file, state column, city column) for the report
+report_sources = {
+    'usnpl' : (usnpl_file, 'Geography', 'City'),
+    'stationindex' : (stationindex_file, 'state', 'city'),
+    'gray' : (gray_file, 'state', 'city'),
+    'hearst' : (hearst_file, 'state', 'city'),
+    'nexstar' : (nexstar_file, 'state', 'city'),
+    'sinclair' : (sinclair_file, 'state', 'location'),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the gazetteer or the places table, or report places the gazetteer cannot resolve.')
+    parser.add_argument('command', choices=['build', 'report', 'places'])
+    parser.add_argument('--root', default=data_root, help='directory holding the data_<year> directories')
+    parser.add_argument('--geonames', help='GeoNames cities file for `places` (default: the one geonamescache ships)')
+    args = parser.parse_args()
+
+    if args.command == 'places':
+        geonames_file = args.geonames
+        if geonames_file is None:
+            try:
+                import geonamescache
+            except ImportError:
+                parser.error('geonamescache is not installed (pip install -r requirements.txt), '
+                             'or pass --geonames cities500.txt from https://download.geonames.org/export/dump/')
+            geonames_file = os.path.join(os.path.dirname(geonamescache.__file__), 'data', 'cities500.json')
+        places = build_places(geonames_file)
+        os.makedirs(os.path.dirname(places_file) or '.', exist_ok=True)
+        places.to_csv(places_file, sep='\t', index=False)
+        load_places.cache_clear()
+        print(f'{len(places)} places written to {places_file}')
+    elif args.command == 'build':
+        gazetteer = build_gazetteer(args.root)
+        write_gazetteer(gazetteer)
+        print(f"{len(gazetteer['cities'])} cities and {len(gazetteer['markets'])} markets written to {gazetteer_file}")
+    else:
+        for source, (filepath, state_col, city_col) in report_sources.items():
+            if not os.path.exists(filepath):
+                continue
+            df = pd.read_csv(filepath, sep='\t', dtype=str)
+            missing = unresolved(df, state_col, city_col)
+            print(f'{source}: {int(missing.sum())} of {len(df)} rows unresolved')
+            if len(missing):
+                print(missing.head(10).to_string(), '\n')
@@ -0,0 +1,137 @@
+import pandas as pd
+
+'''
+Social media handle normalization.
+
+Every source records social accounts differently: usnpl stores full URLs
+(`https://twitter.com/adndotcom`), the custom additions store bare screen names,
+and some entries carry query strings, `#!/` fragments, trailing slashes or the
+newer `x.com` host, and some point at a search, share link or post instead
+of an account. This module canonicalizes those columns with vectorized
+string ops and builds a reverse index from each handle to outlet rows, so
+joining social data against the dataset is a hash lookup.
+'''
+
+# hosts that can prefix a handle for each platform
+platform_hosts = {
+    'twitter' : r'(?:twitter\.com|x\.com)',
+    'facebook' : r'(?:facebook\.com|fb\.com|fb\.me)',
+    'instagram' : r'(?:instagram\.com|instagr\.am)',
+    'youtube' : r'(?:youtube\.com|youtu\.be)',
+}
+
+# what a canonical handle is allowed to look like on each platform
+valid_handle = {
+    'twitter' : r'\w+',
+    'facebook' : r'[\w.\-]+',
+    'instagram' : r'[\w.]+',
+    'youtube' : r'(?:channel/)?[\w.\-]+',
+}
+
+# first path segments that are pages of the platform, not accounts (`twitter.com/search?q=...`)
+reserved_paths = {
+    'twitter' : {'search', 'intent', 'share', 'home', 'hashtag', 'i', 'explore', 'login', 'signup', 'settings',
+                 'messages', 'notifications', 'compose', 'tos', 'privacy', 'who_to_follow'},
+    'facebook' : {'sharer', 'sharer.php', 'share', 'share.php', 'home.php', 'hashtag', 'search', 'groups', 'events',
+                  'watch', 'pages', 'people', 'profile.php', 'permalink.php', 'story.php', 'photo.php', 'media',
+                  'plugins', 'dialog', 'login', 'login.php', 'help', 'policies'},
+    'instagram' : {'p', 'reel', 'reels', 'tv', 'explore', 'stories', 'accounts', 'direct', 'about', 'developer'},
+    'youtube' : {'watch', 'results', 'embed', 'playlist', 'shorts', 'feed', 'redirect', 'attribution_link', 'live',
+                 'about', 'premium', 'channel'},
+}
+
+handle_platforms = list(platform_hosts)
+
+
+def canonicalize_handles(s, platform, casefold=True):
+    '''
+    Turns a column of social media URLs or screen names into canonical handles.
+
+    Works on the whole Series at once, anything that does not look like a handle
+    for `platform` after cleaning becomes NA.
+    '''
+    host = platform_hosts[platform]
+    s = s.astype('string').str.strip()
+
+    # drop the scheme, subdomain and host (sometimes pasted in twice)
+    stripped = s.str.replace(r'^(?:(?:https?:)?/*(?:[\w\-]+\.)*' + host + r'(?:/|$))+', '',
+                             regex=True, case=False)
+    # links to some other website are not handles
+    foreign = (stripped == s) & s.str.contains(r'^(?:https?:|www\.)|\.(?:com|org|net|tv)(?:/|$)',
+                                               case=False, regex=True)
+    s = stripped.mask(foreign.fillna(False))
+    if platform == 'facebook':
+        # numeric profiles only identify themselves in the query string
+        s = s.str.replace(r'^profile\.php\?(?:.*&)?id=(\d+).*$', r'\1', regex=True)
+    s = s.str.replace(r'^#!/', '', regex=True)
+
+    # query strings, fragments and trailing slashes
+    s = s.str.replace(r'[?#].*$', '', regex=True).str.strip('/')
+
+    if platform == 'facebook':
+        s = s.str.replace(r'^pages/(?:[^/]+/)*([^/]+)$', r'\1', regex=True)
+    if platform == 'youtube':
+        s = s.str.replace(r'^(?:user|c)/', '', regex=True)
+        s = s.str.extract(r'^(channel/[^/]+|[^/]+)', expand=False)
+    else:
+        # a column of only NAs comes back as object from pyarrow-backed strings
+        s = s.str.split('/').str[0].astype('string')
+    s = s.str.lstrip('@')
+
+    s = s.where(s.str.fullmatch(valid_handle[platform]).fillna(False) & ~s.str.casefold().isin(reserved_paths[platform]))
+    if casefold:
+        s = s.str.casefold()
+
+    return s
+
+
+def handle_frame(df, platforms=handle_platforms):
+    '''
+    Returns a long frame of (platform, handle, row) for every handle in `df`,
+    where `row` is the index label of the outlet.
+    '''
+    frames = []
+    for platform in platforms:
+        if platform not in df.columns:
+            continue
+        s = canonicalize_handles(df[platform], platform).dropna()
+        frames.append(pd.DataFrame({
+            'platform' : platform,
+            'handle' : s.values,
+            'row' : s.index
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['platform', 'handle', 'row'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def build_handle_index(df, platforms=handle_platforms):
+    '''
+    Builds a case-folded reverse index `{platform: {handle: [rows]}}` over `df`.
+    '''
+    index = {}
+    df_handles = handle_frame(df, platforms)
+    for platform, df_ in df_handles.groupby('platform'):
+        rows = df_['row'].values
+        index[platform] = {
+            handle : rows[positions].tolist()
+            for handle, positions in df_.groupby('handle').indices.items()
+        }
+
+    return index
+
+
+def join_handles(df_stream, column, platform, df_outlets):
+    '''
+    Joins a frame of social media data to the outlets that own each account.
+
+    `column` holds the handle or profile URL in `df_stream`, which is canonicalized
+    in one pass and hash-joined against the handles of `df_outlets`.
+    '''
+    df_handles = handle_frame(df_outlets, [platform])
+    keys = canonicalize_handles(df_stream[column], platform)
+    df_joined = (df_stream.assign(handle=keys.values)
+                          .merge(df_handles[['handle', 'row']], on='handle', how='inner'))
+
+    return df_joined.join(df_outlets, on='row', rsuffix='_outlet')
@@ -0,0 +1,115 @@
+import os
+import json
+
+import pandas as pd
+
+from config import *
+from metrics import count
+
+'''
+Streaming ingestion of JSON and JSONL files (custom additions, vendor drops
+like Gray's station list).
+
+Files are read `ingest_chunk_size` characters at a time and decoded one
+record at a time, whether they hold a JSON array of objects or one object per
+line, so memory doesn't grow with the file. As each record goes by, its keys
+are canonicalized (stripped, lower-cased, then renamed through `aliases`, so
+`twitter_Name` and `twitter_name` both land in `twitter`), and only the
+requested fields are kept, straight into typed columns:
+
+    fields = {'title' : 'string', 'state' : 'string', 'lat' : 'Float64'}
+    df = read_records(gray_additions_file, fields)
+
+    for df in iter_frames(big_vendor_file, fields, chunk_rows=100_000):
+        ...
+
+A requested field that a record lacks is missing (NA) in that row.
+'''
+
+separators = ' \t\r\n,'
+
+
+def iter_json_records(filepath, chunk_size=ingest_chunk_size):
+    '''Yields the objects in a JSON array, or in a JSONL file, one at a time.'''
+    decoder = json.JSONDecoder()
+    buf, pos, eof, first = '', 0, False, True
+    with open(filepath, encoding='utf-8') as f:
+        while True:
+            while pos < len(buf) and buf[pos] in separators:
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    return
+                buf, pos = f.read(chunk_size), 0
+                eof = not buf
+                continue
+            if first:
+                first = False
+                if buf[pos] == '[':
+                    pos += 1
+                    continue
+            if buf[pos] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # a record cut off at the end of the buffer, read on
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def canonical_key(key, aliases):
+    key = key.strip().lower()
+    return aliases.get(key, key)
+
+
+def typed(values, dtype):
+    if pd.api.types.is_numeric_dtype(pd.api.types.pandas_dtype(dtype)):
+        # vendors send numbers as strings ('64.811149880') often enough
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype(dtype)
+    return pd.Series(values, dtype=dtype)
+
+
+def columns_frame(columns, fields):
+    return pd.DataFrame({field : typed(values, fields[field]) for field, values in columns.items()})
+
+
+def iter_frames(filepath, fields, aliases=json_field_aliases, chunk_rows=ingest_chunk_rows):
+    '''
+    Yields DataFrames of up to `chunk_rows` records with one typed column per
+    entry of `fields` ({canonical field : dtype}).
+    '''
+    keys = {}  # raw key -> canonical field, or None when it isn't wanted
+    columns = {field : [] for field in fields}
+    n = total = 0
+    for record in iter_json_records(filepath):
+        row = {}
+        for key, value in record.items():
+            if key not in keys:
+                field = canonical_key(key, aliases)
+                keys[key] = field if field in fields else None
+            field = keys[key]
+            # the first non-null value wins when two spellings of a key are both present
+            if field is not None and row.get(field) is None:
+                row[field] = value
+        for field, values in columns.items():
+            values.append(row.get(field))
+        n += 1
+        if n == chunk_rows:
+            yield columns_frame(columns, fields)
+            columns = {field : [] for field in fields}
+            total, n = total + n, 0
+    if n or not total:
+        yield columns_frame(columns, fields)
+    count('records_ingested', total + n, file=os.path.basename(filepath))
+
+
+def read_records(filepath, fields, aliases=json_field_aliases, chunk_rows=ingest_chunk_rows):
+    '''All of a JSON or JSONL file as one DataFrame, see `iter_frames`.'''
+    return pd.concat(list(iter_frames(filepath, fields, aliases, chunk_rows)), ignore_index=True)
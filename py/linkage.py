@@ -0,0 +1,248 @@
+import os
+import re
+import glob
+import hashlib
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from config import *
+from handles import handle_frame
+from resolve import registered_domain
+
+'''
+Links outlets across yearly builds of the dataset and gives each one a stable ID.
+
+Every `data*/local_news_dataset_YYYY.csv` under the data root is one year.
+Years are processed oldest first against a registry holding the latest record
+of every outlet seen so far. Rather than comparing every pair of rows, each
+year is joined to the registry through inverted indexes on registered domain,
+name tokens and social handles, and only the pairs that share a key are scored.
+
+IDs are kept from one run to the next: each year's rows first take the ID
+they had in the existing crosswalk (matched on name, state and domain, so a
+rebuild that reorders rows changes nothing), then the rest are linked to
+earlier years. Outlets that match neither are new, and their ID is derived
+from the same name, state and domain, `ln-<year>-<hash>`, so a fresh run
+without a crosswalk gives them the same ID too. The crosswalk has one row per
+(outlet_id, year).
+
+    python linkage.py
+    python linkage.py --fresh     # ignore the existing crosswalk
+'''
+
+# share of the score each kind of evidence is worth
+link_weights = {
+    'domain' : 0.35,
+    'handle' : 0.35,
+    'name' : 0.3,
+}
+link_threshold = 0.5
+
+# tokens or domains shared by more outlets than this say nothing about identity
+max_posting_size = 100
+
+name_stopwords = {'the', 'of', 'and', 'a', 'news', 'daily', 'tv', 'com'}
+
+
+def find_yearly_datasets(root=data_root):
+    '''Returns {year: path} for every yearly dataset under `root`.'''
+    found = {}
+    for path in glob.glob(os.path.join(root, 'data*', 'local_news_dataset_*.csv')):
+        m = re.search(r'local_news_dataset_(\d{4})\.csv$', path)
+        if m:
+            found[int(m.group(1))] = path
+    return dict(sorted(found.items()))
+
+
+def name_tokens(names):
+    '''Long frame of (row, token) for the normalized words of each name.'''
+    words = (names.astype('string')
+                  .str.casefold()
+                  .str.replace(r'[^\w\s]', ' ', regex=True)
+                  .str.split())
+    df = words.explode().dropna().rename('key').reset_index().rename(columns={'index' : 'row'})
+    df = df[~df['key'].isin(name_stopwords)].drop_duplicates()
+    return df
+
+
+def postings(df):
+    '''
+    Every (row, key) posting of `df` for the three indexes, keyed by index name.
+    '''
+    df_domain = registered_domain(df['website']).rename('key').reset_index().rename(columns={'index' : 'row'})
+    df_handles = handle_frame(df)
+    df_handles = pd.DataFrame({
+        'row' : df_handles['row'],
+        'key' : df_handles['platform'] + ':' + df_handles['handle']
+    })
+    return {
+        'domain' : df_domain.dropna(),
+        'handle' : df_handles.drop_duplicates(),
+        'name' : name_tokens(df['name']),
+    }
+
+
+def candidate_scores(df_a, df_b):
+    '''
+    Scores every pair of rows in `df_a` x `df_b` that share at least one index key.
+    Returns a frame of (row_a, row_b, score).
+    '''
+    post_a, post_b = postings(df_a), postings(df_b)
+    features = []
+    for index in link_weights:
+        a, b = post_a[index], post_b[index]
+        # drop keys that are too common to mean anything
+        common = b['key'].map(b['key'].value_counts()) > max_posting_size
+        b = b[~common]
+        shared = (a.merge(b, on='key', suffixes=('_a', '_b'))
+                   .groupby(['row_a', 'row_b']).size()
+                   .rename(index))
+        features.append(shared)
+
+    df = pd.concat(features, axis=1).fillna(0)
+    df.index.names = ['row_a', 'row_b']
+    df = df.reset_index()
+
+    # name similarity is the jaccard index of the name tokens
+    n_a = post_a['name'].groupby('row').size()
+    n_b = post_b['name'].groupby('row').size()
+    union = (df['row_a'].map(n_a).fillna(0) + df['row_b'].map(n_b).fillna(0) - df['name'])
+    df['name'] = (df['name'] / union.where(union > 0)).fillna(0)
+    df['domain'] = (df['domain'] > 0).astype(float)
+    df['handle'] = (df['handle'] > 0).astype(float)
+
+    df['score'] = sum(w * df[k] for k, w in link_weights.items())
+
+    # an outlet doesn't move states
+    state_a = df_a['state'].astype('string').str.strip().str.upper()
+    state_b = df_b['state'].astype('string').str.strip().str.upper()
+    same_state = (df['row_a'].map(state_a).values == df['row_b'].map(state_b).values)
+    df = df[np.asarray(pd.Series(same_state).fillna(False), dtype=bool)]
+
+    return df[['row_a', 'row_b', 'score']]
+
+
+def content_keys(df):
+    '''
+    `name|state|domain` of each row, with `#n` appended to the nth repeat
+    (`Daily Journal|CA|dailyjournal.com#1`), in row order.
+    '''
+    key = (df['name'].astype('string').str.strip().str.casefold().fillna('') + '|'
+           + df['state'].astype('string').str.strip().str.upper().fillna('') + '|'
+           + df['domain'].astype('string').fillna(''))
+    repeat = key.groupby(key).cumcount()
+    return key.where(repeat == 0, key + '#' + repeat.astype(str))
+
+
+def new_ids(year, keys):
+    return [f"ln-{year}-{hashlib.sha1(k.encode()).hexdigest()[:10]}" for k in keys]
+
+
+def write_crosswalk(df, path=crosswalk_file):
+    '''Replaces `path` in one step, so builds of other years running meanwhile never read half a file.'''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        df.to_csv(f, index=False)
+    os.replace(tmp, path)
+
+
+def load_crosswalk(path=crosswalk_file):
+    '''The crosswalk of an earlier run, or None.'''
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, dtype={'name' : str, 'state' : str, 'domain' : str, 'outlet_id' : str})
+
+
+def one_to_one(df_scores, threshold=link_threshold):
+    '''
+    Greedily keeps the best scoring pairs so that every row is linked at most
+    once. Ties go by the `tie` column when there is one, else by row order.
+    '''
+    by = ['score'] + [c for c in ['tie'] if c in df_scores]
+    df = df_scores[df_scores['score'] >= threshold].sort_values(by, ascending=[False] + [True] * (len(by) - 1),
+                                                                kind='stable')
+    df = df.drop_duplicates('row_a').drop_duplicates('row_b')
+    # dropping on row_b can free up a row_a whose best pair was taken, those stay unlinked
+    return df
+
+
+def link_years(datasets, threshold=link_threshold, previous=None):
+    '''
+    Builds the crosswalk for `datasets` ({year: path}), keeping the IDs of the
+    `previous` crosswalk (see `load_crosswalk`) for the rows it already has.
+    '''
+    registry = None
+    crosswalk = []
+    for year, path in datasets.items():
+        df = pd.read_csv(path, dtype=str)
+        df_year = pd.DataFrame({
+            'year' : year,
+            'row' : np.arange(len(df)),
+            'name' : df['name'],
+            'state' : df['state'],
+            'domain' : registered_domain(df['website']),
+            'outlet_id' : pd.Series(pd.NA, index=df.index, dtype=object),
+            'linked_year' : np.nan,
+            'confidence' : np.nan,
+        })
+        keys = content_keys(df_year)
+
+        # rows the last run already had keep their ID
+        seeded = 0
+        if previous is not None:
+            df_prev = previous[previous['year'] == year]
+            df_prev = df_prev.set_axis(pd.Index(content_keys(df_prev)))
+            known = keys.isin(df_prev.index).to_numpy()
+            for col in ['outlet_id', 'linked_year', 'confidence']:
+                df_year.loc[known, col] = df_prev.loc[keys[known], col].values
+            seeded = int(known.sum())
+
+        if registry is not None:
+            # the rest are linked to the outlets of earlier years that no row of this year has claimed
+            open_rows = np.flatnonzero(df_year['outlet_id'].isna().to_numpy())
+            open_registry = np.flatnonzero(~registry['outlet_id'].isin(df_year['outlet_id'].dropna()).to_numpy())
+            df_scores = candidate_scores(registry.iloc[open_registry].reset_index(drop=True),
+                                         df.iloc[open_rows].reset_index(drop=True))
+            # ties go by ID and content, not by where the rows happen to be
+            df_scores['tie'] = (registry['outlet_id'].values[open_registry[df_scores['row_a'].values]] + '|'
+                                + keys.values[open_rows[df_scores['row_b'].values]])
+            df_links = one_to_one(df_scores, threshold)
+            matched = open_rows[df_links['row_b'].values]
+            linked = open_registry[df_links['row_a'].values]
+            df_year.loc[matched, 'outlet_id'] = registry['outlet_id'].values[linked]
+            df_year.loc[matched, 'linked_year'] = registry['year'].values[linked]
+            df_year.loc[matched, 'confidence'] = df_links['score'].round(3).values
+            print(f"{year}: {seeded} of {len(df)} outlets kept their ID, linked {len(df_links)} more to earlier years")
+        else:
+            print(f"{year}: {len(df)} outlets, {seeded} kept their ID")
+
+        new = df_year['outlet_id'].isna().to_numpy()
+        df_year.loc[new, 'outlet_id'] = new_ids(year, keys[new])
+
+        crosswalk.append(df_year)
+
+        # the registry holds the latest record of every outlet seen so far
+        df = df.assign(outlet_id=df_year['outlet_id'].values, year=year)
+        registry = df if registry is None else pd.concat([registry, df], ignore_index=True)
+        registry = registry.drop_duplicates('outlet_id', keep='last').reset_index(drop=True)
+
+    return pd.concat(crosswalk, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Link outlets across yearly builds.')
+    parser.add_argument('--root', default=data_root, help='directory holding the data* folders')
+    parser.add_argument('--out', default=crosswalk_file)
+    parser.add_argument('--threshold', type=float, default=link_threshold)
+    parser.add_argument('--fresh', action='store_true', help="don't keep the IDs of the existing crosswalk")
+    args = parser.parse_args()
+
+    datasets = find_yearly_datasets(args.root)
+    previous = None if args.fresh else load_crosswalk(args.out)
+    df_crosswalk = link_years(datasets, args.threshold, previous)
+    write_crosswalk(df_crosswalk, args.out)
+    print(f"Wrote {len(df_crosswalk)} rows to {args.out}")
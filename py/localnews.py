@@ -0,0 +1,171 @@
+import os
+import sys
+import argparse
+
+'''
+One entry point for the Local News Dataset scripts. Run it from the `py` directory:
+
+    python -m localnews scrape usnpl hearst
+    python -m localnews merge --profile
+    python -m localnews query --domain adn.com --state AK
+    python -m localnews query --serve
+    python -m localnews refresh plan
+    python -m localnews queue work usnpl --processes 4
+    python -m localnews bench import
+    python -m localnews --year 2018 merge
+    python -m localnews build 2018 2023 --steps merge docs
+
+Nothing heavy is imported here. Each subcommand imports the modules it needs
+when it runs, so `query` never loads selenium and `scrape gray` never loads
+urlexpander. Keep it that way (`bench import` tracks it).
+
+`--year` and `--data-root` are handed to config through the environment
+before anything imports it, so they apply to every subcommand.
+'''
+
+scrapers = {
+    'sinclair' : 'download_sinclair',
+    'nexstar' : 'download_nexstar',
+    'gray' : 'extract_gray',
+    'hearst' : 'download_hearst',
+    'stationindex' : 'download_stationindex',
+    'usnpl' : 'download_usnpl',
+}
+
+passthrough = ['refresh', 'queue', 'build']
+
+benchmarks = {
+    'import' : 'bench_import',
+    'serve' : 'bench_serve',
+    'resolve' : 'bench_resolve',
+    'urlcheck' : 'bench_urlcheck',
+    'merge' : 'bench_merge',
+    'parsers' : 'bench_parsers',
+    'client' : 'bench_client',
+    'spatial' : 'bench_spatial',
+    'neardup' : 'bench_neardup',
+}
+
+
+def scrape(args):
+    import download_data
+    from fetch import RunBudget
+    from metrics import write_report
+
+    sources = list(scrapers) if 'all' in args.sources else args.sources
+    budget = RunBudget(args.budget, hedge=args.hedge) if args.budget else None
+    download_data.scrape_sources({s : getattr(download_data, scrapers[s]) for s in sources}, budget)
+    write_report('scrape')
+
+
+def merge(args):
+    import merge
+    merge.merge_tv_and_media(check_links=args.check_links)
+
+
+def query(args):
+    import json
+    import asyncio
+    import serve
+
+    if args.serve:
+        asyncio.run(serve.serve(port=args.port or serve.serve_port,
+                                filepath=args.file or serve.local_news_dataset_file))
+        return
+
+    index = serve.OutletIndex(args.file or serve.local_news_dataset_file)
+    results = {}
+    for kind in serve.lookup_kinds:
+        for key in getattr(args, kind) or []:
+            results.setdefault(kind, {})[key] = index.lookup(kind, key)
+    json.dump(results, sys.stdout, indent=2, default=str)
+    print()
+
+
+def refresh(args):
+    import refresh
+    refresh.main(args.rest)
+
+
+def queue(args):
+    import workqueue
+    workqueue.main(args.rest)
+
+
+def build(args):
+    import builds
+    builds.main(args.rest)
+
+
+def bench(args):
+    import runpy
+    sys.argv = [benchmarks[args.name] + '.py'] + args.bench_args
+    runpy.run_module(benchmarks[args.name], run_name='__main__')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m localnews', description='Build and query the Local News Dataset.')
+    parser.add_argument('--profile', action='store_true', help='profile each stage (see profiling.py)')
+    parser.add_argument('--year', type=int, help='which year to build (default: config.year)')
+    parser.add_argument('--data-root', help='directory holding the data_<year> directories (default: config.data_root)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('scrape', help='download intermediates from one or more sources')
+    p.add_argument('sources', nargs='+', choices=list(scrapers) + ['all'])
+    p.add_argument('--budget', type=float, help='stop after this many seconds, with partial results')
+    p.add_argument('--hedge', action='store_true', help='resend slow requests (with --budget)')
+    p.set_defaults(func=scrape)
+
+    p = sub.add_parser('merge', help='merge the intermediates into the dataset')
+    p.add_argument('--check-links', action='store_true', help='resolve redirects and check every website is alive')
+    p.set_defaults(func=merge)
+
+    p = sub.add_parser('query', help='look up outlets, or serve lookups over HTTP')
+    p.add_argument('--domain', nargs='+')
+    p.add_argument('--state', nargs='+')
+    p.add_argument('--owner', nargs='+')
+    p.add_argument('--file', default=None, help='dataset csv (default: config.local_news_dataset_file)')
+    p.add_argument('--serve', action='store_true', help='start the HTTP lookup service')
+    p.add_argument('--port', type=int)
+    p.set_defaults(func=query)
+
+    p = sub.add_parser('refresh', help='re-scrape only what has probably changed (see refresh.py)')
+    p.set_defaults(func=refresh)
+
+    p = sub.add_parser('queue', help='distribute the usnpl/stationindex crawls (see workqueue.py)')
+    p.set_defaults(func=queue)
+
+    p = sub.add_parser('build', help='build several years in parallel (see builds.py)')
+    p.set_defaults(func=build)
+
+    p = sub.add_parser('bench', help='run a benchmark script')
+    p.add_argument('name', choices=list(benchmarks))
+    p.add_argument('bench_args', nargs=argparse.REMAINDER)
+    p.set_defaults(func=bench)
+
+    # refresh, queue and build hand everything after them to their own module's parser
+    argv = sys.argv[1:] if argv is None else list(argv)
+    command = 0
+    while command < len(argv) and argv[command].startswith('-'):
+        command += 2 if argv[command] in ['--year', '--data-root'] else 1
+    rest = []
+    if command < len(argv) and argv[command] in passthrough:
+        argv, rest = argv[:command + 1], argv[command + 1:]
+    args = parser.parse_args(argv)
+    args.rest = rest
+    if args.year:
+        os.environ['LOCAL_NEWS_YEAR'] = str(args.year)
+    if args.data_root:
+        os.environ['LOCAL_NEWS_DATA_ROOT'] = args.data_root
+    if args.profile:
+        import profiling
+        profiling.enable()
+
+    args.func(args)
+
+    if args.profile:
+        profiling.dump_profiles()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,23 @@
 import re
-import json
+import sys
+import sqlite3
+import hashlib
 
+import numpy as np
 import pandas as pd
-from tqdm import tqdm as tqdm
-import urlexpander
 
 from config import *
+from handles import canonicalize_handles, handle_frame
+from snapshots import record_snapshot
+from resolve import resolve_stations
+from cube import write_cube
+from owners import build_owner_index, infer_owners
+from ingest import read_records
+from geo import normalize_geography, geocode
+from neardup import near_duplicates
+from linkage import content_keys
+from metrics import span, count, write_report
+import profiling
 
 '''
 Updated Version
@@ -31,29 +43,52 @@ def remove_www(site_str):
 
    
 def load_custom_stations(filepath):
-    '''Reads a json file with custom station info.'''
-    data = []
-    with open(filepath, 'r') as f:
-        for row in f: 
-            data.append(json.loads(row))
-    df_ = pd.DataFrame(data)
+    '''Reads a json file with custom station info, see ingest.py.'''
+    df_ = read_records(filepath, custom_fields)
     df_['collection_date'] = today
     
     return df_
 
 def get_domain(url):
     '''Returns the domain name for any given url.'''
+    # urlexpander is slow to import, only pay for it when merging
+    import urlexpander
     if isinstance(url, str):
         return urlexpander.get_domain(url) 
     
-def process_twitter_name(name):
-    '''cleans up twitter name fields'''
-    if isinstance(name, str):
-        return name.split('/twitter.com/')[-1].lstrip('@')
+def get_domains(websites, cache_file=domain_cache_file):
+    '''
+    `get_domain` for a column of websites. Each distinct website is only
+    parsed once, ever: results are kept in a SQLite cache shared by every
+    year's build.
+    '''
+    distinct = [w for w in websites.dropna().unique() if isinstance(w, str)]
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    db = sqlite3.connect(cache_file, timeout=cache_lock_timeout)
+    try:
+        db.execute('pragma journal_mode=wal')
+        db.execute('create table if not exists domains (website text primary key, domain text)')
+        domains = {}
+        for i in range(0, len(distinct), 500):
+            chunk = distinct[i:i + 500]
+            domains.update(db.execute(
+                f"select website, domain from domains where website in ({','.join('?' * len(chunk))})", chunk))
+        todo = [w for w in distinct if w not in domains]
+        count('domain_cache', len(distinct) - len(todo), result='hit')
+        count('domain_cache', len(todo), result='miss')
+        if todo:
+            fresh = {w : get_domain(w) for w in todo}
+            db.executemany('insert or replace into domains values (?, ?)', fresh.items())
+            db.commit()
+            domains.update(fresh)
+    finally:
+        db.close()
+    return websites.map(domains)
 
-def merge_stations():
+def load_stations():
     '''
-    To be run after `download_data.py`, opens the newly downloaded TV station data, and returns a merged dataframe.
+    Opens the newly downloaded TV station data and stacks it into one frame,
+    lowest priority source first.
     '''
     # load the files
     df_gray = pd.read_csv(gray_file, sep='\t')
@@ -72,38 +107,72 @@ def merge_stations():
     df_hearst = df_hearst.drop('name', axis=1)
 
     # merge the files
-    df_super = (df_stationindex.append(df_gray)
-                    .append(df_nexstar)
-                    .append(df_hearst)
-                    .append(df_sinclair))
+    df_super = pd.concat([df_stationindex, df_gray, df_nexstar, df_hearst, df_sinclair], 
+                         ignore_index=True)
+    df_super = normalize_geography(df_super, source='stations')
+    df_super['station'] = df_super['station'].str.strip()
     
-    # standardize the domain names
-    df_super['website_standard'] = df_super['website'].fillna('').apply(remove_www)
-
-    # Here we're dropping duplicates (prioritizing parent company info)
-    df_tv = pd.DataFrame()
-    for state, df_ in df_super.groupby('state'):
-        #if state == 'MO':
-        #    df_ = df_[df_['website_standard']!='fox4kc.com']
-        df_tv = df_tv.append(
-            df_.drop_duplicates(subset=['station', 'website_standard'], 
-                                keep='last'))
+    return df_super
+
+
+def merge_stations():
+    '''
+    To be run after `download_data.py`, opens the newly downloaded TV station data, and returns a merged dataframe.
+    '''
+    with span('merge', stage='load_stations') as s:
+        df_super = load_stations()
+        s['rows'] = len(df_super)
+
+    # Here we're collapsing the same station found in several sources (prioritizing parent company info)
+    with span('merge', stage='dedupe') as s:
+        df_tv = resolve_stations(df_super)
+        s['rows'] = len(df_tv)
+        s['rows_deduped'] = len(df_super) - len(df_tv)
+    
+    # stations we can't place in a state are left out
+    df_tv = df_tv[df_tv['state'].notna()]
+    count('rows_dropped', len(df_super) - s['rows_deduped'] - len(df_tv), reason='no_state')
     
     # set some new columns
     df_tv['medium'] = 'TV station'
-    df_tv['state'] = df_tv['state'].replace(look_up)
         
     return df_tv
 
 
-def merge_tv_and_media():
+def mark_near_duplicates(df):
+    '''
+    (cluster, canonical) for each row of `df`, see neardup.py; TV stations are
+    their own cluster. A cluster's ID is a hash of its canonical row's name,
+    state and domain (`linkage.content_keys`), so adding or removing a row
+    leaves the IDs of the other clusters as they were.
+    '''
+    papers = (df['medium'] != 'TV station').to_numpy()
+    marked = near_duplicates(df[papers])
+    labels = marked['cluster'].to_numpy()
+    best = marked['canonical'].to_numpy()
+
+    # 48 bits, so the IDs survive readers that parse numbers as doubles
+    keys = np.array([int(hashlib.sha1(k.encode()).hexdigest()[:12], 16)
+                     for k in content_keys(df.reset_index(drop=True))], dtype=np.int64)
+    cluster = keys.copy()
+    cluster[papers] = pd.Series(keys[papers][best], index=labels[best]).loc[labels].to_numpy()
+    canonical = np.ones(len(df), dtype=bool)
+    canonical[papers] = best
+    return cluster, canonical
+
+
+def merge_tv_and_media(check_links=False):
     '''
     Takes merged station data and newspapers and joins them together.
+    With `check_links`, every website is validated and resolved (see urlcheck.py)
+    and the final URL and liveness are written into the dataset.
     '''
     # load files
     df_tv = merge_stations()
-    df_usnpl = pd.read_csv(usnpl_file, sep='\t')
-    df_custom = load_custom_stations(custom_station_file)
+    with span('merge', stage='load_media') as s:
+        df_usnpl = pd.read_csv(usnpl_file, sep='\t')
+        df_custom = load_custom_stations(custom_station_file)
+        s['rows'] = len(df_usnpl) + len(df_custom)
     
     # add new columns
     df_tv['youtube'] = None
@@ -111,7 +180,19 @@ def merge_tv_and_media():
     df_usnpl['source'] = 'usnpl.com'
     df_custom['source'] = 'User Input'
     df_custom[['city', 'instagram', 'address', 'editor', 'phone']] = None
-    df_usnpl['owner'] = None # this can be a future function that looks up known owners.
+    # only some sources have coordinates, the rest are geocoded by city below
+    for df_ in [df_tv, df_usnpl, df_custom]:
+        for c in ['lat', 'lng']:
+            if c not in df_:
+                df_[c] = None
+
+    # usnpl doesn't list owners, look them up from known domains and names
+    with span('merge', stage='owners') as s:
+        owner_index = build_owner_index()
+        owner_index.to_csv(owner_index_file, sep='\t', index=False)
+        df_usnpl = infer_owners(df_usnpl, 'Website', 'Name', 'Geography', index=owner_index)
+        s['rows'] = len(df_usnpl)
+        s['matched'] = int(df_usnpl['owner'].notna().sum())
     
     # normalize column names
     df_usnpl.columns = [c.lower() for c in df_usnpl.columns]
@@ -124,29 +205,71 @@ def merge_tv_and_media():
     print(df_tv.columns)
 
     # append the dataframes
-    df_state = df_tv[cols].append(df_usnpl[cols])
-    df_state = df_state[cols].append(df_custom[cols])
+    df_state = pd.concat([df_tv[cols], df_usnpl[cols], df_custom[cols]])
 
     print(df_state)
     
     # create a domain column
-    df_state['domain'] = df_state['website'].apply(get_domain)
-    df_state['twitter'] = df_state['twitter'].apply(process_twitter_name)
-    df_state['state'] = df_state['state'].str.upper()
-    df_state = df_state[~df_state.domain.isin(not_actually_local)]
-
+    with span('merge', stage='domain_extraction') as s:
+        df_state['domain'] = get_domains(df_state['website'])
+        s['rows'] = len(df_state)
     
-    # write the results to a csv
-    df_state[cols_final].to_csv(local_news_dataset_file.replace('.csv', '_with_national.csv'), index=False)
-    
-    # filter out national domains 
-    filter_out = urlexpander.datasets.load_us_national_media_outlets().tolist()
-    df_state = df_state[~df_state['domain'].isin(filter_out)]
-    
-    df_state['owner'] = df_state['owner'].str.lstrip(' ')
+    with span('merge', stage='normalize') as s:
+        df_state['twitter'] = canonicalize_handles(df_state['twitter'], 'twitter', casefold=False)
+        df_state = normalize_geography(df_state, source='dataset')
+        df_state = geocode(df_state, source='dataset')
+        n = len(df_state)
+        df_state = df_state[~df_state.domain.isin(not_actually_local)]
+        count('rows_dropped', n - len(df_state), reason='not_actually_local')
+
+    # the same paper listed under several cities or spellings, see neardup.py.
+    # Every listing is kept; rows of one outlet share a `cluster`, and one of them is `canonical`
+    with span('merge', stage='near_duplicates') as s:
+        df_state['cluster'], df_state['canonical'] = mark_near_duplicates(df_state)
+        s['rows'] = int((df_state['medium'] != 'TV station').sum())
+        s['near_duplicates'] = int((~df_state['canonical']).sum())
+
+    cols_out = cols_final
+    if check_links:
+        from urlcheck import check_urls
+        with span('merge', stage='link_check') as s:
+            df_state = check_urls(df_state, 'website')
+            s['rows'] = len(df_state)
+            s['alive'] = int(df_state['website_alive'].sum())
+        cols_out = cols_final + cols_link_check
+
+    with span('merge', stage='write') as s:
+        # write the results to a csv
+        df_state[cols_out].to_csv(local_news_dataset_file.replace('.csv', '_with_national.csv'), index=False)
+        
+        # filter out national domains 
+        import urlexpander
+        filter_out = urlexpander.datasets.load_us_national_media_outlets().tolist()
+        n = len(df_state)
+        df_state = df_state[~df_state['domain'].isin(filter_out)]
+        count('rows_dropped', n - len(df_state), reason='national')
+        
+        df_state['owner'] = df_state['owner'].str.lstrip(' ')
+        
+        # write the results to a csv
+        df_state = df_state.reset_index(drop=True)
+        df_state[cols_out].to_csv(local_news_dataset_file, index=False)
+        s['rows'] = len(df_state)
+        
+        # handle -> row lookup for joining social media data
+        handle_frame(df_state).to_csv(handle_index_file, index=False, sep='\t')
+
+    # counts and cardinalities for the docs and dashboards
+    with span('merge', stage='cube') as s:
+        cube = write_cube(df_state[cols_out])
+        s['rows'] = len(cube['counts']['n'])
     
-    # write the results to a csv
-    df_state[cols_final].to_csv(local_news_dataset_file, index=False)
+    # keep this build around so it can be diffed against the next one
+    record_snapshot(local_news_dataset_file)
+    write_report('merge')
+    profiling.dump_profiles()
     
 if __name__ == "__main__":
-    merge_tv_and_media()
+    if '--profile' in sys.argv:
+        profiling.enable()
+    merge_tv_and_media(check_links='--check-links' in sys.argv)
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import socket
+from contextlib import contextmanager
+from collections import defaultdict
+
+from config import *
+from profiling import profile_stage
+
+'''
+Lightweight instrumentation for the scrape -> merge pipeline.
+
+Code marks up what it does with timing spans and counters:
+
+    with span('page', source='usnpl', state='ak') as s:
+        r = fetch(url, 'usnpl')
+        s['rows'] = len(rows)
+
+    count('rows_deduped', 12, source='usnpl')
+
+At the end of a run `write_report()` dumps everything as a JSON run report and
+as a Prometheus textfile (for node_exporter's textfile collector), so each
+nightly refresh can be graphed and compared against the last one.
+
+With `LOCAL_NEWS_TRACK_MEMORY=1` (Linux only) every span also records the peak
+resident memory of the process while it ran, as `peak_rss_mb`. The kernel's
+high-water mark is reset when a span starts, which costs next to nothing,
+unlike tracemalloc.
+'''
+
+track_memory = os.environ.get('LOCAL_NEWS_TRACK_MEMORY', '') not in ('', '0')
+
+run = dict(
+    started = time.time(),
+    host = socket.gethostname(),
+    spans = [],
+    counters = defaultdict(float),
+)
+
+_stack = []
+
+
+def _reset_peak_rss():
+    '''Resets the process's peak RSS (VmHWM) to its current RSS.'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _key(name, labels):
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+@contextmanager
+def span(name, **labels):
+    '''
+    Times the enclosed block. Yields a dict that extra attributes
+    (rows, bytes...) can be written to. With profiling on, the block is also
+    profiled as its `stage` label (or its name).
+    '''
+    attrs = {}
+    record = dict(name=name, labels=labels, parent=_stack[-1]['name'] if _stack else None,
+                  start=time.time(), attrs=attrs)
+    _stack.append(record)
+    if track_memory:
+        _reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        with profile_stage(labels.get('stage', name)):
+            yield attrs
+    except Exception as e:
+        record['error'] = repr(e)
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        if track_memory:
+            # a nested span resets the high-water mark, so take the larger of ours and theirs
+            peak = max(_peak_rss_mb() or 0, record.pop('child_peak_rss_mb', 0))
+            attrs['peak_rss_mb'] = round(peak, 1)
+        _stack.pop()
+        if track_memory and _stack:
+            parent = _stack[-1]
+            parent['child_peak_rss_mb'] = max(parent.get('child_peak_rss_mb', 0), peak)
+        run['spans'].append(record)
+        count(f'{name}_seconds', record['seconds'], **labels)
+        count(f'{name}_total', 1, **labels)
+        for k, v in attrs.items():
+            if isinstance(v, (int, float)):
+                count(f'{name}_{k}', v, **labels)
+
+
+def count(metric, value=1, **labels):
+    '''Adds `value` to a labelled counter.'''
+    run['counters'][_key(metric, labels)] += value
+
+
+def record_response(source, r, seconds):
+    '''Counts bytes, status codes and time spent fetching for one HTTP response.'''
+    count('http_requests', 1, source=source, status=r.status_code)
+    count('http_bytes', len(r.content), source=source)
+    count('http_seconds', seconds, source=source)
+
+
+def summary():
+    '''The run as a JSON-serializable dict.'''
+    counters = defaultdict(list)
+    for (metric, labels), value in run['counters'].items():
+        counters[metric].append(dict(labels=dict(labels), value=value))
+
+    return dict(
+        host = run['host'],
+        started = datetime.datetime.fromtimestamp(run['started']).isoformat(),
+        seconds = time.time() - run['started'],
+        counters = counters,
+        spans = run['spans'],
+    )
+
+
+def _escape(v):
+    return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(prefix='local_news_'):
+    '''The counters in the Prometheus text exposition format.'''
+    lines = []
+    by_metric = defaultdict(list)
+    for (metric, labels), value in run['counters'].items():
+        by_metric[metric].append((labels, value))
+
+    for metric, series in sorted(by_metric.items()):
+        name = prefix + metric
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in series:
+            label_str = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f'{name}{{{label_str}}} {value}' if label_str else f'{name} {value}')
+    lines.append(f'# TYPE {prefix}run_timestamp_seconds gauge')
+    lines.append(f'{prefix}run_timestamp_seconds {run["started"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(name, report_dir=metrics_dir):
+    '''
+    Writes `<name>_<timestamp>.json` and `<name>.prom` to `report_dir`.
+    The .prom file is replaced atomically so a collector never reads half of it.
+    '''
+    os.makedirs(report_dir, exist_ok=True)
+    stamp = datetime.datetime.fromtimestamp(run['started']).strftime('%Y%m%d_%H%M%S')
+
+    json_file = os.path.join(report_dir, f'{name}_{stamp}.json')
+    with open(json_file, 'w') as f:
+        json.dump(summary(), f, indent=2, default=str)
+
+    prom_file = os.path.join(report_dir, f'{name}.prom')
+    with open(prom_file + '.tmp', 'w') as f:
+        f.write(prometheus_text())
+    os.replace(prom_file + '.tmp', prom_file)
+
+    print(f"Wrote run report to {json_file}")
+    return json_file, prom_file
@@ -0,0 +1,318 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import *
+from handles import canonicalize_handles, handle_platforms
+from resolve import UnionFind
+from metrics import span, count
+
+'''
+Near-duplicate detection for newspapers and the other non-TV outlets.
+
+usnpl lists one paper under several cities of a state (`BizWest` in Boulder
+and in Fort Collins), and the custom lists repeat usnpl entries with their
+own spelling of the name and website. None of it matches exactly, and comparing every
+row to every other one doesn't scale once the custom lists grow, so
+candidate pairs come from locality-sensitive hashing instead:
+
+- each name is cut into `shingle_size` character shingles and summarized by
+  a MinHash signature of `bands` x `rows_per_band` values. Two names land in
+  the same bucket of a band with a probability that rises steeply with the
+  Jaccard similarity of their shingles (about 0.93 at 0.5, 0.4 at 0.3).
+- rows sharing a website (host and path, so `liherald.com/merrick` and
+  `liherald.com/malverne` are different papers) or a social handle are
+  bucketed together as well.
+
+Every bucket is per state: a paper listed in two states (`Texarkana Gazette`
+in AR and TX, `Kansas City Star` in KS and MO) serves both, and is kept in
+both. Only pairs in a common bucket are scored, like resolve.py does for
+stations: name similarity (estimated from the signatures), plus a shared
+website or handle, minus a conflicting website. Pairs with names at least
+`min_name_similarity` alike that score `match_threshold` or more are
+clustered with union-find, unless one name has its own city in it and the
+other doesn't (`Danville News Gazette` is an edition of the `News-Gazette`,
+not the same paper).
+
+The canonical row of a cluster is the one whose city is in its name or
+website (the `Kansas City Star` in Kansas City), then the most complete one.
+
+    df = near_duplicates(df)            # adds `cluster` and `canonical`
+
+    python neardup.py                   # the usnpl clusters, largest first
+'''
+
+shingle_size = 3
+bands = 20
+rows_per_band = 3
+# buckets bigger than this say nothing (every `Daily News` in Texas, say) and are skipped
+max_bucket_size = 50
+
+match_weights = {
+    'name' : 0.5,
+    'website' : 0.4,
+    'handle' : 0.3,
+}
+conflict_penalties = {
+    'website' : 0.3,
+}
+match_threshold = 0.7
+# and whatever else they share, two outlets need names at least this alike;
+# editions of one paper group often share a website and handles
+min_name_similarity = 0.5
+
+# MinHash permutations are (a * x + b) mod prime, seeded so signatures are stable
+prime = (1 << 31) - 1
+seed = 303
+
+# pairs scored at once, bounds the memory for the signature comparison
+score_chunk = 250_000
+
+
+def normalize_names(names):
+    '''`The Moscow-Pullman Daily News` -> `moscow pullman daily news`'''
+    return (names.astype('string')
+                 .str.lower()
+                 .str.replace(r'^the\s+', '', regex=True)
+                 .str.replace(r'[^a-z0-9 ]', ' ', regex=True)
+                 .str.replace(r'\s+', ' ', regex=True)
+                 .str.strip())
+
+
+def shingles(names, k=shingle_size):
+    '''
+    Every `k` character shingle of every name as an integer, and the position
+    of the row it came from. Names are padded with a space on each side, so
+    words at the edges count as much as the ones inside.
+    '''
+    text = (' ' + normalize_names(names).fillna('') + ' ').astype(object)
+    lengths = text.str.len().to_numpy()
+    buf = np.frombuffer(''.join(text).encode('ascii'), dtype=np.uint8).astype(np.int64)
+    ends = np.cumsum(lengths)
+    row = np.repeat(np.arange(len(text)), lengths)
+    start = np.arange(len(buf))
+    valid = start + k <= ends[row]
+    start = start[valid]
+    codes = np.zeros(len(start), dtype=np.int64)
+    for i in range(k):
+        codes = (codes << 8) | buf[start + i]
+    return codes, row[valid]
+
+
+def minhash(codes, row, n_rows, num_perm=bands * rows_per_band, seed=seed):
+    '''
+    (n_rows x num_perm) MinHash signatures of the shingle sets. Rows without
+    shingles get `prime` everywhere, and are told apart by `has_name`.
+    '''
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, prime, num_perm, dtype=np.int64)
+    b = rng.integers(0, prime, num_perm, dtype=np.int64)
+    # only the distinct shingles are hashed, there are a few thousand of them
+    inverse, unique = pd.factorize(codes)
+    hashed = ((a[:, None] * (unique[None, :] % prime) + b[:, None]) % prime).astype(np.uint32)
+
+    signatures = np.full((n_rows, num_perm), prime, dtype=np.uint32)
+    rows_with, starts = np.unique(row, return_index=True)
+    for p in range(num_perm):
+        signatures[rows_with, p] = np.minimum.reduceat(hashed[p][inverse], starts)
+    return signatures
+
+
+def band_keys(signatures, states):
+    '''One bucket key per row and band, from the band's slice of the signature and the state.'''
+    state_codes = pd.factorize(states.astype('string'))[0].astype(np.uint64)
+    keys = []
+    with np.errstate(over='ignore'):
+        for band in range(bands):
+            key = state_codes * np.uint64(0x9E3779B97F4A7C15)
+            for value in signatures[:, band * rows_per_band:(band + 1) * rows_per_band].T:
+                key = (key ^ value.astype(np.uint64)) * np.uint64(0x100000001B3)
+            keys.append(key)
+    return keys
+
+
+def bucket_pairs(keys, max_size=max_bucket_size):
+    '''Pairs of positions (i < j) sharing a key, for keys shared by 2 to `max_size` rows; NA keys are ignored.'''
+    keys = pd.Series(keys)
+    pos = np.flatnonzero(keys.notna().to_numpy())
+    codes = pd.factorize(keys.iloc[pos])[0]
+    order = np.argsort(codes, kind='stable')
+    codes, pos = codes[order], pos[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.empty(0, dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(codes)])
+    pairs = [np.empty((0, 2), dtype=np.int64)]
+    # buckets of one size at a time, so their pairs come from one triangle of offsets
+    for size in np.unique(sizes[(sizes > 1) & (sizes <= max_size)]):
+        first = starts[sizes == size][:, None]
+        i, j = np.triu_indices(size, k=1)
+        pairs.append(np.stack([pos[first + i].ravel(), pos[first + j].ravel()], axis=1))
+    return np.concatenate(pairs)
+
+
+def site_key(websites):
+    '''`https://www.BizWest.com/` -> `bizwest.com`, `http://liherald.com/merrick?p=1` -> `liherald.com/merrick`'''
+    site = (websites.astype('string')
+                    .str.strip()
+                    .str.lower()
+                    .str.replace(r'^(?:[a-z]+://)?(?:www\d?\.)?', '', regex=True)
+                    .str.replace(r'[?#].*$', '', regex=True)
+                    .str.rstrip('/'))
+    # a bare hosting platform says nothing
+    return site.mask(site.isin(shared_hosts) | (site == ''))
+
+
+def normalize_cities(cities):
+    '''`Texarkana, AR` -> `texarkana`, `Coeur d'Alene` -> `coeur d alene`'''
+    return normalize_names(cities.astype('string').str.replace(r',\s*[A-Za-z]{2}\s*$', '', regex=True))
+
+
+def features(df, name='name', website='website', state='state', city='city', platforms=handle_platforms):
+    '''The normalized fields candidates and scores are made of.'''
+    def column(col, normalize):
+        values = normalize(df[col]) if col in df else pd.Series(pd.NA, index=df.index, dtype='string')
+        return values.reset_index(drop=True)
+
+    return dict(
+        name = column(name, normalize_names),
+        website = column(website, site_key),
+        # rows without a state share the '' state, so they are only matched with each other
+        state = column(state, lambda s: s.astype('string').str.strip().str.upper()).fillna(''),
+        city = column(city, normalize_cities),
+        handles = {p : canonicalize_handles(df[p], p).reset_index(drop=True) for p in platforms if p in df},
+    )
+
+
+def candidate_pairs(signatures, has_name, feats):
+    pairs = [bucket_pairs(pd.Series(key).where(has_name)) for key in band_keys(signatures, feats['state'])]
+    pairs.append(bucket_pairs(feats['website'] + '|' + feats['state']))
+    for platform, handles in feats['handles'].items():
+        pairs.append(bucket_pairs(handles + '|' + feats['state']))
+    # one int64 per pair, sorted, so the pairs found twice are next to each other
+    n = len(has_name)
+    pairs = np.sort(np.concatenate(pairs) @ np.array([n, 1], dtype=np.int64))
+    pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]] if len(pairs) else pairs
+    return np.stack([pairs // n, pairs % n], axis=1)
+
+
+def score_pairs(pairs, signatures, has_name, feats):
+    '''Similarity score of each candidate pair, see `match_weights` and `conflict_penalties`.'''
+    a, b = pairs[:, 0], pairs[:, 1]
+    name = np.zeros(len(pairs))
+    for start in range(0, len(pairs), score_chunk):
+        chunk = slice(start, start + score_chunk)
+        name[chunk] = (signatures[a[chunk]] == signatures[b[chunk]]).mean(axis=1)
+    name *= has_name[a] & has_name[b]
+
+    def equal(s):
+        codes = pd.factorize(s)[0]
+        return (codes[a] == codes[b]) & (codes[a] >= 0)
+
+    def conflict(s):
+        codes = pd.factorize(s)[0]
+        return (codes[a] != codes[b]) & (codes[a] >= 0) & (codes[b] >= 0)
+
+    shared_handle = np.zeros(len(pairs), dtype=bool)
+    for handles in feats['handles'].values():
+        shared_handle |= equal(handles)
+
+    score = (match_weights['name'] * name
+             + match_weights['website'] * equal(feats['website'])
+             + match_weights['handle'] * shared_handle
+             - conflict_penalties['website'] * conflict(feats['website']))
+    return np.where((name >= min_name_similarity) & equal(feats['state']), score, 0)
+
+
+def contains(text, phrase):
+    '''Whether `phrase` is a run of whole words of `text`.'''
+    return isinstance(text, str) and isinstance(phrase, str) and phrase != '' and f' {phrase} ' in f' {text} '
+
+
+def mentions(text, phrase):
+    '''Whether `phrase` is in `text`, give or take one mistyped letter.'''
+    if contains(text, phrase):
+        return True
+    if not isinstance(text, str) or not isinstance(phrase, str) or phrase == '':
+        return False
+    k = len(phrase)
+    return any(sum(x != y for x, y in zip(text[i:i + k], phrase)) <= 1 for i in range(len(text) - k + 1))
+
+
+def editions(pairs, feats):
+    '''
+    Which pairs are editions rather than duplicates: one name has its own
+    city in it and the other doesn't (`Danville News Gazette` in Danville and
+    `News-Gazette` in Champaign).
+    '''
+    names = feats['name'].to_numpy(dtype=object)
+    # `West Valley Journal` is the paper of West Valley City
+    cities = feats['city'].str.replace(r' city$', '', regex=True).to_numpy(dtype=object)
+
+    def own_city_only(i, j):
+        return contains(names[i], cities[i]) and not mentions(names[j], cities[i])
+
+    return np.array([own_city_only(i, j) or own_city_only(j, i) for i, j in pairs], dtype=bool)
+
+
+def city_rank(feats):
+    '''2 for rows with their city in their name, 1 for it in their website, 0 otherwise.'''
+    names, cities = feats['name'].to_numpy(dtype=object), feats['city'].to_numpy(dtype=object)
+    in_name = np.array([contains(n, c) for n, c in zip(names, cities)], dtype=bool)
+    city_slug = feats['city'].str.replace(' ', '', regex=False)
+    in_site = np.array([isinstance(w, str) and isinstance(c, str) and c != '' and c in w
+                        for w, c in zip(feats['website'].str.replace(r'[^a-z0-9]', '', regex=True), city_slug)],
+                       dtype=bool)
+    return 2 * in_name + in_site
+
+
+def near_duplicates(df, threshold=match_threshold, name='name', website='website', state='state', city='city'):
+    '''
+    Returns `df` with a `cluster` label per row (rows that are the same
+    outlet share one) and `canonical`, True for the one row of each cluster
+    that stands for it: the one whose city is in its name, else in its
+    website, then the one with the most fields filled in, the first of
+    those on a tie.
+    '''
+    with span('near_duplicates', stage='signatures'):
+        codes, row = shingles(df[name])
+        signatures = minhash(codes, row, len(df))
+        has_name = np.zeros(len(df), dtype=bool)
+        has_name[row] = True
+        feats = features(df, name, website, state, city)
+    with span('near_duplicates', stage='candidates') as s:
+        pairs = candidate_pairs(signatures, has_name, feats)
+        s['pairs'] = len(pairs)
+    with span('near_duplicates', stage='cluster') as s:
+        uf = UnionFind(len(df))
+        if len(pairs):
+            matched = pairs[score_pairs(pairs, signatures, has_name, feats) >= threshold]
+            for i, j in matched[~editions(matched, feats)]:
+                uf.union(i, j)
+        labels = uf.labels()
+        s['clusters'] = len(np.unique(labels))
+
+    order = pd.DataFrame({'cluster' : labels, 'rank' : -city_rank(feats),
+                          'filled' : -df.notna().sum(axis=1).to_numpy(), 'pos' : np.arange(len(df))})
+    best = order.sort_values(['cluster', 'rank', 'filled', 'pos']).drop_duplicates('cluster')['pos'].to_numpy()
+    canonical = np.zeros(len(df), dtype=bool)
+    canonical[best] = True
+    count('near_duplicates', int((~canonical).sum()))
+    return df.assign(cluster=labels, canonical=canonical)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find near-duplicate outlets in the usnpl scrape.')
+    parser.add_argument('--threshold', type=float, default=match_threshold)
+    parser.add_argument('--show', type=int, default=20, help='clusters to print')
+    args = parser.parse_args()
+
+    df = pd.read_csv(usnpl_file, sep='\t')
+    df.columns = [col_standard.get(c, c) for c in df.columns.str.lower()]
+    df = df.rename(columns={'twitter_name' : 'twitter', 'geography' : 'state'})
+    marked = near_duplicates(df, args.threshold)
+    sizes = marked['cluster'].map(marked['cluster'].value_counts())
+    dupes = marked[sizes > 1].assign(size=sizes).sort_values(['size', 'cluster', 'canonical'], ascending=[False, True, False])
+    print(f"{int((~marked['canonical']).sum())} of {len(df)} rows are near-duplicates, "
+          f"in {dupes['cluster'].nunique()} clusters")
+    for _, cluster in list(dupes.groupby('cluster', sort=False))[:args.show]:
+        print(cluster[['canonical', 'name', 'city', 'state', 'website']].to_string(index=False), '\n')
@@ -0,0 +1,164 @@
+import re
+import argparse
+
+import pandas as pd
+
+from config import *
+from ingest import read_records
+from resolve import registered_domain
+from metrics import count
+
+'''
+Fills in who owns each USNPL outlet, which the USNPL scrape doesn't say.
+
+An owner index is put together from what is already known about ownership:
+every site in hearst.tsv, the user-contributed custom_additions.json, and the
+newspaper chains in `known_owner_domains` in config. Each entry is a key of
+one of three kinds:
+
+- `host`: a full host, `www.` stripped (`rockdalenewtoncitizen.com`,
+  `mytown.wordpress.com`)
+- `domain`: a registered domain (`mlive.com` also covers `obits.mlive.com`)
+- `name`: a normalized outlet name plus state (`houston chronicle|TX`)
+
+Outlets are matched by host first, then by registered domain, then by name,
+each as one left join against the index. Hosting platforms (`shared_hosts` in
+config) never match at the domain level, since two blogs on blogspot.com have
+nothing to do with each other. A key that points at more than one owner is
+dropped rather than guessed at.
+
+    python owners.py            # coverage of the current usnpl.tsv
+    python owners.py --write    # and save the index to owner_index_file
+'''
+
+index_columns = ['kind', 'key', 'owner', 'origin']
+
+# precedence of the evidence, strongest first
+match_kinds = ['host', 'domain', 'name']
+
+
+def website_host(websites):
+    '''The lower-cased host of each website, without `www.`'''
+    return (websites.astype('string')
+                    .str.strip()
+                    .str.lower()
+                    .str.extract(r'^(?:[a-z]+://)?(?:www\d?\.)?([^/:?#\s]+)', expand=False))
+
+
+def name_key(names, states):
+    '''`The Houston Chronicle` in `tx` -> `houston chronicle|TX`'''
+    names = (names.astype('string')
+                  .str.lower()
+                  .str.replace(r'^the\s+', '', regex=True)
+                  .str.replace(r'[^a-z0-9 ]', ' ', regex=True)
+                  .str.replace(r'\s+', ' ', regex=True)
+                  .str.strip())
+    return names + '|' + states.astype('string').str.upper().str.strip()
+
+
+def canonical_owner(owners):
+    return owners.astype('string').str.strip().replace(owner_mapping).replace('', pd.NA)
+
+
+def index_entries(df, origin, website='website', name='name', state='state', owner='owner'):
+    '''Host, domain and name keys for every row of `df` with an owner.'''
+    df = df[df[owner].notna()]
+    owners = canonical_owner(df[owner])
+    frames = []
+    if website in df:
+        frames.append(pd.DataFrame({'kind': 'host', 'key': website_host(df[website]), 'owner': owners}))
+        frames.append(pd.DataFrame({'kind': 'domain', 'key': registered_domain(df[website]), 'owner': owners}))
+    if name in df and state in df:
+        frames.append(pd.DataFrame({'kind': 'name', 'key': name_key(df[name], df[state]), 'owner': owners}))
+    if not frames:
+        return pd.DataFrame(columns=index_columns)
+    out = pd.concat(frames, ignore_index=True)
+    out['origin'] = origin
+    return out
+
+
+def load_custom_owners(filepath=custom_station_file):
+    '''The name, website, state and owner of every entry in custom_additions.json, see ingest.py.'''
+    return read_records(filepath, custom_fields)[['name', 'website', 'state', 'owner']]
+
+
+def build_owner_index():
+    '''
+    One row per (kind, key) with its owner and where that came from.
+    Keys claimed by more than one owner are left out.
+    '''
+    frames = []
+    if os.path.exists(hearst_file):
+        df_hearst = pd.read_csv(hearst_file, sep='\t', dtype=str)
+        frames.append(index_entries(df_hearst, 'hearst', owner='broadcaster'))
+    if os.path.exists(custom_station_file):
+        frames.append(index_entries(load_custom_owners(), 'custom'))
+    frames.append(pd.DataFrame({'kind': 'domain', 'key': list(known_owner_domains),
+                                'owner': list(known_owner_domains.values()), 'origin': 'config'}))
+    index = pd.concat(frames, ignore_index=True).dropna(subset=['key', 'owner'])
+
+    # a platform is not an owner: only its subdomains (`mytown.wordpress.com`) are usable
+    index = index[~index['key'].isin(shared_hosts)]
+    index = index.drop_duplicates(['kind', 'key', 'owner'])
+    owners_per_key = index.groupby(['kind', 'key'])['owner'].transform('nunique')
+    count('owner_index_ambiguous', int((owners_per_key > 1).sum()))
+    index = index[owners_per_key == 1]
+    return index.sort_values(['kind', 'key']).reset_index(drop=True)[index_columns]
+
+
+def infer_owners(df, website='website', name='name', state='state', index=None):
+    '''
+    Returns `df` with `owner` and `owner_evidence` columns, filling owners
+    that are missing from the index. An owner already in `df` is kept.
+    '''
+    if index is None:
+        index = build_owner_index()
+    keys = {
+        'host': website_host(df[website]),
+        'domain': registered_domain(df[website]).where(lambda d: ~d.isin(shared_hosts)),
+        'name': name_key(df[name], df[state]),
+    }
+
+    owner = df['owner'].astype('string') if 'owner' in df else pd.Series(pd.NA, index=df.index, dtype='string')
+    evidence = pd.Series(pd.NA, index=df.index, dtype='string').mask(owner.notna(), 'source')
+    for kind in match_kinds:
+        lookup = index.loc[index['kind'] == kind, ['key', 'owner']]
+        found = (pd.DataFrame({'key': keys[kind].values})
+                   .merge(lookup, on='key', how='left')['owner']
+                   .astype('string'))
+        found.index = df.index
+        fill = owner.isna() & found.notna()
+        evidence = evidence.mask(fill, kind)
+        owner = owner.combine_first(found)
+
+    df = df.copy()
+    df['owner'] = owner.astype(object).where(owner.notna(), None)
+    df['owner_evidence'] = evidence.astype(object).where(evidence.notna(), None)
+    for kind, n in coverage(df)['rows'].items():
+        count('owners_inferred', int(n), evidence=kind)
+    return df
+
+
+def coverage(df):
+    '''Rows and share of rows per kind of evidence, `none` for the unmatched.'''
+    evidence = df['owner_evidence'].fillna('none')
+    out = evidence.value_counts().rename('rows').to_frame()
+    out['share'] = (out['rows'] / len(df)).round(4)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Infer owners for USNPL outlets.')
+    parser.add_argument('--write', action='store_true', help=f'save the owner index to {owner_index_file}')
+    parser.add_argument('--top', type=int, default=15, help='show the most common inferred owners')
+    args = parser.parse_args()
+
+    index = build_owner_index()
+    print(index.groupby(['origin', 'kind']).size().rename('keys').to_string(), '\n')
+    if args.write:
+        index.to_csv(owner_index_file, sep='\t', index=False)
+
+    df_usnpl = pd.read_csv(usnpl_file, sep='\t')
+    df_usnpl = infer_owners(df_usnpl, 'Website', 'Name', 'Geography', index=index)
+    print(coverage(df_usnpl).to_string(), '\n')
+    print(df_usnpl['owner'].value_counts().head(args.top).to_string())
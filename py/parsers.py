@@ -0,0 +1,333 @@
+import os
+from io import StringIO
+
+import pandas as pd
+
+from config import *
+from metrics import count
+
+'''
+HTML extraction for the scrapers, with a choice of parser backend.
+
+Every page download_data.py reads has an extractor here that turns the raw
+response body into plain Python data (lists of dicts and strings, or a
+DataFrame for the pages that are one big table), written twice:
+
+- `lxml`: XPath over lxml's C tree, with every expression compiled once at
+  import. This is the default.
+- `bs4`: the original BeautifulSoup code, kept as the reference and as a
+  fallback when lxml isn't installed.
+
+    rows = extract('stationindex_stations', r.content)
+    rows = extract('stationindex_stations', r.content, backend='bs4')
+
+The backend is `html_backend` in config (`LOCAL_NEWS_HTML_BACKEND` overrides
+it). Both backends must return identical results for the same page;
+`python bench_parsers.py --check` verifies that on recorded pages and times
+them.
+'''
+
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = None
+
+
+def has_class(name):
+    '''XPath predicate for `class` containing `name`, like bs4's `class_=name`.'''
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+def text(element):
+    '''All the text under `element`, like bs4's `.text`.'''
+    return ''.join(element.xpath('.//text()'))
+
+
+def next_string(element):
+    '''The first text node after `element` among its siblings, like bs4's `find_next_sibling(string=True)`.'''
+    if element.tail is not None:
+        return element.tail
+    for sibling in element.itersiblings():
+        if sibling.tail is not None:
+            return sibling.tail
+    return None
+
+
+def first(elements):
+    return elements[0] if elements else None
+
+
+def read_table(table_html):
+    return pd.read_html(StringIO(table_html))[0]
+
+
+# -- bs4 ------------------------------------------------------------------
+
+def soup(content):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, 'lxml')
+
+
+def bs4_sinclair_stations(content):
+    table = soup(content).find('main').find('div', class_='table-wrapper')
+    return read_table(str(table))
+
+
+def bs4_nexstar_stations(content):
+    table = soup(content).find('table', class_='tablepress tablepress-id-1 dataTable no-footer tablepress--responsive')
+    return read_table(str(table))
+
+
+def bs4_stationindex_market_links(content):
+    table = soup(content).find('table', attrs={'class' : 'table table-striped table-condensed'})
+    return [a.get('href') for a in table.find_all('a')]
+
+
+def bs4_stationindex_stations(content):
+    stations = []
+    for row in soup(content).find_all('tr'):
+        station_name = row.find_all('td')[1].find('a').text
+        spans = row.find('td', attrs={'width':'100%'}).find_all('span', attrs={"class":'text-bold'})
+        station = {'station' : station_name}
+        for span in spans:
+            # each span becomes a different column:
+            col_name = span.text.rstrip(':').strip(' ').replace(' ', '_').lower().replace('web_site', 'website')
+            val = span.next_sibling
+            if col_name == 'website':
+                # this needs to be validateed,
+                # there are some incorrect strings being passed as URLs
+                val = val.next_sibling.text
+            # a field with no value is followed straight by the next tag
+            station[col_name] = str(val) if isinstance(val, str) else ''
+        stations.append(station)
+    return stations
+
+
+def bs4_usnpl_state(content):
+    main_table = soup(content).find('table', class_='table table-sm')
+    if not main_table:
+        return []
+    papers = []
+    rows = [row for row in main_table.find_all('tr') if 'table-dark' not in row.get('class', [])]
+    current_city = ""
+    for row in rows:
+        city_element = row.find('h4', class_='result_city')
+        if city_element:
+            current_city = city_element.text.strip()
+            continue
+        data_points = row.find_all('td')
+        if len(data_points) < 6:
+            continue
+        link = lambda i: data_points[i].find('a')['href'] if data_points[i].find('a') else ''
+        papers.append(dict(
+            city = current_city,
+            name = data_points[0].find('a').text.strip() if data_points[0].find('a') else '',
+            usnpl_page = link(0),
+            website = link(1),
+            twitter = link(2),
+            facebook = link(3),
+            instagram = link(4),
+            youtube = link(5),
+        ))
+    return papers
+
+
+def bs4_usnpl_paper(content):
+    sub_soup = soup(content)
+    sub_table = sub_soup.find_all('tr')
+    if len(sub_table) < 2:
+        return dict(title=sub_soup.find('title').text.strip())
+    editor_element = sub_soup.find('strong', string='Editor:')
+    phone_element = sub_soup.find('strong', string='Phone:')
+    return dict(
+        address = ' '.join(part.strip() for part in sub_table[1].stripped_strings),
+        editor = editor_element.find_next_sibling(string=True).strip() if editor_element else '',
+        phone = phone_element.find_next_sibling(string=True).strip() if phone_element else '',
+    )
+
+
+def bs4_hearst_cards(content):
+    '''(link, image alt text) for each brand card; the alt text is None for cards without a logo caption.'''
+    parent_div = soup(content).find('div', class_='brand-card')
+    cards = []
+    for card in parent_div.find_all('div', recursive=False):
+        link = card.find('a')
+        caption = card.find('div', class_='brand-logo-caption-with-text')
+        image = caption.find('img') if caption else None
+        cards.append((link.get('href') if link is not None else None,
+                      image['alt'] if image is not None else None))
+    return cards
+
+
+def bs4_hearst_newspaper(content):
+    data_section = soup(content).find('section', id='content')
+    main_column = data_section.find('div', id='layout-column_column-1')
+    column = main_column.find_all('div', recursive=False)[2]
+    contact_info = column.find('div', class_="brand-contact-info")
+    address_info = column.find('div', class_='address-container')
+    social_info = column.find('ul', class_="brand-icons")
+    return dict(
+        name = data_section.find("h1").text.strip(),
+        website = contact_info.find('p', class_="brand-address").find('a').get('href'),
+        address_list = [p.text.strip() for p in address_info.find_all('p')],
+        social = [(link.find('img')['alt'], link['href']) for link in social_info.find_all('a')],
+    )
+
+
+# -- lxml -----------------------------------------------------------------
+
+if etree is not None:
+    xp = dict(
+        sinclair_table = etree.XPath(f'(//main)[1]/descendant::div[{has_class("table-wrapper")}][1]'),
+        nexstar_table = etree.XPath('(//table[@class="tablepress tablepress-id-1 dataTable no-footer tablepress--responsive"])[1]'),
+        market_table = etree.XPath('//table[@class="table table-striped table-condensed"]'),
+        links = etree.XPath('.//a'),
+        rows = etree.XPath('//tr'),
+        row_cells = etree.XPath('.//td'),
+        first_link = etree.XPath('(.//a)[1]'),
+        wide_cell = etree.XPath('(.//td[@width="100%"])[1]'),
+        bold_spans = etree.XPath(f'.//span[{has_class("text-bold")}]'),
+        usnpl_table = etree.XPath('(//table[@class="table table-sm"])[1]'),
+        table_rows = etree.XPath('.//tr'),
+        city_heading = etree.XPath(f'(.//h4[{has_class("result_city")}])[1]'),
+        title = etree.XPath('(//title)[1]'),
+        label = etree.XPath('(//strong[not(*) and .=$label])[1]'),
+        brand_card = etree.XPath(f'(//div[{has_class("brand-card")}])[1]'),
+        child_divs = etree.XPath('./div'),
+        caption_image = etree.XPath(f'(.//div[{has_class("brand-logo-caption-with-text")}])[1]'),
+        first_image = etree.XPath('(.//img)[1]'),
+        content_section = etree.XPath('(//section[@id="content"])[1]'),
+        main_column = etree.XPath('(.//div[@id="layout-column_column-1"])[1]'),
+        heading = etree.XPath('(.//h1)[1]'),
+        contact_link = etree.XPath(f'(.//div[{has_class("brand-contact-info")}])[1]'
+                                   f'/descendant::p[{has_class("brand-address")}][1]/descendant::a[1]'),
+        address_lines = etree.XPath(f'(.//div[{has_class("address-container")}])[1]//p'),
+        social_links = etree.XPath(f'(.//ul[{has_class("brand-icons")}])[1]//a'),
+    )
+
+
+def tree(content):
+    '''Parses a response body, as UTF-8 when it is (BeautifulSoup guesses the same way).'''
+    try:
+        return lxml_html.document_fromstring(content.decode('utf-8') if isinstance(content, bytes) else content)
+    except (UnicodeDecodeError, ValueError):
+        # not UTF-8, or an XML declaration lxml won't take in a str: let libxml2 read the bytes
+        return lxml_html.document_fromstring(content.encode('utf-8') if isinstance(content, str) else content)
+
+
+def lxml_sinclair_stations(content):
+    return read_table(lxml_html.tostring(xp['sinclair_table'](tree(content))[0], encoding='unicode'))
+
+
+def lxml_nexstar_stations(content):
+    return read_table(lxml_html.tostring(xp['nexstar_table'](tree(content))[0], encoding='unicode'))
+
+
+def lxml_stationindex_market_links(content):
+    table = xp['market_table'](tree(content))[0]
+    return [a.get('href') for a in xp['links'](table)]
+
+
+def lxml_stationindex_stations(content):
+    stations = []
+    for row in xp['rows'](tree(content)):
+        station = {'station' : text(xp['first_link'](xp['row_cells'](row)[1])[0])}
+        for span in xp['bold_spans'](xp['wide_cell'](row)[0]):
+            col_name = text(span).rstrip(':').strip(' ').replace(' ', '_').lower().replace('web_site', 'website')
+            if col_name == 'website':
+                val = text(span.getnext())
+            else:
+                val = span.tail
+            station[col_name] = str(val) if val is not None else ''
+        stations.append(station)
+    return stations
+
+
+def lxml_usnpl_state(content):
+    main_table = first(xp['usnpl_table'](tree(content)))
+    if main_table is None:
+        return []
+    papers = []
+    current_city = ""
+    for row in xp['table_rows'](main_table):
+        if 'table-dark' in (row.get('class') or '').split():
+            continue
+        city_element = first(xp['city_heading'](row))
+        if city_element is not None:
+            current_city = text(city_element).strip()
+            continue
+        data_points = xp['row_cells'](row)
+        if len(data_points) < 6:
+            continue
+        links = [first(xp['first_link'](cell)) for cell in data_points[:6]]
+        link = lambda i: links[i].get('href') if links[i] is not None else ''
+        papers.append(dict(
+            city = current_city,
+            name = text(links[0]).strip() if links[0] is not None else '',
+            usnpl_page = link(0),
+            website = link(1),
+            twitter = link(2),
+            facebook = link(3),
+            instagram = link(4),
+            youtube = link(5),
+        ))
+    return papers
+
+
+def lxml_usnpl_paper(content):
+    doc = tree(content)
+    sub_table = xp['rows'](doc)
+    if len(sub_table) < 2:
+        return dict(title=text(xp['title'](doc)[0]).strip())
+    found = {}
+    for field, label in [('editor', 'Editor:'), ('phone', 'Phone:')]:
+        element = first(xp['label'](doc, label=label))
+        found[field] = next_string(element).strip() if element is not None else ''
+    parts = [t.strip() for t in sub_table[1].xpath('.//text()') if t.strip()]
+    return dict(address=' '.join(parts), **found)
+
+
+def lxml_hearst_cards(content):
+    cards = []
+    for card in xp['child_divs'](xp['brand_card'](tree(content))[0]):
+        link = first(xp['first_link'](card))
+        caption = first(xp['caption_image'](card))
+        image = first(xp['first_image'](caption)) if caption is not None else None
+        cards.append((link.get('href') if link is not None else None,
+                      image.get('alt') if image is not None else None))
+    return cards
+
+
+def lxml_hearst_newspaper(content):
+    data_section = xp['content_section'](tree(content))[0]
+    column = xp['child_divs'](xp['main_column'](data_section)[0])[2]
+    return dict(
+        name = text(xp['heading'](data_section)[0]).strip(),
+        website = xp['contact_link'](column)[0].get('href'),
+        address_list = [text(p).strip() for p in xp['address_lines'](column)],
+        social = [(first(xp['first_image'](link)).get('alt'), link.get('href')) for link in xp['social_links'](column)],
+    )
+
+
+# -- dispatch -------------------------------------------------------------
+
+pages = ['sinclair_stations', 'nexstar_stations', 'stationindex_market_links', 'stationindex_stations', 'usnpl_state', 'usnpl_paper',
+         'hearst_cards', 'hearst_newspaper']
+
+backends = {
+    'lxml' : {page : globals()[f'lxml_{page}'] for page in pages},
+    'bs4' : {page : globals()[f'bs4_{page}'] for page in pages},
+}
+
+
+def available_backends():
+    return [b for b in backends if b != 'lxml' or etree is not None]
+
+
+def extract(page, content, backend=None):
+    '''Runs the `page` extractor on a response body with `backend` (default `html_backend`).'''
+    backend = backend or html_backend
+    if backend == 'lxml' and etree is None:
+        count('html_backend_fallback', 1, page=page)
+        backend = 'bs4'
+    return backends[backend][page](content)
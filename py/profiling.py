@@ -0,0 +1,148 @@
+import os
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from config import *
+
+'''
+Opt-in profiling of pipeline stages.
+
+Set `LOCAL_NEWS_PROFILE=1` (or pass `--profile` to the CLI) and every
+`profile_stage(...)` block gets a CPU profile and a tracemalloc snapshot. When
+the run ends, `dump_profiles()` writes to `profile_dir`:
+
+- `<stage>.pstats`     raw cProfile output (open with snakeviz or pstats)
+- `<stage>.collapsed`  folded stacks for flamegraph.pl / speedscope / inferno
+- `<stage>.alloc.txt`  peak memory and the sites that allocated the most,
+                       summed over every run of the stage
+
+When profiling is off `profile_stage` hands back a shared `nullcontext`,
+so instrumented code pays for one boolean check and nothing else.
+'''
+
+enabled = os.environ.get('LOCAL_NEWS_PROFILE', '') not in ('', '0')
+
+# how many allocation sites to list per stage
+top_n_allocations = 25
+
+_null = nullcontext()
+_results = {}
+_active = []
+
+
+def enable(flag=True):
+    '''Turns profiling on (or off) for the rest of the process.'''
+    global enabled
+    enabled = flag
+
+
+def profile_stage(name):
+    '''
+    Profiles the enclosed block as stage `name` when profiling is on.
+    A stage nested in another pauses the outer profiler, so each stage's
+    CPU profile only holds its own work.
+    '''
+    if not enabled:
+        return _null
+    return _profile(name)
+
+
+@contextmanager
+def _profile(name):
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(25)
+    if _active:
+        outer = _active[-1]
+        outer['profiler'].disable()
+        outer['peak'] = max(outer['peak'], tracemalloc.get_traced_memory()[1])
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+
+    frame = dict(profiler=cProfile.Profile(), peak=0)
+    _active.append(frame)
+    frame['profiler'].enable()
+    try:
+        yield
+    finally:
+        frame['profiler'].disable()
+        _active.pop()
+        peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+        after = tracemalloc.take_snapshot()
+
+        # the same stage can run many times (once per page), keep accumulating
+        result = _results.setdefault(name, dict(stats=None, peak=0, runs=0, allocations={}))
+        if result['stats'] is None:
+            result['stats'] = pstats.Stats(frame['profiler'])
+        else:
+            result['stats'].add(frame['profiler'])
+        result['peak'] = max(result['peak'], peak)
+        result['runs'] += 1
+        # memory each line allocated during the run and still held at its end
+        for stat in after.compare_to(before, 'lineno'):
+            site = stat.traceback[0]
+            total = result['allocations'].setdefault((site.filename, site.lineno), [0, 0])
+            total[0] += stat.size_diff
+            total[1] += stat.count_diff
+
+        if _active:
+            outer = _active[-1]
+            outer['peak'] = max(outer['peak'], peak)
+            outer['profiler'].enable()
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def collapsed_stacks(stats):
+    '''
+    Folds cProfile's caller graph into `a;b;c <microseconds>` lines.
+
+    cProfile only keeps caller -> callee edges, not full stacks, so each
+    function's own time is attributed along its hottest caller chain.
+    '''
+    def label(func):
+        filename, line, name = func
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    entries = stats.stats
+    lines = []
+    for func, (cc, nc, tottime, cumtime, callers) in entries.items():
+        if tottime <= 0:
+            continue
+        stack = [label(func)]
+        seen = {func}
+        caller = func
+        while True:
+            parents = [c for c in entries[caller][4] if c in entries and c not in seen]
+            if not parents:
+                break
+            caller = max(parents, key=lambda c: entries[caller][4][c][3])
+            seen.add(caller)
+            stack.append(label(caller))
+        lines.append(f"{';'.join(reversed(stack))} {int(tottime * 1e6)}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def dump_profiles(output_dir=profile_dir):
+    '''
+    Writes the profiles of every stage seen since the last dump.
+    Does nothing when profiling is off.
+    '''
+    if not _results:
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    for name, result in _results.items():
+        base = os.path.join(output_dir, name)
+        result['stats'].dump_stats(base + '.pstats')
+        with open(base + '.collapsed', 'w') as f:
+            f.write(collapsed_stacks(result['stats']))
+        with open(base + '.alloc.txt', 'w') as f:
+            f.write(f"peak traced memory: {result['peak'] / 1e6:.1f} MB over {result['runs']} runs\n\n")
+            sites = sorted(result['allocations'].items(), key=lambda item: -item[1][0])
+            for (filename, lineno), (size, count) in sites[:top_n_allocations]:
+                f.write(f"{filename}:{lineno}: size={size / 1024:+.1f} KiB, count={count:+d}\n")
+    print(f"Wrote profiles for {len(_results)} stages to {output_dir}")
+    _results.clear()
@@ -0,0 +1,223 @@
+import math
+import time
+import sqlite3
+import hashlib
+import argparse
+
+import pandas as pd
+
+from config import *
+from metrics import run, span, write_report
+
+'''
+Freshness-aware refresh scheduling.
+
+Gray is a static JSON file, the corporate station lists change a few times a
+year and usnpl changes all the time, so re-scraping everything every night
+wastes most of the request budget. Instead every scrape of a unit (a whole
+source, or one state for usnpl) is recorded with a digest of what it returned.
+From that history each unit's change rate is estimated and its next refresh is
+scheduled for when it has probably changed (`refresh_change_probability`),
+within the bounds in `refresh_intervals`.
+
+    python refresh.py plan            # dry run: what is due and how many requests it will take
+    python refresh.py run             # scrape what is due
+    python refresh.py run --force usnpl
+    python refresh.py history usnpl
+
+The change rate uses the estimator of Cho & Garcia-Molina (2003) for a page
+checked at intervals where only "changed or not" is observed:
+rate = -log((n - X + .5) / (n + .5)) / (T / n), for X changes seen in n checks over T days.
+'''
+
+# source -> the download_data function that scrapes it, returning what it scraped
+sources = {
+    'usnpl' : 'download_usnpl',
+    'stationindex' : 'download_stationindex',
+    'sinclair' : 'download_sinclair',
+    'nexstar' : 'download_nexstar',
+    'hearst' : 'download_hearst',
+    'gray' : 'extract_gray',
+}
+
+# only the most recent checks count, so a unit that starts changing is caught quickly
+history_window = 20
+
+day = 24 * 60 * 60
+
+
+def units(source):
+    '''usnpl is refreshed state by state, everything else as a whole.'''
+    return list(states) if source == 'usnpl' else ['*']
+
+
+def digest_rows(rows):
+    '''A digest of scraped rows that ignores row order and `collection_date`.'''
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return hashlib.sha1(b'').hexdigest()
+    df = df.drop(columns=[c for c in ['collection_date'] if c in df.columns])
+    row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False).sort_values()
+    return hashlib.sha1(row_hashes.values.tobytes()).hexdigest()
+
+
+def requests_made(source):
+    '''HTTP requests counted for `source` so far in this process.'''
+    return int(sum(v for (metric, labels), v in run['counters'].items()
+                   if metric == 'http_requests' and ('source', source) in labels))
+
+
+class RefreshHistory:
+    '''Every scrape of every unit, in SQLite.'''
+    def __init__(self, filepath=refresh_history_file):
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.db = sqlite3.connect(filepath)
+        self.db.execute('''create table if not exists checks (
+            source text, unit text, checked_at real, digest text,
+            changed integer, rows integer, requests integer)''')
+
+    def record(self, source, unit, digest, rows, requests):
+        '''Records a scrape. Returns whether the unit changed (None the first time).'''
+        last = self.db.execute(
+            'select digest from checks where source = ? and unit = ? order by checked_at desc limit 1',
+            (source, unit)).fetchone()
+        changed = None if last is None else int(last[0] != digest)
+        self.db.execute('insert into checks values (?, ?, ?, ?, ?, ?, ?)',
+                        (source, unit, time.time(), digest, changed, rows, requests))
+        self.db.commit()
+        return changed
+
+    def frame(self, source=None):
+        query = 'select * from checks' + (' where source = ?' if source else '') + ' order by checked_at'
+        return pd.read_sql_query(query, self.db, params=(source,) if source else ())
+
+    def close(self):
+        self.db.close()
+
+
+def next_interval(checked_at, changed, bounds):
+    '''
+    Days until the next refresh of a unit, from the times it was checked
+    and whether each check found a change.
+    '''
+    shortest, first, longest = bounds
+    n = len(checked_at) - 1
+    if n < 1:
+        return first
+
+    checked_at = checked_at[-(history_window + 1):]
+    changed = changed[-(history_window + 1):]
+    n = len(checked_at) - 1
+    changes = int(sum(changed[1:]))
+    elapsed = (checked_at[-1] - checked_at[0]) / day
+    if elapsed <= 0:
+        return shortest
+
+    rate = -math.log((n - changes + .5) / (n + .5)) / (elapsed / n)
+    if rate <= 0:
+        return longest
+    interval = -math.log(1 - refresh_change_probability) / rate
+    return min(max(interval, shortest), longest)
+
+
+def plan(history, only=None, force=(), now=None):
+    '''
+    One row per unit: its history, next refresh interval, when it is due,
+    and how many requests its last scrape took.
+    '''
+    now = now or time.time()
+    df_checks = history.frame()
+    grouped = dict(tuple(df_checks.groupby(['source', 'unit']))) if len(df_checks) else {}
+
+    rows = []
+    for source in only or sources:
+        for unit in units(source):
+            df = grouped.get((source, unit))
+            if df is None:
+                rows.append(dict(source=source, unit=unit, checks=0, changes=0,
+                                 interval_days=refresh_intervals[source][1], last_checked=None,
+                                 due=True, last_requests=None))
+                continue
+            checked_at = df['checked_at'].tolist()
+            changed = df['changed'].fillna(0).tolist()
+            interval = next_interval(checked_at, changed, refresh_intervals[source])
+            rows.append(dict(source=source, unit=unit, checks=len(df), changes=int(sum(changed)),
+                             interval_days=round(interval, 2),
+                             last_checked=datetime.datetime.fromtimestamp(checked_at[-1]).isoformat(timespec='minutes'),
+                             due=checked_at[-1] + interval * day <= now,
+                             last_requests=df['requests'].iloc[-1]))
+
+    df_plan = pd.DataFrame(rows)
+    df_plan.loc[df_plan['source'].isin(force), 'due'] = True
+    return df_plan
+
+
+def refresh(df_plan, history):
+    '''Scrapes the due units of `df_plan` and records what came back.'''
+    import download_data
+
+    due = df_plan[df_plan['due']]
+
+    usnpl_states = due.loc[due['source'] == 'usnpl', 'unit'].tolist()
+    if usnpl_states:
+        sites = []
+        with span('scrape', source='usnpl'):
+            for state in usnpl_states:
+                before = requests_made('usnpl')
+                try:
+                    rows = download_data.scrape_usnpl_state(state)
+                except Exception as e:
+                    print(f"An error occurred in processing (usnpl) the state '{state}': {e}")
+                    continue
+                history.record('usnpl', state, digest_rows(rows), len(rows), requests_made('usnpl') - before)
+                sites.extend(rows)
+            if sites:
+                download_data.save_usnpl(sites)
+
+    for source in due.loc[due['source'] != 'usnpl', 'source'].unique():
+        before = requests_made(source)
+        with span('scrape', source=source):
+            # what this scrape returned, not the saved file: that only gains new stations, edits never reach it
+            df = getattr(download_data, sources[source])()
+        history.record(source, '*', digest_rows(df), len(df), requests_made(source) - before)
+
+    write_report('refresh')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-scrape sources when they have probably changed.')
+    parser.add_argument('--history', default=refresh_history_file)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name, help in [('plan', 'show what is due, without fetching anything'),
+                       ('run', 'scrape what is due')]:
+        p = sub.add_parser(name, help=help)
+        p.add_argument('sources', nargs='*', choices=list(sources), help='only consider these sources')
+        p.add_argument('--force', nargs='+', default=[], choices=list(sources), help='treat these as due')
+
+    p = sub.add_parser('history', help='every recorded scrape of a source')
+    p.add_argument('source', choices=list(sources))
+
+    args = parser.parse_args(argv)
+    history = RefreshHistory(args.history)
+    try:
+        if args.command == 'history':
+            print(history.frame(args.source).to_string(index=False))
+            return
+
+        df_plan = plan(history, args.sources or None, args.force)
+        due = df_plan[df_plan['due']]
+        known = due['last_requests'].dropna()
+        print(due.to_string(index=False) if len(due) else 'Nothing is due')
+        print(f"\n{len(due)} of {len(df_plan)} units due. "
+              f"Planned fetches: {int(known.sum())} from history"
+              f"{f', plus {len(due) - len(known)} units scraped for the first time' if len(known) < len(due) else ''}.")
+
+        if args.command == 'run':
+            refresh(df_plan, history)
+    finally:
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import *
+
+'''
+Entity resolution for TV stations scraped from several sources.
+
+The same station shows up in stationindex, on its owner's website and sometimes
+in the custom additions, spelled `KASN `, `WXSP-CD` or `WXSP`, and linked to
+`https://www.wotv4women.com/` or `wotv4women.com`. Rather than comparing every
+record to every other one, records are grouped into blocks that share a
+call-sign root or a (state, registered domain), candidate pairs are only formed
+inside a block, scored, and clustered with union-find.
+
+`-CD`, `-LD`, `-LP`, `-CA` and `-DX` stations are licenses of their own
+(`KAZT-CD` in Phoenix is not `KAZT` in Prescott), so a shared call-sign root
+only counts across those suffixes when the domain or the city agrees too. A
+source never lists one station twice, so two records from the same source
+never end up in one cluster.
+
+Each cluster collapses into one row. Fields come from the highest priority
+source that has them (see `source_priority` in config.py) and the `sources`
+column records every source the station was found in.
+'''
+
+# blocks bigger than this are generic (a shared corporate domain, say) and skipped
+max_block_size = 50
+
+# how much each kind of agreement between two records counts for
+match_weights = {
+    'call_root' : 0.6,
+    'domain' : 0.3,
+    'state' : 0.1,
+}
+state_conflict_penalty = 0.5
+match_threshold = 0.6
+
+call_sign = re.compile(r'^([KW][A-Z]{2,3})(?:-(?:TV|DT|CD|LD|LP|CA|DX|HD))*$')
+# suffixes naming a separate low-power or class A license, rather than the full-power station
+low_power_suffix = re.compile(r'-(CD|LD|LP|CA|DX)\b')
+
+
+class UnionFind:
+    '''Disjoint sets over 0..n-1 with path halving.'''
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+    def labels(self):
+        return np.array([self.find(i) for i in range(len(self.parent))])
+
+
+def registered_domain(websites):
+    '''
+    The last two labels of each website's host, so `https://www.cbs6albany.com/news`
+    and `cbs6albany.com` both become `cbs6albany.com`.
+    '''
+    host = (websites.astype('string')
+                    .str.strip()
+                    .str.lower()
+                    .str.extract(r'^(?:[a-z]+://)?([^/:?#\s]+)', expand=False))
+    return host.str.extract(r'([^.]+\.[^.]+)$', expand=False)
+
+
+def call_sign_root(stations):
+    '''
+    `WXSP-CD` -> `WXSP`, `KASN ` -> `KASN`. Names that are not call signs
+    fall back to their upper-cased, whitespace-collapsed selves.
+    '''
+    name = (stations.astype('string')
+                    .str.upper()
+                    .str.replace(r'\s+', ' ', regex=True)
+                    .str.strip())
+    root = name.str.extract(call_sign, expand=False)
+    return root.fillna(name), root.notna()
+
+
+def call_sign_class(stations):
+    '''`KMPH-CD` -> `CD`, `KMPH` and `KMPH-TV` -> ``: which license of a call-sign root a record is.'''
+    name = stations.astype('string').str.upper().str.strip()
+    return name.str.extract(low_power_suffix, expand=False).fillna('')
+
+
+def normalize_text(values):
+    return values.astype('string').str.upper().str.replace(r'\s+', ' ', regex=True).str.strip()
+
+
+def blocking_keys(df):
+    '''Adds the normalized fields that blocking and scoring work on.'''
+    root, is_call_sign = call_sign_root(df['station'])
+    missing = pd.Series(pd.NA, index=df.index, dtype='string')
+    return pd.DataFrame({
+        'call_root' : root,
+        'call_class' : call_sign_class(df['station']),
+        'is_call_sign' : is_call_sign,
+        'domain' : registered_domain(df['website']),
+        'state' : df['state'].astype('string').str.strip().str.upper(),
+        'city' : normalize_text(df['city']) if 'city' in df else missing,
+        'source' : df['source'].astype('string') if 'source' in df else missing,
+    }, index=df.index).reset_index(drop=True)
+
+
+def candidate_pairs(keys):
+    '''
+    Pairs of record positions that share a block. Call signs are unique
+    nationwide, so they block on their own, anything else needs the state too.
+    '''
+    keys = keys.assign(_pos=np.arange(len(keys)))
+    blocks = [
+        keys['call_root'].where(keys['is_call_sign'], keys['call_root'] + '|' + keys['state']),
+        keys['domain'] + '|' + keys['state'],
+    ]
+
+    pairs = []
+    for block in blocks:
+        df_ = pd.DataFrame({'block' : block, '_pos' : keys['_pos']}).dropna()
+        sizes = df_['block'].map(df_['block'].value_counts())
+        df_ = df_[(sizes > 1) & (sizes <= max_block_size)]
+        df_ = df_.merge(df_, on='block', suffixes=('_a', '_b'))
+        df_ = df_[df_['_pos_a'] < df_['_pos_b']]
+        pairs.append(df_[['_pos_a', '_pos_b']])
+
+    return pd.concat(pairs).drop_duplicates().to_numpy()
+
+
+def score_pairs(keys, pairs):
+    '''Similarity score in [0, 1] for each candidate pair.'''
+    a = keys.iloc[pairs[:, 0]].reset_index(drop=True)
+    b = keys.iloc[pairs[:, 1]].reset_index(drop=True)
+
+    def equal(col):
+        return (a[col] == b[col]).fillna(False).to_numpy(dtype=bool)
+
+    agree = {col : equal(col) for col in match_weights}
+    # a root shared across license classes only counts when something else ties them together
+    same_class = equal('call_class')
+    agree['call_root'] &= same_class | agree['domain'] | equal('city')
+
+    score = sum(weight * agree[col] for col, weight in match_weights.items())
+    conflict = (a['state'] != b['state']).fillna(False).to_numpy(dtype=bool)
+
+    return score - state_conflict_penalty * conflict
+
+
+def cluster_records(df, threshold=match_threshold):
+    '''Returns a cluster label per row of `df` and the number of candidate pairs scored.'''
+    keys = blocking_keys(df)
+    pairs = candidate_pairs(keys)
+    uf = UnionFind(len(df))
+    # the sources in each cluster, by root; clusters sharing a source are never joined
+    sources = [set() if pd.isna(s) else {s} for s in keys['source']]
+    if len(pairs):
+        scores = score_pairs(keys, pairs)
+        same_class = (keys['call_class'].to_numpy()[pairs[:, 0]] == keys['call_class'].to_numpy()[pairs[:, 1]])
+        # best pairs first, so `KMPH` joins `KMPH` from another source before `KMPH-CD` can
+        order = np.lexsort((~same_class, -scores))
+        for i, j in pairs[order][scores[order] >= threshold]:
+            ri, rj = uf.find(i), uf.find(j)
+            if ri == rj or sources[ri] & sources[rj]:
+                continue
+            uf.union(ri, rj)
+            sources[min(ri, rj)] = sources[ri] | sources[rj]
+
+    return uf.labels(), len(pairs)
+
+
+def resolve_stations(df, threshold=match_threshold):
+    '''
+    Collapses records of the same station into one row.
+
+    `df` needs `station`, `website`, `state` and `source` columns. Returns the
+    deduplicated frame with `cluster` and `sources` columns added.
+    '''
+    df = df.reset_index(drop=True)
+    labels, n_pairs = cluster_records(df, threshold)
+
+    df = df.assign(cluster=labels,
+                   _priority=df['source'].map(source_priority).fillna(0))
+    df = df.sort_values('_priority', ascending=False, kind='stable')
+
+    # first() takes the first non-null value per column, i.e. the highest priority source that has it
+    df_resolved = df.groupby('cluster', sort=False).first()
+    df_sources = df[['cluster', 'source']].dropna().drop_duplicates()
+    df_resolved['sources'] = ((df_sources['source'].astype(object) + ',')
+                                .groupby(df_sources['cluster'], sort=False)
+                                .sum()
+                                .str.rstrip(','))
+
+    print(f"Resolved {len(df)} station records into {len(df_resolved)} stations "
+          f"({n_pairs} candidate pairs)")
+
+    return df_resolved.reset_index().drop(columns='_priority')
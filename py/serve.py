@@ -0,0 +1,230 @@
+import os
+import json
+import asyncio
+import argparse
+from collections import OrderedDict
+from urllib.parse import unquote
+
+import pandas as pd
+
+from config import *
+
+'''
+A small asyncio HTTP service for looking up outlets in the Local News Dataset.
+
+The merged dataset is loaded once and indexed by domain, state and owner.
+Responses for hot keys are kept in an LRU cache, and the dataset is reloaded
+whenever `local_news_dataset_file` changes on disk.
+
+    GET  /domain/{domain}
+    GET  /state/{state}
+    GET  /owner/{owner}
+    POST /lookup   {"domain": [...], "state": [...], "owner": [...]}
+
+Run it from the `py` directory:
+
+    python serve.py --port 8765
+'''
+
+lookup_kinds = ['domain', 'state', 'owner']
+
+
+def outlet_domains(websites):
+    '''Lower-cased host of each website, without the scheme or "www."'''
+    return (websites.astype('string')
+                    .str.strip()
+                    .str.lower()
+                    .str.extract(r'^(?:[a-z]+://)?(?:www\.)?([^/:?#\s]+)', expand=False))
+
+
+class OutletIndex:
+    '''
+    In-memory index over the dataset with an LRU cache of encoded responses.
+    '''
+    def __init__(self, filepath=local_news_dataset_file, cache_size=serve_cache_size):
+        self.filepath = filepath
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.mtime = None
+        # mtime of a file that failed to load, so it isn't retried until it changes again
+        self.failed_mtime = None
+        self.load()
+
+    def load(self):
+        '''(Re)reads the dataset and rebuilds the indexes. On error the current ones are left as they were.'''
+        mtime = os.stat(self.filepath).st_mtime
+        df = pd.read_csv(self.filepath)
+
+        keys = {
+            'domain' : outlet_domains(df['website']),
+            'state' : df['state'].astype('string').str.strip().str.upper(),
+            'owner' : df['owner'].astype('string').str.strip().str.casefold(),
+        }
+        index = {kind : k.dropna().groupby(k.dropna()).indices for kind, k in keys.items()}
+        # the positions from `indices` are relative to the non-null keys
+        positions = {kind : k.dropna().index.values for kind, k in keys.items()}
+        records = df.astype(object).where(df.notna(), None).to_dict('records')
+
+        self.index, self.positions, self.records = index, positions, records
+        self.cache.clear()
+        self.mtime = mtime
+        print(f"Loaded {len(self.records)} outlets from {self.filepath}")
+
+    def maybe_reload(self):
+        '''Reloads the dataset if the file changed since it was last read.'''
+        try:
+            mtime = os.stat(self.filepath).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime != self.mtime and mtime != self.failed_mtime:
+            try:
+                self.load()
+            except Exception as e:
+                # half-written or broken, keep serving what we have and try again once it changes
+                self.failed_mtime = mtime
+                print(f"Could not reload {self.filepath}, still serving the previous version: {e!r}")
+
+    def normalize(self, kind, key):
+        key = key.strip()
+        if kind == 'state':
+            return key.upper()
+        if kind == 'domain':
+            key = key.lower()
+            return key[4:] if key.startswith('www.') else key
+        return key.casefold()
+
+    def lookup(self, kind, key):
+        '''Returns the outlets (as dicts) matching `key`.'''
+        key = self.normalize(kind, key)
+        positions = self.index[kind].get(key, [])
+        rows = self.positions[kind][positions]
+        return [self.records[i] for i in rows]
+
+    def response(self, kind, key):
+        '''JSON-encoded response for one key, served from the LRU cache when hot.'''
+        cache_key = (kind, self.normalize(kind, key))
+        body = self.cache.get(cache_key)
+        if body is not None:
+            self.cache.move_to_end(cache_key)
+            return body
+
+        results = self.lookup(kind, key)
+        body = json.dumps({'key' : key, 'n' : len(results), 'results' : results}).encode()
+        self.cache[cache_key] = body
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return body
+
+    def batch_response(self, request):
+        '''JSON-encoded response for a POSTed batch of keys.'''
+        out = {}
+        for kind in lookup_kinds:
+            keys = request.get(kind) or []
+            if isinstance(keys, str):
+                keys = [keys]
+            out[kind] = {key : json.loads(self.response(kind, key)) for key in keys}
+        return json.dumps(out).encode()
+
+
+reasons = {200 : 'OK', 400 : 'Bad Request', 404 : 'Not Found', 405 : 'Method Not Allowed'}
+
+def http_response(status, body, keep_alive=True):
+    head = (f"HTTP/1.1 {status} {reasons[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+def route(index, method, path, body):
+    '''Returns (status, body) for a request.'''
+    parts = [unquote(p) for p in path.split('?')[0].strip('/').split('/', 1)]
+    if method == 'GET' and len(parts) == 2 and parts[0] in lookup_kinds:
+        return 200, index.response(parts[0], parts[1])
+    if parts == ['lookup']:
+        if method != 'POST':
+            return 405, b'{"error": "POST a JSON object of keys"}'
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            return 400, b'{"error": "invalid JSON"}'
+        if not isinstance(request, dict):
+            return 400, b'{"error": "expected a JSON object"}'
+        for kind in lookup_kinds:
+            keys = request.get(kind) or []
+            if not (isinstance(keys, str) or (isinstance(keys, list) and all(isinstance(k, str) for k in keys))):
+                return 400, json.dumps({'error' : f'{kind} must be a string or a list of strings'}).encode()
+        return 200, index.batch_response(request)
+    return 404, b'{"error": "not found"}'
+
+
+async def handle_connection(index, reader, writer):
+    '''Serves HTTP/1.1 requests on one (possibly keep-alive) connection.'''
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            method, path, version = request_line.decode('latin-1').split()
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                k, _, v = line.decode('latin-1').partition(':')
+                headers[k.strip().lower()] = v.strip()
+
+            body = b''
+            length = int(headers.get('content-length', 0))
+            if length:
+                body = await reader.readexactly(length)
+
+            keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+            status, payload = route(index, method, path, body)
+            writer.write(http_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def watch_for_changes(index, interval):
+    '''Hot-reloads the dataset when the file on disk changes. Keeps polling whatever a reload does.'''
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            index.maybe_reload()
+        except Exception as e:
+            print(f"Reload check failed: {e!r}")
+
+
+async def serve(host=serve_host, port=serve_port, filepath=local_news_dataset_file,
+                cache_size=serve_cache_size, reload_interval=2):
+    index = OutletIndex(filepath, cache_size)
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(index, r, w), host, port)
+    print(f"Serving on http://{host}:{port}")
+    watcher = asyncio.ensure_future(watch_for_changes(index, reload_interval))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve outlet lookups over HTTP.')
+    parser.add_argument('--host', default=serve_host)
+    parser.add_argument('--port', type=int, default=serve_port)
+    parser.add_argument('--file', default=local_news_dataset_file)
+    parser.add_argument('--cache-size', type=int, default=serve_cache_size)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.file, args.cache_size))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+
+import pandas as pd
+
+from config import *
+
+'''
+An append-only store of dataset builds and fast diffs between them.
+
+Every call to `record_snapshot` copies a build of the dataset into
+`snapshot_dir` and appends a line to its manifest, nothing is ever overwritten.
+Rows are identified by a hash of their (name, state) key and compared by a hash
+of their contents, so a diff between two builds is a single O(n) join.
+
+    python snapshots.py record
+    python snapshots.py list
+    python snapshots.py diff 1 2 > delta.jsonl
+    python snapshots.py diff ../data/local_news_dataset_2018.csv ../data_2023/local_news_dataset_2023.csv
+'''
+
+# columns that identify an outlet across builds
+key_cols = ['name', 'state']
+
+# columns that change on every build without the outlet changing
+volatile_cols = ['collection_date']
+
+manifest_file = os.path.join(snapshot_dir, 'manifest.jsonl')
+
+
+def read_manifest():
+    '''Returns the list of recorded snapshots, oldest first.'''
+    if not os.path.exists(manifest_file):
+        return []
+    with open(manifest_file) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def file_sha256(filepath):
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def record_snapshot(filepath=local_news_dataset_file, note=''):
+    '''
+    Appends a copy of the dataset at `filepath` to the snapshot store.
+    Returns the manifest entry.
+    '''
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest = read_manifest()
+    snapshot = manifest[-1]['snapshot'] + 1 if manifest else 1
+
+    stored = os.path.join(snapshot_dir, f"{snapshot:05d}_{os.path.basename(filepath)}")
+    if os.path.exists(stored):
+        raise FileExistsError(f"{stored} already exists, the store is append-only")
+    shutil.copyfile(filepath, stored)
+    with open(stored, 'rb') as f:
+        rows = sum(1 for _ in f) - 1
+
+    entry = dict(
+        snapshot = snapshot,
+        dataset_version = version,
+        created = datetime.datetime.now().isoformat(),
+        source_file = filepath,
+        file = os.path.basename(stored),
+        rows = rows,
+        sha256 = file_sha256(stored),
+        note = note,
+    )
+    with open(manifest_file, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    print(f"Recorded snapshot {snapshot} ({entry['rows']} rows)")
+
+    return entry
+
+
+def resolve_snapshot(ref):
+    '''Turns a snapshot number (or a path to a dataset csv) into a file path.'''
+    if os.path.exists(str(ref)) and not str(ref).isdigit():
+        return ref
+    for entry in read_manifest():
+        if entry['snapshot'] == int(ref):
+            return os.path.join(snapshot_dir, entry['file'])
+    raise KeyError(f"no snapshot {ref} in {manifest_file}")
+
+
+def hash_rows(df, cols):
+    '''One uint64 hash per row over `cols`, compared as strings so dtypes don't matter.'''
+    values = df[cols].astype('string').fillna('')
+    return pd.util.hash_pandas_object(values, index=False).values
+
+
+def identify_rows(df):
+    '''
+    Adds `_key` (row identity) and `_content` (row contents) hashes.
+
+    Outlets that share a (name, state) are told apart by their order of appearance.
+    '''
+    keys = pd.DataFrame({
+        c : df[c].astype('string').str.strip().str.casefold() for c in key_cols
+    })
+    keys['_n'] = keys.groupby(key_cols, dropna=False).cumcount()
+
+    df = df.copy()
+    df['_key'] = hash_rows(keys, key_cols + ['_n'])
+    content_cols = sorted(c for c in df.columns if c not in volatile_cols and not c.startswith('_'))
+    df['_content'] = hash_rows(df, content_cols)
+
+    return df
+
+
+def diff_frames(df_old, df_new):
+    '''
+    Compares two builds and yields one dict per added, removed or changed outlet.
+
+    Only the columns both builds have are compared, so builds with different
+    schemas (like 2018 and 2023) can still be diffed.
+    '''
+    shared = [c for c in df_new.columns if c in df_old.columns]
+    df_old = identify_rows(df_old[shared])
+    df_new = identify_rows(df_new[shared])
+
+    df = df_old.merge(df_new, on='_key', how='outer', suffixes=('_old', '_new'), indicator=True)
+    compared = [c for c in shared if c not in volatile_cols]
+
+    def record(row, suffix):
+        return {c : (None if pd.isna(row[c + suffix]) else row[c + suffix]) for c in shared}
+
+    removed = df[df['_merge'] == 'left_only']
+    added = df[df['_merge'] == 'right_only']
+    changed = df[(df['_merge'] == 'both') & (df['_content_old'] != df['_content_new'])]
+
+    for row in removed.to_dict('records'):
+        yield dict(op='remove', key=str(row['_key']), row=record(row, '_old'))
+    for row in added.to_dict('records'):
+        yield dict(op='add', key=str(row['_key']), row=record(row, '_new'))
+    for row in changed.to_dict('records'):
+        old, new = record(row, '_old'), record(row, '_new')
+        yield dict(op='change', key=str(row['_key']), row=new,
+                   changed={c : [old[c], new[c]] for c in compared if old[c] != new[c]})
+
+
+def diff_snapshots(old, new):
+    '''Diffs two snapshots (numbers or paths to dataset csvs).'''
+    df_old = pd.read_csv(resolve_snapshot(old), dtype=str)
+    df_new = pd.read_csv(resolve_snapshot(new), dtype=str)
+    return diff_frames(df_old, df_new)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Record and diff builds of the Local News Dataset.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('record', help='append a build to the snapshot store')
+    p.add_argument('--file', default=local_news_dataset_file)
+    p.add_argument('--note', default='')
+
+    sub.add_parser('list', help='show recorded snapshots')
+
+    p = sub.add_parser('diff', help='write the delta between two builds as JSONL')
+    p.add_argument('old', help='snapshot number or dataset csv')
+    p.add_argument('new', nargs='?', help='snapshot number or dataset csv (default: latest)')
+    p.add_argument('--out', help='write to this file instead of stdout')
+
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record_snapshot(args.file, args.note)
+
+    elif args.command == 'list':
+        for entry in read_manifest():
+            print(f"{entry['snapshot']:>5}  {entry['created']}  {entry['rows']:>7} rows  {entry['file']}  {entry['note']}")
+
+    elif args.command == 'diff':
+        new = args.new or read_manifest()[-1]['snapshot']
+        out = open(args.out, 'w') if args.out else sys.stdout
+        counts = {'add' : 0, 'remove' : 0, 'change' : 0}
+        for delta in diff_snapshots(args.old, new):
+            counts[delta['op']] += 1
+            out.write(json.dumps(delta) + '\n')
+        if args.out:
+            out.close()
+        print(counts, file=sys.stderr)
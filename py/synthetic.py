@@ -0,0 +1,279 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import *
+
+'''
+Synthetic intermediates for scaling tests.
+
+Writes the files `merge.py` reads (sinclair.tsv, nexstar.tsv, gray.tsv,
+hearst.tsv, station_index.tsv, usnpl.tsv and custom_additions.json) with each
+source's columns, quirks and share of missing values as scraped in 2023, at
+any number of rows:
+
+    python synthetic.py --rows 1000000 --out /tmp/synthetic/data_2023
+
+Rows are split between sources by `mix`. Corporate station lists reuse call
+signs from the stationindex pool at about the real overlap, so deduplication
+has real work to do. There are only ~900k four letter call signs, so past a
+few million stations they repeat and stations collide more than they would
+in real data. Everything is built a column at a time, 1M rows take about
+ten seconds to generate and write.
+'''
+
+# share of rows from each source, roughly 2023's with a large custom list on top
+mix = {
+    'usnpl' : .6,
+    'station_index' : .2,
+    'custom' : .12,
+    'nexstar' : .025,
+    'sinclair' : .02,
+    'gray' : .02,
+    'hearst' : .015,
+}
+
+# share of corporate stations that stationindex lists too
+overlap = .5
+
+city_starts = ['Spring', 'Green', 'Oak', 'River', 'Lake', 'Fair', 'Mill', 'Cedar', 'Ash', 'Clear',
+               'North', 'West', 'Pine', 'Maple', 'Rock', 'Elm', 'Glen', 'Bay', 'Stone', 'Sand']
+city_ends = ['field', 'ville', 'ton', 'wood', 'port', 'dale', 'view', ' City', ' Falls', 'burg',
+             ' Springs', 'ford', ' Heights', 'mont', ' Creek']
+paper_titles = ['Times', 'Herald', 'Gazette', 'Tribune', 'Journal', 'Courier', 'News', 'Post',
+                'Dispatch', 'Chronicle', 'Sentinel', 'Register', 'Star', 'Record', 'Observer']
+networks = ['ABC', 'CBS', 'NBC', 'FOX', 'CW', 'MyNetworkTV', 'PBS', 'Telemundo', 'Univision']
+subchannel_names = ['Start TV', 'Dabl', 'MeTV', 'Antenna TV', 'Comet', 'Charge!', 'Bounce', 'Grit', 'Cozi TV']
+owners = ['Sinclair', 'Nexstar', 'Gray TV', 'Hearst', 'Tegna', 'Scripps', 'NBC Universal',
+          'ViacomCBS', 'Fox Television Stations', 'Allen Media', 'Lee Enterprises', 'Gannett']
+
+collection_date = '2023-05-17 12:50:01.701573'
+
+
+def pick(rng, values, n):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+
+
+def with_missing(rng, values, share):
+    '''Blanks out about `share` of `values`.'''
+    values = pd.Series(values, dtype=object)
+    return values.mask(rng.random(len(values)) < share, None)
+
+
+def call_signs(rng, n):
+    '''`KXYZ` style call signs, three or four letters after the K/W.'''
+    letters = rng.integers(ord('A'), ord('Z') + 1, (n, 4)).astype(np.uint32)
+    letters[:, 0] = np.where(rng.random(n) < .5, ord('K'), ord('W'))
+    signs = pd.Series(letters.view('<U4').ravel(), dtype=object)
+    short = rng.random(n) < .3
+    signs[short] = signs[short].str[:3]
+    return signs
+
+
+def slugs(names):
+    return names.str.lower().str.replace(r'[^a-z0-9]+', '', regex=True)
+
+
+def places(rng, n):
+    '''(city, upper case state) pairs.'''
+    city = pd.Series(pick(rng, city_starts, n)) + pd.Series(pick(rng, city_ends, n))
+    state = pd.Series(pick(rng, states, n)).str.upper()
+    return city, state
+
+
+def websites(rng, names, tld='.com'):
+    prefix = pick(rng, ['https://www.', 'http://www.', 'https://', 'www.', ''], len(names))
+    return pd.Series(prefix) + slugs(names).values + tld + pick(rng, ['', '/', '/news'], len(names))
+
+
+def station_frame(rng, n, pool):
+    '''Stations, about `overlap` of them taken from `pool` (stationindex's call signs).'''
+    station = call_signs(rng, n)
+    if len(pool):
+        shared = rng.random(n) < overlap
+        station[shared] = pool[rng.integers(0, len(pool), shared.sum())].values
+    city, state = places(rng, n)
+    return pd.DataFrame({'station' : station, 'city' : city, 'state' : state,
+                         'website' : websites(rng, station + pd.Series(pick(rng, ['tv', 'news', ''], n)))})
+
+
+def generate_station_index(rng, n, pool=()):
+    df = station_frame(rng, n, pd.Series([], dtype=object))
+    suffix = pick(rng, ['', '', '', '-TV', '-CD', '-LD', '-DT'], n)
+    channel = pd.Series(rng.integers(2, 70, n)).astype(str)
+    network = pick(rng, networks, n)
+    subchannels = (' ' + channel + '.1 ' + df['station'] + '/' + network
+                   + ', ' + channel + '.2 ' + pick(rng, subchannel_names, n))
+    return pd.DataFrame({
+        'station' : df['station'] + suffix,
+        'id' : with_missing(rng, '"' + channel + ' ' + df['city'] + '"', .46),
+        'state' : df['state'],
+        'city' : ' ' + df['city'],
+        'owner' : with_missing(rng, ' ' + pd.Series(pick(rng, owners, n)), .06),
+        'website' : with_missing(rng, df['website'], .28),
+        'station_info' : ' Digital Full-Power - ' + pd.Series(rng.integers(1, 1000, n)).astype(str) + ' kW',
+        'subchannels' : with_missing(rng, subchannels, .63),
+        'source' : 'stationindex',
+        'collection_date' : collection_date,
+    })
+
+
+def generate_sinclair(rng, n, pool=()):
+    df = station_frame(rng, n, pool)
+    return pd.DataFrame({
+        'location' : df['city'] + ', ' + df['state'],
+        'station' : df['station'],
+        'Affiliations' : with_missing(rng, pd.Series(pick(rng, networks, n)) + ', ' + pick(rng, networks, n), .12),
+        'website' : with_missing(rng, df['website'], .17),
+        'city' : df['city'],
+        'state' : with_missing(rng, df['state'], .1),
+        'broadcaster' : 'Sinclair',
+        'source' : 'sbgi.net',
+        'collection_date' : collection_date,
+    })
+
+
+def generate_nexstar(rng, n, pool=()):
+    df = station_frame(rng, n, pool)
+    return df.assign(website=slugs(df['station']) + '.com', broadcaster='Nexstar',
+                     source='nexstar.tv', collection_date=collection_date)[
+        ['station', 'website', 'city', 'state', 'broadcaster', 'source', 'collection_date']]
+
+
+def generate_gray(rng, n, pool=()):
+    df = station_frame(rng, n, pool)
+    return pd.DataFrame({
+        'title' : df['station'],
+        'city' : df['city'],
+        'state' : df['state'],
+        'website' : 'www.' + slugs(df['station']) + pd.Series(pick(rng, ['', 'news', 'tv'], n)) + '.com',
+        'broadcaster' : 'Gray TV',
+        'source' : 'https://gray.tv/',
+        'collection_date' : '2023-05-17 10:56:06.089876',
+    })
+
+
+def generate_hearst(rng, n, pool=()):
+    df = station_frame(rng, n, pool)
+    newspaper = rng.random(n) < .4
+    name = (df['city'] + ' ' + pick(rng, paper_titles, n)).where(newspaper, df['station'] + '-TV')
+    handle = slugs(name)
+    return pd.DataFrame({
+        'city' : with_missing(rng, df['city'], .63),
+        'state' : with_missing(rng, df['state'], .63),
+        'network' : None,
+        'medium' : np.where(newspaper, 'newspaper', 'broadcasting'),
+        'website' : websites(rng, name),
+        'station' : name.where(~newspaper, None),
+        'name' : name,
+        'phone' : with_missing(rng, pd.Series(rng.integers(200, 999, n)).astype(str) + '-555-0100', .6),
+        'address' : with_missing(rng, '1 Main St ' + df['city'], .6),
+        'twitter' : with_missing(rng, 'https://twitter.com/' + handle, .6),
+        'facebook' : with_missing(rng, 'https://www.facebook.com/' + handle, .6),
+        'linkedin' : with_missing(rng, 'https://www.linkedin.com/company/' + handle, .9),
+        'instagram' : with_missing(rng, 'https://www.instagram.com/' + handle, .84),
+        'broadcaster' : 'Hearst',
+        'source' : 'hearst.com',
+        'collection_date' : collection_date,
+    })
+
+
+def newspaper_frame(rng, n):
+    city, state = places(rng, n)
+    name = city + ' ' + pick(rng, paper_titles, n)
+    weekly = rng.random(n) < .2
+    name[weekly] = name[weekly] + ' Weekly'
+    return pd.DataFrame({'city' : city, 'state' : state, 'name' : name, 'handle' : slugs(name)})
+
+
+def generate_usnpl(rng, n, pool=()):
+    df = newspaper_frame(rng, n)
+    handle = df['handle']
+    return pd.DataFrame({
+        'Geography' : df['state'].str.lower(),
+        'Medium' : 'Newspaper',
+        'City' : df['city'] + ', ' + df['state'],
+        'Name' : df['name'],
+        'Website' : pick(rng, ['http://www.', 'https://www.', 'http://'], n) + handle + '.com',
+        'Twitter_Name' : with_missing(rng, pick(rng, ['https://twitter.com/', 'https://www.twitter.com/', 'http://twitter.com/#!/'], n) + handle, .37),
+        'Facebook' : with_missing(rng, 'https://www.facebook.com/' + handle, .11),
+        'Instagram' : with_missing(rng, 'https://www.instagram.com/' + handle + '/', .82),
+        'Youtube' : with_missing(rng, 'https://www.youtube.com/user/' + handle, .6),
+        'Address' : pd.Series(rng.integers(1, 9999, n)).astype(str) + ' Main St ' + df['city'] + ', ' + df['state'],
+        'Editor' : with_missing(rng, pick(rng, ['Pat Lee', 'Sam Ortiz', 'Alex Kim', 'Jo Smith'], n), .01),
+        'Phone' : pd.Series(rng.integers(200, 999, n)).astype(str) + '-555-0199',
+        'source' : 'usnpl.com',
+        'collection_date' : collection_date,
+    })
+
+
+def generate_custom(rng, n, pool=()):
+    df = newspaper_frame(rng, n)
+    return pd.DataFrame({
+        'name' : df['name'],
+        'website' : 'https://www.' + df['handle'] + '.com',
+        'state' : df['state'],
+        'facebook' : None,
+        'youtube' : None,
+        'twitter_name' : with_missing(rng, df['handle'], .3),
+        'twitter_ID' : None,
+        'medium' : 'Newspapers',
+        'owner' : pick(rng, owners, n),
+    })
+
+
+generators = {
+    'usnpl' : generate_usnpl,
+    'station_index' : generate_station_index,
+    'custom' : generate_custom,
+    'nexstar' : generate_nexstar,
+    'sinclair' : generate_sinclair,
+    'gray' : generate_gray,
+    'hearst' : generate_hearst,
+}
+
+
+def generate(rows, seed=303, mix=mix):
+    '''{source: DataFrame} with about `rows` rows between them.'''
+    rng = np.random.default_rng(seed)
+    frames = {'station_index' : generate_station_index(rng, max(int(rows * mix['station_index']), 1))}
+    pool = frames['station_index']['station'].str.replace(r'-\w+$', '', regex=True)
+    for source, share in mix.items():
+        if source not in frames:
+            frames[source] = generators[source](rng, max(int(rows * share), 1), pool)
+    return frames
+
+
+def write_custom(df, filepath):
+    '''JSON lines, with half the rows spelling `twitter_name` as `twitter_Name` like the real file.'''
+    half = len(df) // 2
+    with open(filepath, 'w') as f:
+        df.iloc[:half].to_json(f, orient='records', lines=True)
+        df.iloc[half:].rename(columns={'twitter_name' : 'twitter_Name'}).to_json(f, orient='records', lines=True)
+
+
+def write_dataset(out_dir, rows, seed=303, mix=mix):
+    '''Writes a full set of synthetic intermediates to `out_dir`. Returns {source: rows}.'''
+    os.makedirs(out_dir, exist_ok=True)
+    frames = generate(rows, seed, mix)
+    for source, df in frames.items():
+        if source == 'custom':
+            write_custom(df, os.path.join(out_dir, os.path.basename(custom_station_file)))
+        else:
+            df.to_csv(os.path.join(out_dir, f'{source}.tsv'), sep='\t', index=False)
+    return {source : len(df) for source, df in frames.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Write synthetic intermediates for merge.py.')
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--out', required=True, help='directory to write to (not the real data directory!)')
+    parser.add_argument('--seed', type=int, default=303)
+    args = parser.parse_args()
+
+    if os.path.abspath(args.out) == os.path.abspath(data_dir):
+        raise SystemExit(f"refusing to overwrite the real intermediates in {data_dir}")
+    print(json.dumps(write_dataset(args.out, args.rows, args.seed), indent=2))
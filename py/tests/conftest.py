@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the scripts import each other by module name and find the data relative to py/
+py_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, py_dir)
+os.environ.setdefault('LOCAL_NEWS_DATA_ROOT', os.path.dirname(py_dir))
@@ -0,0 +1,32 @@
+import pandas as pd
+
+import download_data
+from align import explode_subchannels
+
+# as scraped from stationindex
+kmph = {'station' : 'KMPH', 'id' : '"Fox 26"', 'city' : ' Visalia, CA', 'owner' : ' Sinclair Broadcast Group',
+        'website' : 'http://www.kmph.com/', 'station_info' : ' Digital Full-Power - 219 kW',
+        'subchannels' : ' 26.1 KMPH/Fox, 26.2 This TV, 26.3 Comet'}
+knic = {'station' : 'KNIC-CD', 'id' : None, 'city' : ' San Antonio, TX', 'owner' : ' Univision',
+        'website' : None, 'station_info' : ' Digital Class-A - 15 kW', 'subchannels' : None}
+
+
+def test_explode_subchannels():
+    df = explode_subchannels(pd.DataFrame([kmph, knic]))
+    df = df.astype(object).where(df.notna(), None)
+    assert df.to_dict('list') == {
+        'station' : ['KMPH', 'KMPH', 'KMPH'],
+        'channel' : ['26.1', '26.2', '26.3'],
+        'name' : ['KMPH/Fox', 'This TV', 'Comet'],
+        'network' : ['Fox', None, None],
+    }
+
+
+def test_save_stationindex_writes_subchannels(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_data, 'stationindex_file', str(tmp_path / 'station_index.tsv'))
+    monkeypatch.setattr(download_data, 'stationindex_subchannels_file', str(tmp_path / 'station_index_subchannels.tsv'))
+    download_data.save_stationindex([kmph, knic])
+
+    df = pd.read_csv(tmp_path / 'station_index_subchannels.tsv', sep='\t', dtype=str)
+    assert df['channel'].tolist() == ['26.1', '26.2', '26.3']
+    assert (df['station'] == 'KMPH').all()
@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+import client
+from client import load_local_news
+
+parquet = pytest.mark.skipif(client.pq is None, reason='pyarrow is not installed')
+
+release = '''name,state,medium,owner,website,lat,lng,cluster,canonical
+Anchorage Daily News,AK,Newspaper,,http://www.adn.com,61.2,-149.9,0,True
+KTUU,ak ,TV station,Gray TV,http://www.ktuu.com/,61.2,-149.9,1,True
+Kansas City Star,MO,Newspaper,McClatchy,http://www.kansascity.com,39.1,-94.6,2,True
+Kansas City Star,MO,Newspaper,McClatchy,https://www.kansascity.com/,39.1,-94.6,2,False
+KCTV,KS,TV station,Gray TV,http://www.kctv5.com,39.0,-94.7,4,True
+The Day,,Newspaper,,http://www.theday.com,,,5,True
+'''
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'local_news_dataset_2023.csv'
+    path.write_text(release)
+    return str(path)
+
+
+def load(source, tmp_path, **kwargs):
+    return load_local_news(2023, source=source, cache_dir=str(tmp_path / 'cache'), **kwargs)
+
+
+@parquet
+def test_cache_is_parquet(source, tmp_path):
+    load(source, tmp_path)
+    assert list((tmp_path / 'cache' / '2023').glob('*.parquet/state=MO/part-0.parquet'))
+
+
+@parquet
+def test_parquet_filters(source, tmp_path):
+    df = load(source, tmp_path, columns=['name', 'website'], filters={'state' : ['mo', 'KS'], 'medium' : 'Newspaper'})
+    assert list(df.columns) == ['name', 'website']
+    assert df['website'].tolist() == ['http://www.kansascity.com', 'https://www.kansascity.com/']
+
+    # rows without an owner match no comparison on it, as in pyarrow
+    df = load(source, tmp_path, filters=[('state', 'in', ['AK', 'MO']), ('owner', '!=', 'Gray TV')])
+    assert df['name'].tolist() == ['Kansas City Star', 'Kansas City Star']
+
+    df = load(source, tmp_path, columns=['name'], filters=[('lat', '>', 39.05), ('canonical', '==', True)])
+    assert sorted(df['name']) == ['Anchorage Daily News', 'KTUU', 'Kansas City Star']
+
+
+@parquet
+def test_parquet_matches_csv(source, tmp_path, monkeypatch):
+    filters = [('state', 'not in', ['AK']), ('medium', 'in', ['Newspaper', 'TV station']), ('owner', '!=', 'Gannett')]
+    parquet = load(source, tmp_path, filters=filters, memory_map=True)
+    monkeypatch.setattr(client, 'pq', None)
+    csv = load_local_news(2023, source=source, cache_dir=str(tmp_path / 'csv_cache'), filters=filters)
+    sort = lambda df: df.sort_values(['name', 'website']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(sort(parquet), sort(csv))
+    assert csv['cluster'].dtype == 'Int64' and csv['canonical'].dtype == 'boolean'
+
+
+def test_unreleased_year_needs_a_source(tmp_path):
+    with pytest.raises(ValueError, match='pass source='):
+        load_local_news(2023, cache_dir=str(tmp_path / 'cache'))
@@ -0,0 +1,19 @@
+import pandas as pd
+import pytest
+
+from cube import write_cube, read_cube, rollup
+
+
+def test_stale_cube_is_refused(tmp_path):
+    dataset = tmp_path / 'local_news_dataset_2023.csv'
+    cube_file = str(tmp_path / 'local_news_dataset_2023_cube.json')
+    df = pd.DataFrame({'name' : ['KTUU', 'Anchorage Daily News', 'The Day'], 'state' : ['AK', 'AK', None],
+                       'medium' : ['TV station', 'Newspaper', 'Newspaper'], 'owner' : ['Gray TV', None, None],
+                       'source' : ['stationindex', 'usnpl.com', 'usnpl.com']})
+    df.to_csv(dataset, index=False)
+    write_cube(df, cube_file, str(dataset))
+    assert rollup(read_cube(cube_file), 'state').tolist() == [2, 1]
+
+    df.iloc[:2].to_csv(dataset, index=False)
+    with pytest.raises(ValueError, match='rebuild'):
+        read_cube(cube_file)
@@ -0,0 +1,42 @@
+import pandas as pd
+
+from handles import canonicalize_handles
+
+
+def test_handles():
+    s = pd.Series(['https://twitter.com/adndotcom', '@ValleySun', 'http://www.adn.com', None])
+    assert canonicalize_handles(s, 'twitter').tolist() == ['adndotcom', 'valleysun', pd.NA, pd.NA]
+
+
+def test_no_handles_is_still_a_string_column():
+    handles = canonicalize_handles(pd.Series([None, None]), 'twitter')
+    assert handles.dtype == 'string'
+    assert (handles + '|' + pd.Series(['AK', 'MO'], dtype='string')).isna().all()
+
+
+def test_hosts_query_strings_and_slashes():
+    s = pd.Series(['https://x.com/ADNdotcom', 'https://mobile.twitter.com/adndotcom/', 'x.com/adndotcom?lang=en',
+                   'https://twitter.com/#!/adndotcom', 'twitter.com/adndotcom/status/123', 'http://www.adn.com/x.com'])
+    assert canonicalize_handles(s, 'twitter').tolist() == ['adndotcom'] * 5 + [pd.NA]
+    s = pd.Series(['https://www.facebook.com/akdispatch/?ref=bookmarks', 'fb.com/akdispatch#about',
+                   'https://www.facebook.com/profile.php?id=100064&sk=about',
+                   'https://www.facebook.com/pages/Outlook-Newspapers/112985262083589'])
+    assert canonicalize_handles(s, 'facebook').tolist() == ['akdispatch', 'akdispatch', '100064', '112985262083589']
+    s = pd.Series(['https://www.youtube.com/user/AlaskaDispatch/', 'youtube.com/c/AlaskaDispatch?view=0',
+                   'https://www.youtube.com/channel/UCe9ap1kstn9nqt7m8njrnsw/videos'])
+    assert canonicalize_handles(s, 'youtube').tolist() == ['alaskadispatch', 'alaskadispatch', 'channel/uce9ap1kstn9nqt7m8njrnsw']
+
+
+def test_platform_pages_are_not_handles():
+    for platform, urls in {
+        'twitter' : ['https://twitter.com/search?q=%23news', 'https://twitter.com/intent/user?screen_name=adndotcom',
+                     'https://x.com/share?url=adn.com', 'twitter.com/hashtag/alaska', 'https://twitter.com/i/lists/1',
+                     'https://twitter.com/home'],
+        'facebook' : ['https://www.facebook.com/sharer/sharer.php?u=adn.com', 'https://www.facebook.com/groups/123/',
+                      'https://www.facebook.com/watch/?v=1', 'https://www.facebook.com/hashtag/news'],
+        'instagram' : ['https://www.instagram.com/p/ABC123/', 'https://www.instagram.com/reel/ABC123/',
+                       'instagram.com/explore/tags/news'],
+        'youtube' : ['https://www.youtube.com/watch?v=abc', 'https://www.youtube.com/embed/abc',
+                     'https://www.youtube.com/shorts/abc', 'https://www.youtube.com/results?search_query=news'],
+    }.items():
+        assert canonicalize_handles(pd.Series(urls), platform).isna().all(), platform
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from linkage import write_crosswalk, load_crosswalk
+
+
+def test_crosswalk_is_shared_by_every_year():
+    paths = set()
+    for year in ['2018', '2023']:
+        env = dict(os.environ, LOCAL_NEWS_YEAR=year)
+        out = subprocess.run([sys.executable, '-c', 'from config import *; print(crosswalk_file)'],
+                             cwd=os.path.dirname(os.path.dirname(__file__)), env=env,
+                             capture_output=True, text=True, check=True)
+        paths.add(os.path.abspath(out.stdout.strip()))
+    assert len(paths) == 1
+
+
+def test_write_crosswalk(tmp_path):
+    path = str(tmp_path / 'data_links' / 'outlet_crosswalk.csv')
+    df = pd.DataFrame({'outlet_id' : ['ln-2023-0123456789'], 'year' : [2023], 'name' : ['KTUU'],
+                       'state' : ['AK'], 'domain' : ['ktuu.com']})
+    write_crosswalk(df, path)
+    write_crosswalk(df, path)
+    assert os.listdir(os.path.dirname(path)) == ['outlet_crosswalk.csv']
+    assert load_crosswalk(path)['outlet_id'].tolist() == ['ln-2023-0123456789']
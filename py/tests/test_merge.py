@@ -0,0 +1,38 @@
+import pandas as pd
+
+from merge import mark_near_duplicates
+
+columns = ['name', 'city', 'state', 'medium', 'website', 'domain', 'twitter', 'facebook']
+rows = [
+    ('WCBS', 'New York City', 'NY', 'TV station', 'https://newyork.cbslocal.com/', 'cbslocal.com', None, None),
+    ('BizWest', 'Fort Collins, CO', 'CO', 'Newspaper', 'http://bizwest.com', 'bizwest.com', None, None),
+    ('Alaska Dispatch News', 'Anchorage, AK', 'AK', 'Newspaper', 'http://www.adn.com', 'adn.com', 'adndotcom', None),
+    ('BizWest', 'Boulder, CO', 'CO', 'Newspaper', 'https://www.BizWest.com/', 'bizwest.com', None, None),
+    ('KTUU', 'Anchorage', 'AK', 'TV station', 'http://www.ktuu.com/', 'ktuu.com', None, None),
+    ('Spokesman-Review', 'Spokane, WA', 'WA', 'Newspaper', 'http://www.spokesman.com', 'spokesman.com', 'spokesmanreview', None),
+    ('The Spokesman Review', 'Spokane Valley, WA', 'WA', 'Newspaper', 'https://www.spokesman.com/', 'spokesman.com', None, None),
+]
+
+
+def clusters(df):
+    cluster, canonical = mark_near_duplicates(df)
+    return pd.DataFrame({'name' : df['name'].to_numpy(), 'cluster' : cluster, 'canonical' : canonical},
+                        index=df.index)
+
+
+def test_near_duplicates_share_a_cluster():
+    df = clusters(pd.DataFrame(rows, columns=columns))
+    assert df['cluster'].nunique() == 5
+    assert df.loc[[1, 3], 'cluster'].nunique() == 1
+    assert df.loc[[5, 6], 'canonical'].tolist() == [True, False]
+
+
+def test_cluster_ids_outlive_other_rows():
+    df = pd.DataFrame(rows, columns=columns)
+    before = clusters(df)
+    for dropped in range(len(df)):
+        after = clusters(df.drop(index=dropped))
+        kept = before.drop(index=dropped)
+        # a cluster only changes ID when the row dropped was its canonical one
+        moved = kept['cluster'] == before.loc[dropped, 'cluster']
+        pd.testing.assert_series_equal(after.loc[~moved, 'cluster'], kept.loc[~moved, 'cluster'])
@@ -0,0 +1,57 @@
+import pandas as pd
+
+from neardup import near_duplicates
+
+columns = ['name', 'city', 'state', 'website', 'twitter', 'facebook']
+
+
+def marked(rows):
+    return near_duplicates(pd.DataFrame(rows, columns=columns))
+
+
+def clusters(df):
+    return df['cluster'].nunique()
+
+
+def test_same_paper_in_two_states_is_kept_in_both():
+    # usnpl lists these under two states each
+    for rows in [
+        [('Kansas City Star', 'Arkansas City, KS', 'ks', 'http://www.kansascity.com', 'https://twitter.com/KCStar', 'https://www.facebook.com/kansascitystar'),
+         ('Kansas City Star', 'Kansas City, MO', 'mo', 'http://www.kansascity.com', 'https://twitter.com/KCStar', 'https://www.facebook.com/kansascitystar')],
+        [('Spokesman Review', "Coeur d'Alene, ID", 'id', 'http://www.spokesman.com', 'https://twitter.com/spokesmanreview', 'https://www.facebook.com/spokesmanreview'),
+         ('Spokesman-Review', 'Spokane, WA', 'wa', 'http://www.spokesman.com', 'https://twitter.com/spokesmanreview', 'https://www.facebook.com/spokesmanreview')],
+        [('Texarkana Gazette', 'Texarkana, AR', 'ar', 'http://www.texarkanagazette.com', 'https://twitter.com/TxkGazette', 'https://www.facebook.com/TexarkanaGazette'),
+         ('Texarkana Gazette', 'Texarkana, TX', 'tx', 'http://www.texarkanagazette.com', 'https://twitter.com/TxkGazette', 'https://www.facebook.com/TexarkanaGazette')],
+        [('Chatham Courier', 'Chatham, NJ', 'nj', 'http://www.newjerseyhills.com/chatham_courier', 'https://twitter.com/ChathamCourier', 'https://www.facebook.com/chathamcourier'),
+         ('Chatham Courier', 'Chatham, NY', 'ny', 'http://www.newjerseyhills.com/chatham_courier', 'https://twitter.com/ChathamCourier1', 'https://www.facebook.com/chathamcourier')],
+    ]:
+        df = marked(rows)
+        assert clusters(df) == 2, rows[0][0]
+        assert df['canonical'].all()
+
+
+def test_editions_sharing_a_site_are_not_merged():
+    df = marked([
+        ('News-Gazette', 'Champaign, IL', 'il', 'http://www.news-gazette.com', 'https://twitter.com/news_gazette', 'https://www.facebook.com/newsgazette'),
+        ('Danville News Gazette', 'Danville, IL', 'il', 'http://www.news-gazette.com', 'https://twitter.com/news_gazette', 'https://www.facebook.com/newsgazette'),
+    ])
+    assert clusters(df) == 2
+
+
+def test_paper_listed_under_two_cities_is_one_cluster():
+    df = marked([
+        ('BizWest', 'Fort Collins, CO', 'co', 'http://bizwest.com', None, None),
+        ('BizWest', 'Boulder, CO', 'co', 'https://www.BizWest.com/', None, None),
+    ])
+    assert clusters(df) == 1
+    assert df['canonical'].sum() == 1
+
+
+def test_canonical_row_is_the_one_in_the_city_of_its_name():
+    # the Lees Summit row has more fields filled in, but the Kansas City row is the paper's home
+    df = marked([
+        ('Kansas City Star', 'Lees Summit, MO', 'mo', 'http://www.kansascity.com', 'https://twitter.com/KCStar', 'https://www.facebook.com/kansascitystar'),
+        ('Kansas City Star', 'Kansas City, MO', 'mo', 'http://www.kansascity.com', None, None),
+    ])
+    assert clusters(df) == 1
+    assert df.loc[df['canonical'], 'city'].tolist() == ['Kansas City, MO']
@@ -0,0 +1,34 @@
+import pytest
+
+from bench_parsers import recorded_pages, fixture_pages_dir, same
+from parsers import extract, pages, available_backends
+
+fixtures = recorded_pages(fixture_pages_dir)
+
+
+def test_every_extractor_has_fixtures():
+    assert set(fixtures) == set(pages)
+
+
+@pytest.mark.parametrize('page', pages)
+def test_backends_agree_on_fixtures(page):
+    if 'lxml' not in available_backends():
+        pytest.skip('lxml is not installed')
+    for content in fixtures[page]:
+        assert same(extract(page, content, 'lxml'), extract(page, content, 'bs4'))
+
+
+def test_station_without_owner():
+    # KCFT-LP has no owner on stationindex
+    stations = extract('stationindex_stations', fixtures['stationindex_stations'][1], 'bs4')
+    station = next(s for s in stations if s['station'] == 'KCFT-LP')
+    assert station['owner'] == ''
+    assert station['station_info'] == ' Class-A - 50 kW'
+
+
+def test_usnpl_state_keeps_accents_and_missing_links():
+    papers = extract('usnpl_state', fixtures['usnpl_state'][1], 'bs4')
+    outlook = next(p for p in papers if p['name'] == 'Outlook')
+    assert outlook['city'] == 'La Cañada Flintridge, CA'
+    assert outlook['twitter'] == ''
+    assert outlook['facebook'].startswith('https://www.facebook.com/pages/Outlook-Newspapers')
@@ -0,0 +1,36 @@
+import profiling
+
+kept = []
+
+
+def first_run():
+    kept.append([bytearray(1000) for _ in range(200)])
+
+
+def second_run():
+    kept.append([bytearray(1000) for _ in range(300)])
+
+
+def test_every_run_of_a_stage_is_counted(tmp_path):
+    profiling.enable()
+    try:
+        for run in [first_run, second_run, second_run]:
+            with profiling.profile_stage('parse'):
+                run()
+    finally:
+        profiling.enable(False)
+
+    result = profiling._results['parse']
+    assert result['runs'] == 3
+    sizes = {lineno : size for (filename, lineno), (size, count) in result['allocations'].items()
+             if filename == __file__}
+    first = first_run.__code__.co_firstlineno + 1
+    second = second_run.__code__.co_firstlineno + 1
+    assert sizes[first] >= 200 * 1000
+    assert sizes[second] >= 2 * 300 * 1000
+    assert result['peak'] >= 300 * 1000
+
+    profiling.dump_profiles(str(tmp_path))
+    report = (tmp_path / 'parse.alloc.txt').read_text()
+    assert 'over 3 runs' in report
+    assert f'{__file__}:{second}:' in report
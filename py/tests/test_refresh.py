@@ -0,0 +1,43 @@
+import pandas as pd
+
+import download_data
+import refresh
+
+
+def test_edit_to_an_existing_station_is_a_change(tmp_path, monkeypatch):
+    filepath = str(tmp_path / 'sinclair.tsv')
+    scrapes = iter([
+        pd.DataFrame({'station' : ['KMPH', 'WBMA'], 'website' : ['kmph.com', 'abc3340.com']}),
+        pd.DataFrame({'station' : ['KMPH', 'WBMA'], 'website' : ['kmph.com', 'abc3340.com']}),
+        # same stations, one website changed: the saved file keeps the old row
+        pd.DataFrame({'station' : ['KMPH', 'WBMA'], 'website' : ['kmph.com', 'www.abc3340.com']}),
+    ])
+
+    def download_sinclair():
+        df = next(scrapes)
+        download_data.save_with_existing(df, filepath, 'station', 'sinclair')
+        return df
+
+    monkeypatch.setattr(download_data, 'download_sinclair', download_sinclair)
+    monkeypatch.setattr(refresh, 'write_report', lambda name: None)
+    history = refresh.RefreshHistory(str(tmp_path / 'history.sqlite'))
+    try:
+        for _ in range(3):
+            refresh.refresh(refresh.plan(history, only=['sinclair'], force=['sinclair']), history)
+        changed = history.frame('sinclair')['changed'].tolist()
+    finally:
+        history.close()
+
+    assert changed[1:] == [0, 1]
+    assert pd.read_csv(filepath, sep='\t')['website'].tolist() == ['kmph.com', 'abc3340.com']
+
+
+def test_download_usnpl_returns_what_it_scraped(tmp_path, monkeypatch):
+    paper = dict(Geography='ak', Medium='Newspaper', City='Anchorage, AK', Name='Alaska Dispatch News',
+                 Website='http://www.adn.com/', Twitter_Name='https://twitter.com/adndotcom')
+    monkeypatch.setattr(download_data, 'states', ['ak'])
+    monkeypatch.setattr(download_data, 'scrape_usnpl_state', lambda state: [paper])
+    monkeypatch.setattr(download_data, 'usnpl_file', str(tmp_path / 'usnpl.tsv'))
+    df = download_data.download_usnpl()
+    assert df['Website'].tolist() == ['http://www.adn.com']
+    assert pd.read_csv(tmp_path / 'usnpl.tsv', sep='\t')['Name'].tolist() == ['Alaska Dispatch News']
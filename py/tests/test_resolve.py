@@ -0,0 +1,39 @@
+import pandas as pd
+
+from resolve import resolve_stations
+
+
+def stations(rows):
+    return pd.DataFrame(rows, columns=['station', 'website', 'city', 'state', 'source'])
+
+
+def test_low_power_license_from_the_same_source_is_kept():
+    # sbgi.net lists both KMPH and KMPH-CD, stationindex only KMPH
+    df = stations([
+        ('KMPH', 'https://www.kmph.com/Newsletter', 'Fresno - Visalia', 'CA', 'sbgi.net'),
+        ('KMPH-CD', 'https://www.kmph.comNewsletter', 'Fresno - Visalia', 'CA', 'sbgi.net'),
+        ('KMPH', 'http://www.kmph.com/', ' Visalia', 'CA', 'stationindex'),
+    ])
+    out = resolve_stations(df).set_index('station')
+    assert sorted(out.index) == ['KMPH', 'KMPH-CD']
+    assert out.loc['KMPH', 'sources'] == 'sbgi.net,stationindex'
+    assert out.loc['KMPH-CD', 'sources'] == 'sbgi.net'
+
+
+def test_low_power_root_needs_domain_or_city_to_agree():
+    df = stations([
+        ('KAZT', 'http://www.aztv.com/', ' Prescott', 'AZ', 'stationindex'),
+        ('KAZT-CD', None, ' Phoenix', 'AZ', 'gray'),
+    ])
+    assert len(resolve_stations(df)) == 2
+
+    df.loc[1, 'city'] = 'Prescott'
+    assert len(resolve_stations(df)) == 1
+
+
+def test_same_call_sign_across_sources_merges():
+    df = stations([
+        ('WXSP-CD', 'https://www.wotv4women.com/', 'Grand Rapids', 'MI', 'stationindex'),
+        ('WXSP-CD ', 'wotv4women.com', None, 'MI', 'nexstar.tv'),
+    ])
+    assert len(resolve_stations(df)) == 1
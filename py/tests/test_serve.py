@@ -0,0 +1,16 @@
+from serve import OutletIndex
+
+release = '''name,state,medium,owner,website
+Arkansas Democrat-Gazette,AR,Newspaper,WEHCO Media,http://www.arkansasonline.com
+Texarkana Gazette, AR,Newspaper,WEHCO Media,http://www.texarkanagazette.com
+KTUU,AK,TV station,Gray TV,http://www.ktuu.com/
+'''
+
+
+def test_padded_states_are_found(tmp_path):
+    path = tmp_path / 'local_news_dataset_2023.csv'
+    path.write_text(release)
+    index = OutletIndex(str(path))
+    for key in ['AR', ' ar ']:
+        assert [r['name'] for r in index.lookup('state', key)] == ['Arkansas Democrat-Gazette', 'Texarkana Gazette']
+    assert index.lookup('owner', 'wehco media ')[1]['name'] == 'Texarkana Gazette'
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from workqueue import TaskQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = TaskQueue(str(tmp_path / 'queue.sqlite'), visibility_timeout=60, max_attempts=3)
+    yield q
+    q.close()
+
+
+def test_worker_dying_on_last_attempt_fails_the_task(queue):
+    queue.enqueue('usnpl', ['AK'])
+    queue.db.execute("update tasks set status = 'leased', worker = 'dead', attempts = 3, lease_until = 0")
+
+    assert queue.counts('usnpl') == {'failed' : 1}
+    assert queue.lease('usnpl', 'w1') is None
+    assert [key for key, _, _ in queue.failures('usnpl')] == ['AK']
+
+
+def test_expired_lease_with_attempts_left_is_leased_again(queue):
+    queue.enqueue('usnpl', ['AK'])
+    queue.db.execute("update tasks set status = 'leased', worker = 'dead', attempts = 1, lease_until = 0")
+
+    assert queue.counts('usnpl') == {'pending' : 1}
+    assert queue.lease('usnpl', 'w1') == 'AK'
+
+
+def test_worker_that_lost_its_lease_cannot_complete_or_fail(queue):
+    queue.enqueue('usnpl', ['AK'])
+    assert queue.lease('usnpl', 'slow') == 'AK'
+    queue.db.execute('update tasks set lease_until = ?', (time.time() - 1,))
+    assert queue.lease('usnpl', 'fast') == 'AK'
+
+    assert not queue.complete('usnpl', 'AK', 'slow')
+    assert not queue.fail('usnpl', 'AK', 'slow', 'timeout')
+    assert queue.counts('usnpl') == {'leased' : 1}
+
+    assert queue.complete('usnpl', 'AK', 'fast')
+    assert queue.counts('usnpl') == {'done' : 1}
+    assert not queue.fail('usnpl', 'AK', 'slow', 'timeout')
+    assert queue.counts('usnpl') == {'done' : 1}
@@ -0,0 +1,217 @@
+import os
+import re
+import ssl
+import time
+import sqlite3
+import asyncio
+from urllib.parse import urlsplit, urljoin
+
+import pandas as pd
+
+from config import *
+from metrics import count
+
+'''
+Bulk URL validation and liveness/redirect resolution for outlet websites.
+
+stationindex sometimes puts strings that aren't URLs in the website column,
+and plenty of outlet websites have since moved or died. This stage
+
+1. validates every website at once with one compiled pattern,
+2. resolves the distinct valid ones with concurrent HEAD requests (falling back
+   to GET when HEAD isn't allowed), following redirects, and
+3. remembers each result in a SQLite cache for `url_cache_ttl` seconds, so
+   reruns only go to the network for new or stale URLs.
+
+The HTTP client is a few lines of asyncio, so it works against any server,
+including a local stand-in (see bench_urlcheck.py).
+
+    df = check_urls(df, 'website')   # adds website_valid, website_final, website_alive, website_status
+'''
+
+url_pattern = re.compile(
+    r'https?://'
+    r'(?:'
+        r'(?:[a-z0-9](?:[a-z0-9\-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}\.?'  # domain
+        r'|localhost'
+        r'|\d{1,3}(?:\.\d{1,3}){3}'  # ipv4
+    r')'
+    r'(?::\d{2,5})?'
+    r'(?:[/?#][^\s]*)?',
+    re.IGNORECASE)
+
+# statuses that mean "the server is there, it just doesn't like HEAD"
+head_not_allowed = {400, 403, 405, 501}
+
+max_redirects = 10
+
+
+def normalize_urls(urls):
+    '''Strips whitespace and adds `http://` to bare hosts like `www.webcenter11.com`.'''
+    urls = urls.astype('string').str.strip()
+    missing_scheme = ~urls.str.contains(r'^[a-z][a-z0-9+.\-]*://', case=False, regex=True).fillna(True)
+    return urls.mask(missing_scheme & urls.notna(), 'http://' + urls)
+
+
+def valid_urls(urls):
+    '''Boolean Series, True where the (normalized) URL is well formed.'''
+    return normalize_urls(urls).str.fullmatch(url_pattern).fillna(False).astype(bool)
+
+
+async def request_head(url, method, timeout):
+    '''Sends one request and returns (status, headers), without reading the body.'''
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+
+    context = ssl.create_default_context() if secure else None
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=context,
+                                server_hostname=parts.hostname if secure else None),
+        timeout)
+    try:
+        headers = generate_request_header()
+        request = (f"{method} {path} HTTP/1.1\r\n"
+                   f"Host: {parts.netloc}\r\n"
+                   f"User-Agent: {headers['User-Agent']}\r\n"
+                   f"Accept: {headers['Accept']}\r\n"
+                   f"Connection: close\r\n\r\n")
+        writer.write(request.encode())
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            response_headers[k.strip().lower()] = v.strip()
+        return status, response_headers
+    finally:
+        writer.close()
+
+
+async def resolve_url(url, timeout=10):
+    '''
+    Follows redirects from `url`. Returns a dict with the final URL, its status,
+    whether it is alive (2xx at the end of the chain) and any error.
+    '''
+    result = dict(url=url, final_url=None, status=None, alive=False, redirects=0, error=None)
+    current = url
+    try:
+        for _ in range(max_redirects + 1):
+            status, headers = await request_head(current, 'HEAD', timeout)
+            if status in head_not_allowed:
+                status, headers = await request_head(current, 'GET', timeout)
+
+            if 300 <= status < 400 and 'location' in headers:
+                current = urljoin(current, headers['location'])
+                result['redirects'] += 1
+                continue
+
+            result.update(final_url=current, status=status, alive=200 <= status < 300)
+            return result
+        result.update(final_url=current, error='too many redirects')
+    except (OSError, asyncio.TimeoutError, ValueError, IndexError, ssl.SSLError) as e:
+        result.update(final_url=current, error=type(e).__name__)
+
+    return result
+
+
+async def resolve_all(urls, concurrency=url_check_concurrency, per_host=4, timeout=10):
+    '''Resolves `urls` concurrently, at most `per_host` at a time against one host.'''
+    everything = asyncio.Semaphore(concurrency)
+    hosts = {}
+
+    async def one(url):
+        host = urlsplit(url).hostname
+        host_limit = hosts.setdefault(host, asyncio.Semaphore(per_host))
+        async with everything, host_limit:
+            result = await resolve_url(url, timeout)
+        count('url_checks', 1, alive=result['alive'])
+        return result
+
+    return await asyncio.gather(*[one(u) for u in urls])
+
+
+class URLCache:
+    '''Resolved URLs in SQLite, each good for `ttl` seconds.'''
+    def __init__(self, filepath=url_cache_file, ttl=url_cache_ttl):
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        # shared by every year's build, which may be running at the same time
+        self.db = sqlite3.connect(filepath, timeout=cache_lock_timeout)
+        self.db.execute('pragma journal_mode=wal')
+        self.db.execute('''create table if not exists urls (
+            url text primary key, final_url text, status integer, alive integer,
+            redirects integer, error text, checked_at real)''')
+
+    def get_many(self, urls):
+        '''{url: result} for the urls with a fresh cached result.'''
+        found = {}
+        fresh_after = time.time() - self.ttl
+        urls = list(urls)
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            rows = self.db.execute(
+                f"select url, final_url, status, alive, redirects, error from urls "
+                f"where checked_at > ? and url in ({','.join('?' * len(chunk))})",
+                [fresh_after] + chunk)
+            for url, final_url, status, alive, redirects, error in rows:
+                found[url] = dict(url=url, final_url=final_url, status=status, alive=bool(alive),
+                                  redirects=redirects, error=error)
+        return found
+
+    def put_many(self, results):
+        now = time.time()
+        self.db.executemany(
+            'insert or replace into urls values (?, ?, ?, ?, ?, ?, ?)',
+            [(r['url'], r['final_url'], r['status'], int(r['alive']), r['redirects'], r['error'], now)
+             for r in results])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def check_urls(df, col='website', cache_file=url_cache_file, ttl=url_cache_ttl,
+               concurrency=url_check_concurrency, timeout=10):
+    '''
+    Validates and resolves `df[col]`. Returns a copy of `df` with `<col>_valid`,
+    `<col>_final`, `<col>_alive` and `<col>_status` columns.
+    '''
+    urls = normalize_urls(df[col])
+    valid = urls.str.fullmatch(url_pattern).fillna(False).astype(bool)
+    distinct = urls[valid].unique().tolist()
+
+    cache = URLCache(cache_file, ttl)
+    try:
+        results = cache.get_many(distinct)
+        todo = [u for u in distinct if u not in results]
+        print(f"Checking {len(todo)} urls ({len(results)} cached, {int((~valid).sum())} invalid)")
+        if todo:
+            fresh = asyncio.run(resolve_all(todo, concurrency, timeout=timeout))
+            cache.put_many(fresh)
+            results.update({r['url'] : r for r in fresh})
+    finally:
+        cache.close()
+
+    df_results = pd.DataFrame.from_dict(results, orient='index')
+    df = df.copy()
+    df[f'{col}_valid'] = valid.values
+    if df_results.empty:
+        df[f'{col}_final'] = None
+        df[f'{col}_alive'] = False
+        df[f'{col}_status'] = None
+        return df
+
+    df[f'{col}_final'] = urls.map(df_results['final_url']).values
+    df[f'{col}_alive'] = urls.map(df_results['alive']).fillna(False).astype(bool).values
+    df[f'{col}_status'] = urls.map(df_results['status']).astype('Int64').values
+
+    return df
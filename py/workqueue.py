@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import argparse
+import threading
+import multiprocessing
+
+from config import *
+from metrics import span, count, write_report
+
+'''
+Work-queue mode for the usnpl and stationindex crawls.
+
+One crawler is limited by one machine and one IP's rate budget. Here the crawl
+is cut into tasks (a usnpl state, a stationindex market page) that any number
+of worker processes, on any number of hosts, lease from a queue:
+
+    python workqueue.py enqueue usnpl                 # one task per state in `states`
+    python workqueue.py work usnpl --processes 4      # run on as many hosts as you like
+    python workqueue.py status usnpl
+    python workqueue.py reduce usnpl                  # writes usnpl.tsv
+
+A lease lasts `queue_visibility_timeout` seconds and is renewed while the
+worker is busy. If a worker dies its task becomes visible again once the
+lease runs out and another worker picks it up. A task that fails
+`queue_max_attempts` times, or whose worker dies on the last attempt, is
+marked failed and left for `status` to show. Only the worker holding the
+lease can complete or fail a task, so one that lost its lease can't
+overwrite the result of the worker that took over.
+
+Each finished task writes its rows to its own segment file under `queue_dir`
+(atomically, so a task that runs twice just rewrites the same segment).
+`reduce` reads every segment and saves them the way the single-process
+scraper does.
+
+The broker is a SQLite file, a stand-in for a real queue. Workers on other
+hosts need `queue_dir` on a shared filesystem with working file locks.
+'''
+
+# job -> (download_data function listing the task keys,
+#         function scraping one key into a list of rows,
+#         function saving every row)
+jobs = {
+    'usnpl' : (None, 'scrape_usnpl_state', 'save_usnpl'),
+    'stationindex' : ('stationindex_market_urls', 'scrape_stationindex_market', 'save_stationindex'),
+}
+
+
+def task_keys(job):
+    if job == 'usnpl':
+        return list(states)
+    import download_data
+    return getattr(download_data, jobs[job][0])()
+
+
+class TaskQueue:
+    '''Leased tasks in SQLite. Every method is a single short transaction.'''
+    def __init__(self, filepath=queue_file, visibility_timeout=queue_visibility_timeout,
+                 max_attempts=queue_max_attempts):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+        self.db = sqlite3.connect(filepath, timeout=60, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('''create table if not exists tasks (
+            job text, key text, status text default 'pending', worker text,
+            lease_until real, attempts integer default 0, error text,
+            primary key (job, key))''')
+
+    def enqueue(self, job, keys):
+        '''Adds tasks that aren't queued yet. Returns how many were added.'''
+        with self.lock:
+            before = self.db.total_changes
+            self.db.executemany('insert or ignore into tasks (job, key) values (?, ?)',
+                                [(job, k) for k in keys])
+            return self.db.total_changes - before
+
+    def expire(self, job, now):
+        '''Marks failed the tasks whose worker died on their last attempt. Caller holds the lock.'''
+        self.db.execute(
+            '''update tasks set status = 'failed', lease_until = null,
+               error = coalesce(error, 'lease expired on the last attempt')
+               where job = ? and status = 'leased' and lease_until < ? and attempts >= ?''',
+            (job, now, self.max_attempts))
+
+    def lease(self, job, worker):
+        '''Takes the next visible task, or returns None if there isn't one.'''
+        now = time.time()
+        with self.lock:
+            self.db.execute('begin immediate')
+            try:
+                self.expire(job, now)
+                row = self.db.execute(
+                    '''select key from tasks where job = ? and attempts < ? and
+                       (status = 'pending' or (status = 'leased' and lease_until < ?))
+                       order by rowid limit 1''',
+                    (job, self.max_attempts, now)).fetchone()
+                if row:
+                    self.db.execute(
+                        '''update tasks set status = 'leased', worker = ?, lease_until = ?,
+                           attempts = attempts + 1 where job = ? and key = ?''',
+                        (worker, now + self.visibility_timeout, job, row[0]))
+                self.db.execute('commit')
+            except Exception:
+                self.db.execute('rollback')
+                raise
+        return row[0] if row else None
+
+    def renew(self, job, key, worker):
+        '''Pushes the lease out again. False if the task isn't ours any more.'''
+        with self.lock:
+            cur = self.db.execute(
+                '''update tasks set lease_until = ? where job = ? and key = ?
+                   and worker = ? and status = 'leased' ''',
+                (time.time() + self.visibility_timeout, job, key, worker))
+        return cur.rowcount == 1
+
+    def complete(self, job, key, worker):
+        '''Marks the task done. False if its lease ran out and another worker has it now.'''
+        with self.lock:
+            cur = self.db.execute(
+                '''update tasks set status = 'done', lease_until = null, error = null
+                   where job = ? and key = ? and worker = ? and status = 'leased' ''',
+                (job, key, worker))
+        return cur.rowcount == 1
+
+    def fail(self, job, key, worker, error):
+        '''Puts the task back, or marks it failed once it's out of attempts. False if it isn't ours any more.'''
+        with self.lock:
+            cur = self.db.execute(
+                '''update tasks set status = case when attempts < ? then 'pending' else 'failed' end,
+                   lease_until = null, error = ? where job = ? and key = ? and worker = ? and status = 'leased' ''',
+                (self.max_attempts, error, job, key, worker))
+        return cur.rowcount == 1
+
+    def counts(self, job):
+        '''{status: number of tasks}, with expired leases counted as pending, or failed if they were the last attempt.'''
+        now = time.time()
+        with self.lock:
+            self.expire(job, now)
+            rows = self.db.execute(
+                '''select case when status = 'leased' and lease_until < ? then 'pending' else status end,
+                   count(*) from tasks where job = ? group by 1''',
+                (now, job)).fetchall()
+        return dict(rows)
+
+    def keys(self, job, status):
+        with self.lock:
+            return [k for k, in self.db.execute('select key from tasks where job = ? and status = ?',
+                                                (job, status))]
+
+    def failures(self, job):
+        with self.lock:
+            return self.db.execute("select key, attempts, error from tasks where job = ? and status = 'failed'",
+                                   (job,)).fetchall()
+
+    def reset(self, job):
+        with self.lock:
+            self.db.execute('delete from tasks where job = ?', (job,))
+
+    def close(self):
+        self.db.close()
+
+
+def segment_file(job, key, segment_dir=queue_dir):
+    name = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(segment_dir, job, f'{name}.jsonl')
+
+
+def write_segment(job, key, rows, segment_dir=queue_dir):
+    filepath = segment_file(job, key, segment_dir)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    tmp = f'{filepath}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        for row in rows:
+            f.write(json.dumps(row, default=str) + '\n')
+    os.replace(tmp, filepath)
+
+
+def read_segment(job, key, segment_dir=queue_dir):
+    with open(segment_file(job, key, segment_dir)) as f:
+        return [json.loads(line) for line in f]
+
+
+def keep_leased(queue, job, key, worker, stop):
+    '''Renews the lease every third of the visibility timeout until `stop` is set.'''
+    while not stop.wait(queue.visibility_timeout / 3):
+        if not queue.renew(job, key, worker):
+            print(f"{worker} lost its lease on {job} {key}")
+            return
+
+
+def work(job, queue_path=queue_file, segment_dir=queue_dir, poll=5):
+    '''
+    Leases and runs tasks until none are pending or leased by anyone else.
+    Returns the number of tasks this worker finished.
+    '''
+    import download_data
+    scrape = getattr(download_data, jobs[job][1])
+
+    worker = f'{socket.gethostname()}-{os.getpid()}'
+    queue = TaskQueue(queue_path)
+    done = 0
+    try:
+        while True:
+            key = queue.lease(job, worker)
+            if key is None:
+                counts = queue.counts(job)
+                if not counts.get('pending') and not counts.get('leased'):
+                    break
+                # someone else holds the rest, wait in case their lease runs out
+                time.sleep(poll)
+                continue
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=keep_leased, args=(queue, job, key, worker, stop), daemon=True)
+            heartbeat.start()
+            try:
+                with span('task', source=job) as s:
+                    rows = scrape(key)
+                    write_segment(job, key, rows, segment_dir)
+                    s['rows'] = len(rows)
+                if queue.complete(job, key, worker):
+                    count('tasks_done', 1, source=job)
+                    done += 1
+                else:
+                    print(f"{worker} finished {job} {key} after losing its lease, leaving it to the new holder")
+            except Exception as e:
+                print(f"{worker} failed {job} {key}: {e}")
+                queue.fail(job, key, worker, repr(e))
+                count('tasks_failed', 1, source=job)
+            finally:
+                stop.set()
+                heartbeat.join()
+    finally:
+        queue.close()
+        write_report(f'work_{job}_{worker}')
+
+    return done
+
+
+def work_in_processes(job, processes, queue_path=queue_file, segment_dir=queue_dir):
+    if processes == 1:
+        return work(job, queue_path, segment_dir)
+    with multiprocessing.Pool(processes) as pool:
+        return sum(pool.starmap(work, [(job, queue_path, segment_dir)] * processes))
+
+
+def reduce(job, queue_path=queue_file, segment_dir=queue_dir, partial=False):
+    '''Saves the rows of every finished task. Refuses while tasks remain, unless `partial`.'''
+    queue = TaskQueue(queue_path)
+    try:
+        counts = queue.counts(job)
+        unfinished = sum(v for k, v in counts.items() if k != 'done')
+        if unfinished and not partial:
+            raise RuntimeError(f"{job} still has unfinished tasks {counts}, pass --partial to reduce anyway")
+        keys = queue.keys(job, 'done')
+    finally:
+        queue.close()
+
+    rows = []
+    with span('reduce', source=job) as s:
+        for key in keys:
+            rows.extend(read_segment(job, key, segment_dir))
+        s['segments'] = len(keys)
+        s['rows'] = len(rows)
+
+    import download_data
+    getattr(download_data, jobs[job][2])(rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Distribute the usnpl and stationindex crawls over worker processes.')
+    parser.add_argument('--queue', default=queue_file, help='SQLite file holding the tasks')
+    parser.add_argument('--segments', default=queue_dir, help='directory the result segments are written to')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('enqueue', help='queue one task per state / market page')
+    p.add_argument('job', choices=list(jobs))
+    p.add_argument('--reset', action='store_true', help='forget earlier tasks for this job first')
+
+    p = sub.add_parser('work', help='lease and run tasks until the queue is drained')
+    p.add_argument('job', choices=list(jobs))
+    p.add_argument('--processes', type=int, default=1)
+
+    p = sub.add_parser('status', help='count tasks by status')
+    p.add_argument('job', choices=list(jobs))
+
+    p = sub.add_parser('reduce', help='assemble the segments into the source tsv')
+    p.add_argument('job', choices=list(jobs))
+    p.add_argument('--partial', action='store_true', help='reduce even if some tasks are unfinished')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'enqueue':
+        queue = TaskQueue(args.queue)
+        if args.reset:
+            queue.reset(args.job)
+        print(f"Queued {queue.enqueue(args.job, task_keys(args.job))} {args.job} tasks")
+        queue.close()
+    elif args.command == 'work':
+        print(f"Finished {work_in_processes(args.job, args.processes, args.queue, args.segments)} tasks")
+    elif args.command == 'status':
+        queue = TaskQueue(args.queue)
+        print(json.dumps(queue.counts(args.job)))
+        for key, attempts, error in queue.failures(args.job):
+            print(f"failed after {attempts} attempts: {key} {error}")
+        queue.close()
+    elif args.command == 'reduce':
+        print(f"Saved {reduce(args.job, args.queue, args.segments, args.partial)} {args.job} rows")
+
+
+if __name__ == "__main__":
+    main()